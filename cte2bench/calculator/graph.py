@@ -0,0 +1,170 @@
+"""
+Neighbour-graph reuse for finite-displacement supercells.
+
+Displaced FC2 supercells differ from the reference only by one atom moved by
+supercell.distance, so the candidate pairs are built once with cutoff + skin
+and each displaced copy only recomputes edge vectors and filters by the
+cutoff. The candidates stay complete while no atom has moved more than skin/2
+from the reference; beyond that, or on any cell / pbc / atom-count change, the
+reference is rebuilt.
+
+Only SevenNet is supported: its graph builder
+`sevenn.train.dataload._graph_build_f` is looked up at call time, so it is
+swapped for the cached one while the wrapped calculator evaluates. That name
+is private to sevenn (present from 0.10.2, checked up to 0.13.0), so the
+version and the builder are asserted when the wrapper is built, and the first
+`check` cached graphs are compared against sevenn's own builder.
+"""
+
+import contextlib
+
+import numpy as np
+from ase.calculators.calculator import Calculator, all_changes
+from ase.neighborlist import primitive_neighbor_list
+
+from cte2bench.util import log
+
+BUILDER = 'sevenn.train.dataload._graph_build_f'
+# sevenn versions whose builder returns (src, dst, vec, shift) from (cutoff, pbc, cell, pos)
+SEVENN_MIN, SEVENN_TESTED = '0.10.2', '0.13.0'
+
+
+def _version(version):
+    return tuple(int(''.join(c for c in part if c.isdigit()) or 0) for part in version.split('.')[:3])
+
+
+def sevenn_dataload():
+    """the sevenn module holding the graph builder that graph reuse swaps"""
+    import sevenn
+    import sevenn.train.dataload as dataload
+    version = getattr(sevenn, '__version__', '0')
+    assert _version(version) >= _version(SEVENN_MIN), \
+        f'graph reuse needs sevenn >= {SEVENN_MIN}, found {version} .. set calculator.graph_reuse.run: false'
+    assert callable(getattr(dataload, '_graph_build_f', None)), \
+        f'{BUILDER} not found in this sevenn version .. set calculator.graph_reuse.run: false'
+    return dataload
+
+
+def _trivial(src, dst, shift):
+    return (src == dst) & np.all(shift == 0, axis=1)
+
+
+def build_graph(cutoff, pbc, cell, pos):
+    """full rebuild, same edges as sevenn's builders"""
+    src, dst, shift = primitive_neighbor_list('ijS', pbc, cell, pos, cutoff, self_interaction=True)
+    keep = ~_trivial(src, dst, shift)
+    src, dst, shift = src[keep].astype(np.int64), dst[keep].astype(np.int64), shift[keep]
+    vec = pos[dst] - pos[src] + shift @ cell
+    return src, dst, vec, shift
+
+
+class NeighborCache:
+    def __init__(self, skin=0.1):
+        self.skin = skin
+        self.ref = None
+        self.n_build = 0
+        self.n_reuse = 0
+
+    def _valid(self, cutoff, pbc, cell, pos):
+        if self.ref is None:
+            return False
+        ref_cutoff, ref_pbc, ref_cell, ref_pos = self.ref
+        if ref_cutoff != cutoff or ref_pos.shape != pos.shape:
+            return False
+        if not np.array_equal(ref_pbc, pbc) or not np.allclose(ref_cell, cell, rtol=0, atol=1e-10):
+            return False
+        return np.linalg.norm(pos - ref_pos, axis=1).max() <= self.skin / 2
+
+    def __call__(self, cutoff, pbc, cell, pos):
+        pbc, cell, pos = np.asarray(pbc, dtype=bool), np.asarray(cell, dtype=float), np.asarray(pos, dtype=float)
+        if not self._valid(cutoff, pbc, cell, pos):
+            src, dst, shift = primitive_neighbor_list('ijS', pbc, cell, pos, cutoff + self.skin, self_interaction=True)
+            keep = ~_trivial(src, dst, shift)
+            self.pairs = (src[keep].astype(np.int64), dst[keep].astype(np.int64), shift[keep], shift[keep] @ cell)
+            self.ref = (cutoff, pbc.copy(), cell.copy(), pos.copy())
+            self.n_build += 1
+        else:
+            self.n_reuse += 1
+
+        src, dst, shift, offset = self.pairs
+        vec = pos[dst] - pos[src] + offset
+        keep = np.einsum('ij,ij->i', vec, vec) < cutoff**2
+        return src[keep], dst[keep], vec[keep], shift[keep]
+
+
+def same_graph(graph, reference, atol=1e-8):
+    """edge sets equal up to ordering, with matching edge vectors"""
+    def _sorted(src, dst, vec, shift):
+        order = np.lexsort((shift[:, 2], shift[:, 1], shift[:, 0], dst, src))
+        return src[order], dst[order], vec[order], shift[order]
+
+    if len(graph[0]) != len(reference[0]):
+        return False
+    a, b = _sorted(*graph), _sorted(*reference)
+    return (np.array_equal(a[0], b[0]) and np.array_equal(a[1], b[1])
+            and np.array_equal(a[3], b[3]) and np.allclose(a[2], b[2], rtol=0, atol=atol))
+
+
+class GraphReuseCalculator(Calculator):
+    """
+    Wraps a SevenNet calculator; inside `graph_reuse(calc)` its graphs come
+    from a NeighborCache. The first `check` cached graphs are compared
+    against a full rebuild by sevenn's builder, and any mismatch turns reuse
+    off for good.
+    """
+    def __init__(self, calc, skin=0.1, check=3):
+        super().__init__()
+        sevenn_dataload()
+        import sevenn
+        if _version(sevenn.__version__) > _version(SEVENN_TESTED):
+            log.warning(f'graph reuse is tested up to sevenn {SEVENN_TESTED}, found {sevenn.__version__} .. '
+                        f'the first {check} cached graphs are checked against its builder')
+        self.calc = calc
+        self.implemented_properties = list(getattr(calc, 'implemented_properties', ['energy', 'forces', 'stress']))
+        self.cache = NeighborCache(skin=skin)
+        self.check = check
+        self.enabled = False
+        self.broken = False
+        self._rebuild = build_graph
+
+    def _build(self, cutoff, pbc, cell, pos):
+        graph = self.cache(cutoff, pbc, cell, pos)
+        if self.check > 0:
+            self.check -= 1
+            # sevenn's builders may write to the cell
+            reference = self._rebuild(cutoff, np.array(pbc), np.array(cell), np.array(pos))
+            if not same_graph(graph, reference):
+                log.warning('cached neighbour graph differs from a full rebuild .. graph reuse disabled')
+                self.broken = True
+                return reference
+        return graph
+
+    def calculate(self, atoms=None, properties=None, system_changes=all_changes):
+        super().calculate(atoms, properties, system_changes)
+        if not self.enabled or self.broken or not all(self.atoms.pbc):
+            self.calc.calculate(self.atoms, properties, system_changes)
+        else:
+            dataload = sevenn_dataload()
+            original = self._rebuild = dataload._graph_build_f
+            dataload._graph_build_f = self._build
+            try:
+                self.calc.calculate(self.atoms, properties, system_changes)
+            finally:
+                dataload._graph_build_f = original
+        self.results = dict(self.calc.results)
+
+
+@contextlib.contextmanager
+def graph_reuse(calc):
+    """
+    enable graph reuse on a GraphReuseCalculator; no-op for anything else.
+    The cache outlives the context, it is revalidated on every call.
+    """
+    if not isinstance(calc, GraphReuseCalculator):
+        yield
+        return
+    calc.enabled = True
+    try:
+        yield
+    finally:
+        calc.enabled = False
@@ -1,3 +1,4 @@
+from cte2bench.util import log
 
 def load_sevenn(config):
     from cte2bench.calculator.sevenn_calculator import return_calc
@@ -14,8 +15,18 @@ def load_pet(config):
     calc = return_calc(config)
     return calc
 
+def load_emt(config):
+    # CPU stand-in for workflow tests; no checkpoint needed
+    from ase.calculators.emt import EMT
+    print('INFO: EMT stand-in calculator')
+    return EMT()
+
 
 def load_calc(config):
+    if config['calculator'].get('pool', {}).get('workers', 0) > 1:
+        from cte2bench.calculator.pool import CalcPool
+        return CalcPool(config)
+
     calc_type = config['calculator']['calc'].lower()
     if calc_type in ['7net', 'sevenn', 'sevennet']:
         calc = load_sevenn(config)
@@ -26,4 +37,40 @@ def load_calc(config):
     elif calc_type == 'esen':
         calc = load_esen(config)
 
+    elif calc_type == 'emt':
+        calc = load_emt(config)
+
+    reuse = config['calculator'].get('graph_reuse', {})
+    if reuse.get('run'):
+        if calc_type in ['7net', 'sevenn', 'sevennet']:
+            from cte2bench.calculator.graph import GraphReuseCalculator
+            calc = GraphReuseCalculator(calc, skin=reuse.get('skin', 0.1), check=reuse.get('check', 3))
+        else:
+            log.warning(f'graph reuse is only implemented for SevenNet .. ignored for {calc_type}')
+
     return calc
+
+
+_PRE_CALC = {}
+
+def load_pre_calc(config):
+    """
+    Cheap calculator of multi-fidelity relaxations (calculator.pre), loaded
+    once per process on first use. Keys of calculator.pre override the
+    production calculator settings.
+    """
+    pre = config['calculator'].get('pre', {})
+    if not pre.get('run'):
+        return None
+    key = (pre.get('calc'), pre.get('model'), pre.get('modal'), pre.get('path'))
+    if key not in _PRE_CALC:
+        overrides = {k: v for k, v in pre.items() if k not in ['run', 'fmax', 'steps', 'opt_types', 'calc_args']}
+        calculator = dict(config['calculator'], **overrides)
+        calculator.update({'pool': {}, 'graph_reuse': {}, 'pre': {}})
+        calculator['calc_args'] = dict(config['calculator'].get('calc_args', {}), **pre.get('calc_args', {}))
+        if pre.get('modal'):
+            calculator['calc_args']['modal'] = pre['modal']
+        _PRE_CALC[key] = load_calc(dict(config, calculator=calculator))
+        log.info(f'pre-relaxer {calculator["calc"]} loaded')
+    return _PRE_CALC[key]
+
@@ -9,7 +9,7 @@ def return_calc(config):
             'model': f'{calc}-{modal}-{model}',
             'version': 'latest',
             'non_conservative': False,
-            'device': "cuda",
+            'device': conf.get('device', "cuda"),
             'calculate_uncertainty': False,
             'calculate_ensemble': False,
             }
@@ -0,0 +1,96 @@
+"""
+Pool of calculator replicas in separate processes, for CPU-only nodes where a
+single model does not scale past a few intra-op threads.
+
+Tasks are module-level functions called as func(calc, *args) with the
+worker's own calculator; results come back in submission order.
+"""
+
+import os
+import copy
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor
+
+from tqdm import tqdm
+
+_CALC = None
+
+
+def _init_worker(config, cpu_sets, threads, counter):
+    global _CALC
+    with counter.get_lock():
+        rank = counter.value
+        counter.value += 1
+
+    if cpu_sets:
+        os.sched_setaffinity(0, cpu_sets[rank % len(cpu_sets)])
+    # must be set before torch spins up its thread pools
+    for var in ['OMP_NUM_THREADS', 'MKL_NUM_THREADS']:
+        os.environ[var] = str(threads)
+    try:
+        import torch
+        torch.set_num_threads(threads)
+    except ImportError:
+        # CPU-only install, e.g. the EMT stand-in
+        pass
+
+    from cte2bench.util.log import set_level
+    set_level(config.get('logging', {}).get('level', 'info'))
+
+    from cte2bench.calculator.loader import load_calc
+    _CALC = load_calc(config)
+
+
+def _run(func, args):
+    return func(_CALC, *args)
+
+
+class CalcPool:
+    """
+    Parameters
+    ----------
+    config: dict
+        parsed config; reads config['calculator']['pool']
+        workers: number of calculator replicas
+        threads: intra-op threads per replica
+        affinity: pin each replica to its own block of `threads` cores
+    """
+    def __init__(self, config):
+        conf = config['calculator']['pool']
+        self.workers = conf['workers']
+        threads = conf.get('threads', 1)
+
+        cpu_sets = None
+        if conf.get('affinity', True) and hasattr(os, 'sched_getaffinity'):
+            cpus = sorted(os.sched_getaffinity(0))
+            cpu_sets = [set(cpus[i*threads:(i+1)*threads]) for i in range(self.workers)]
+            cpu_sets = [cpu_set for cpu_set in cpu_sets if cpu_set] or None
+
+        worker_config = copy.deepcopy(config)
+        worker_config['calculator']['pool']['workers'] = 0
+        worker_config['calculator']['device'] = 'cpu'
+
+        print(f'[Pool] {self.workers} calculator replicas x {threads} threads')
+        ctx = mp.get_context('spawn')
+        counter = ctx.Value('i', 0)
+        self._executor = ProcessPoolExecutor(max_workers=self.workers, mp_context=ctx,
+            initializer=_init_worker, initargs=(worker_config, cpu_sets, threads, counter))
+
+    def imap(self, func, tasks, desc=None):
+        """results in submission order; each waits for the tasks submitted before it"""
+        tasks = list(tasks)
+        results = self._executor.map(_run, [func] * len(tasks), tasks)
+        yield from tqdm(results, total=len(tasks), desc=desc, leave=False)
+
+    def map(self, func, tasks, desc=None):
+        return list(self.imap(func, tasks, desc=desc))
+
+    def close(self):
+        self._executor.shutdown()
+
+
+def map_calc(calc, func, tasks, desc=None):
+    """func(calc, *task) for every task, fanned out when calc is a CalcPool"""
+    if isinstance(calc, CalcPool):
+        return calc.map(func, tasks, desc=desc)
+    return [func(calc, *task) for task in tqdm(list(tasks), desc=desc, leave=False)]
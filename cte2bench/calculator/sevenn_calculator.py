@@ -32,6 +32,10 @@ def return_calc(config):
         'modal': modal,
         'enable_flash': True, #TODO;
     }
+    if conf.get('device'):
+        calc_kwargs['device'] = conf['device']
+        # flash kernels are GPU only
+        calc_kwargs['enable_flash'] = conf['device'] != 'cpu'
 
     # functional = FUNC_DCT.get(modal, None)
     print(f"[SevenNet] model={model}, modal={modal}")
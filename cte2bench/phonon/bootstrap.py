@@ -0,0 +1,125 @@
+"""
+Bootstrap uncertainty of the QHA thermal expansion.
+
+Every resample of the strain points is refitted at every temperature with the
+third-order Birch-Murnaghan form, which is a cubic polynomial in x = V^(-2/3):
+
+    F(V, T) = a(T) + b(T) x + c(T) x^2 + d(T) x^3
+
+so all (sample, temperature) fits are one batched weighted least-squares solve
+instead of hundreds of PhonopyQHA constructions.
+"""
+
+import numpy as np
+
+EV_TO_KJMOL = 96.48533212331002
+
+
+def sample_weights(n_points, n_samples, mode='resample', min_points=5, seed=None):
+    """
+    (n_samples, n_points) weights of the strain points in each refit.
+
+    resample: bootstrap with replacement (weights are multiplicities)
+    subsets: random subsets of at least `min_points` points
+    Samples with fewer than `min_points` distinct points are dropped.
+    """
+    rng = np.random.default_rng(seed)
+    if mode == 'subsets':
+        sizes = rng.integers(min_points, n_points + 1, size=n_samples)
+        order = np.argsort(rng.random((n_samples, n_points)), axis=1)
+        W = (np.argsort(order, axis=1) < sizes[:, None]).astype(float)
+    else:
+        idx = rng.integers(0, n_points, size=(n_samples, n_points))
+        W = np.zeros((n_samples, n_points))
+        np.add.at(W, (np.arange(n_samples)[:, None], idx), 1.0)
+    return W[(W > 0).sum(axis=1) >= min_points]
+
+
+def fit_equilibrium_volumes(volumes, free_energies, W):
+    """
+    Parameters
+    ----------
+    volumes: (n_v,)
+    free_energies: (n_T, n_v) total free energies in eV
+    W: (n_s, n_v) point weights
+
+    Returns
+    -------
+    np.ndarray, shape (n_s, n_T), equilibrium volumes; NaN where the minimum
+    falls outside the sampled volumes or the fit has no minimum
+    """
+    x = np.asarray(volumes, dtype=float) ** (-2/3)
+    mean, std = x.mean(), x.std()
+    t = (x - mean) / std
+    X = np.stack([np.ones_like(t), t, t**2, t**3], axis=1)            # (n_v, 4)
+
+    A = np.einsum('sv,vi,vj->sij', W, X, X)                           # (n_s, 4, 4)
+    rhs = np.einsum('sv,vi,tv->sit', W, X, free_energies)             # (n_s, 4, n_T)
+    beta = np.linalg.solve(A, rhs)                                     # (n_s, 4, n_T)
+    b, c, d = beta[:, 1], beta[:, 2], beta[:, 3]
+
+    # dF/dt = b + 2c t + 3d t^2 = 0, minimum where d2F/dt2 = 2c + 6d t > 0
+    disc = np.sqrt(np.clip((2*c)**2 - 12*d*b, 0, None))
+    with np.errstate(divide='ignore', invalid='ignore'):
+        roots = np.stack([(-2*c + disc) / (6*d), (-2*c - disc) / (6*d)])
+        roots = np.where(np.abs(d) < 1e-12, -b / (2*c), roots)
+    curvature = 2*c + 6*d*roots
+    valid = (curvature > 0) & np.isfinite(roots)
+
+    # per sample, only the volume range it actually contains
+    t_masked = np.where(W > 0, t, np.nan)
+    t_lo = np.nanmin(t_masked, axis=1)[None, :, None]
+    t_hi = np.nanmax(t_masked, axis=1)[None, :, None]
+    valid &= (roots >= t_lo) & (roots <= t_hi)
+
+    t0 = np.where(valid[0], roots[0], np.where(valid[1], roots[1], np.nan))
+    return (t0 * std + mean) ** (-3/2)
+
+
+def fit_residuals(volumes, free_energies):
+    """(n_T, n_v) residuals of the same cubic-in-V^(-2/3) fit over all points"""
+    x = np.asarray(volumes, dtype=float) ** (-2/3)
+    t = (x - x.mean()) / x.std()
+    X = np.stack([np.ones_like(t), t, t**2, t**3], axis=1)
+    beta, *_ = np.linalg.lstsq(X, np.asarray(free_energies, dtype=float).T, rcond=None)
+    return (free_energies.T - X @ beta).T
+
+
+def bootstrap_cte(volumes, electronic_energies, fe_phonon, temperatures, conf):
+    """
+    Parameters
+    ----------
+    volumes, electronic_energies: (n_v,) in A^3 and eV
+    fe_phonon: (n_T, n_v) phonon free energy in kJ/mol
+    temperatures: (n_T,) in K
+    conf: config['qha']['bootstrap']
+
+    Returns
+    -------
+    temperatures: (n_T,)
+    alpha: (n_s, n_T) thermal expansion of every valid sample
+    """
+    free_energies = np.asarray(fe_phonon, dtype=float) / EV_TO_KJMOL + np.asarray(electronic_energies, dtype=float)[None, :]
+    W = sample_weights(len(volumes), conf.get('n_samples', 500), mode=conf.get('mode', 'resample'),
+                       min_points=conf.get('min_points', 5), seed=conf.get('seed', None))
+    v0 = fit_equilibrium_volumes(volumes, free_energies, W)
+    alpha = np.gradient(np.log(v0), temperatures, axis=-1)
+    return np.asarray(temperatures, dtype=float), alpha
+
+
+def summarize_cte(temperatures, alpha, query, ci=0.95):
+    """median, std and the central `ci` interval of alpha at the query temperatures"""
+    from cte2bench.phonon.qha import interp_batched, _tkey
+
+    values = interp_batched(temperatures, alpha, query)                # (n_s, n_q)
+    ok = np.isfinite(values).all(axis=1)
+    values = values[ok]
+    out = {'ci': ci, 'n_samples': int(ok.sum())}
+    if not len(values):
+        return out
+
+    lo, med, hi = np.percentile(values, [50*(1-ci), 50, 50*(1+ci)], axis=0)
+    std = values.std(axis=0)
+    for key, arr in {'LOW': lo, 'MEDIAN': med, 'HIGH': hi, 'STD': std}.items():
+        out[key] = {_tkey(t): float(v) for t, v in zip(query, arr)}
+    return out
@@ -0,0 +1,139 @@
+"""
+Grüneisen screening: a CTE estimate from FC2 at three volumes (strains -delta,
+0, +delta) instead of the full strain grid.
+
+    alpha(T) = sum_qv gamma_qv C_qv(T) / (B V)
+
+with mode Grüneisen parameters from phonopy on the q-point mesh and B from the
+E(V) of the strain relaxations (the strain stage when it has run, otherwise
+the three screening points). Results go under 'CTE_GRUNEISEN' in the same
+CALC/V/B layout as the QHA 'CTE', marked APPROXIMATE, together with the wall
+time and the estimated saving over the full grid.
+"""
+
+import os, gc, time
+import numpy as np
+from tqdm import tqdm
+
+from phonopy import Phonopy
+from phonopy.api_gruneisen import PhonopyGruneisen
+from phonopy.qha.eos import fit_to_eos, get_eos
+
+from cte2bench.structure.strain import relax_strain
+from cte2bench.structure.supercell import fc2_strain, get_fc2_mode
+from cte2bench.structure.adaptive import _scaled
+from cte2bench.phonon.thermo import gruneisen_heat_capacity, temperature_grid
+from cte2bench.phonon.qha import cte_at, CTE_TEMPERATURES
+from cte2bench.util.utils import aseatoms2phonoatoms
+from cte2bench.util.io import loadAtoms, loadMeta, dumpJSON, clean_for_json
+from cte2bench.util.writer import get_writer
+from cte2bench.calculator.pool import map_calc
+from cte2bench.util.results import append_result, compact_results
+from cte2bench.util import log
+
+GRUNEISEN_KEY = 'CTE_GRUNEISEN'
+GPA = 160.21766208   # eV/A^3 -> GPa
+
+
+def bulk_modulus(config, suffix, volumes, energies):
+    """B0 [eV/A^3] from the strain-stage E(V) if available, else from the given points"""
+    calc_tag = config['calculator']['tag']
+    strain_file = f'{config["directory"]["cwd"]}/{suffix}/{config["strain"]["save"]}/{calc_tag}-strain_relax-{suffix}.extxyz'
+    if os.path.isfile(strain_file):
+        strain_opt = loadAtoms(strain_file)
+        if len(strain_opt) >= 4:
+            eos = {'birch': 'birch_murnaghan'}.get(config['qha']['eos'], config['qha']['eos'])
+            v = np.array([a.get_volume() for a in strain_opt])
+            e = np.array([a.info['e_fr_energy'] for a in strain_opt])
+            order = np.argsort(v)
+            try:
+                return float(fit_to_eos(v[order], e[order], get_eos(eos))[1]), 'strain'
+            except Exception as exc:
+                log.warning(f'{suffix} E(V) fit of the strain stage failed ({exc}) .. using screening points')
+    # three points: B = V d2E/dV2 at the middle one
+    c = np.polyfit(volumes, energies, 2)
+    return float(2 * c[0] * volumes[1]), 'screening'
+
+
+def gruneisen_material(config, calc, idx, atoms0):
+    conf = config['gruneisen']
+    base_dir = config['directory']['cwd']
+    _dct = atoms0.info
+    suffix = _dct['suffix']
+    start = time.time()
+
+    cwd = os.path.join(base_dir, suffix, conf.get('save', './gruneisen'))
+    os.makedirs(cwd, exist_ok=True)
+
+    phonon_kwargs = {'primitive_matrix': _dct.get('primitive_matrix', 'auto'),
+        'supercell_matrix': np.diag(_dct['fc3_supercell']),
+        'phonon_supercell_matrix': np.diag(_dct['fc2_supercell'])}
+    mode, fc_calculator = get_fc2_mode(config)
+    mesh = conf.get('mesh') or _dct.get('q_point_mesh', [19, 19, 19])
+    delta = conf.get('delta', 0.005)
+    eps_list = [0.0, delta, -delta]
+
+    relaxed = map_calc(calc, relax_strain, [(config, _scaled(atoms0, eps), eps, cwd) for eps in eps_list],
+                       desc=f'{suffix} screening strains')
+    phonons, volumes, energies = [], [], []
+    for eps, strained in zip(eps_list, relaxed):
+        fc2 = fc2_strain(config, calc, cwd, eps, strained, phonon_kwargs, suffix, mode, fc_calculator, load=True)
+        if fc2 is None:
+            log.warning(f'{suffix} Grüneisen screening skipped .. no FC2 at e{eps}')
+            return None
+        phonon = Phonopy(aseatoms2phonoatoms(strained), supercell_matrix=phonon_kwargs['phonon_supercell_matrix'],
+                         primitive_matrix=phonon_kwargs['primitive_matrix'])
+        phonon.force_constants = fc2
+        phonons.append(phonon)
+        volumes.append(strained.get_volume())
+        energies.append(strained.info['e_fr_energy'])
+
+    gruneisen = PhonopyGruneisen(*phonons)
+    gruneisen.set_mesh(mesh, is_gamma_center=True)
+    qpoints, weights, freqs, _, gammas = gruneisen.get_mesh()
+    # gamma of the acoustic modes at Gamma is 0/0: numerical noise that C_v ~ k_B would weight in full
+    gammas[np.all(np.abs(qpoints) < 1e-8, axis=1), :3] = 0.0
+    gruneisen.write_hdf5_mesh(filename=f'{cwd}/gruneisen_mesh.hdf5')
+
+    # B is intensive, unit-cell volumes and energies will do
+    order = [2, 0, 1]
+    volumes, energies = np.array(volumes)[order], np.array(energies)[order]
+    B, source = bulk_modulus(config, suffix, volumes, energies)
+    V = phonons[0].primitive.volume
+
+    temperatures = temperature_grid(config['harmonic']['t_min'], config['qha']['t_max'], config['harmonic']['t_step'])
+    alpha = gruneisen_heat_capacity(freqs, weights, gammas, temperatures) / (B * V)
+    # V(T) = V0 exp(int alpha dT)
+    integral = np.concatenate([[0.0], np.cumsum((alpha[1:] + alpha[:-1]) / 2 * np.diff(temperatures))])
+    arrays = {'temperatures': temperatures, 'alpha': alpha, 'volume': V * np.exp(integral),
+              'bulk_modulus': np.full(len(temperatures), B * GPA)}
+    np.savez(f'{cwd}/gruneisen_arrays.npz', **arrays)
+
+    wall = time.time() - start
+    n_full = len(config['qha']['eps'])
+    estimate = wall / len(eps_list) * n_full
+    record = cte_at(arrays, config['qha'].get('temperatures', CTE_TEMPERATURES))
+    record.update({'APPROXIMATE': True, 'METHOD': 'gruneisen', 'DELTA': delta, 'B_SOURCE': source,
+                   'WALL': wall, 'WALL_FULL_EST': estimate, 'SAVED': estimate - wall})
+    dumpJSON(clean_for_json(record), f'{cwd}/gruneisen.json')
+    log.info(f'{suffix} Grüneisen screening in {wall:.1f} s, ~{estimate - wall:.1f} s saved '
+             f'against {n_full} strains')
+
+    del phonons, gruneisen
+    gc.collect()
+    return {GRUNEISEN_KEY: record}
+
+
+def process_gruneisen(config, calc):
+    calc_tag = config['calculator']['tag']
+    base_dir = config['directory']['cwd']
+    unit_dct = loadMeta(f'{base_dir}/{calc_tag}-unitcell.pkl')
+    input_atoms = loadAtoms(f'{base_dir}/{calc_tag}-unitcell_relax.extxyz')
+
+    log.info(f'Grüneisen screening with MLIP {calc_tag}')
+    for idx, atoms0 in zip(unit_dct, tqdm(input_atoms, desc='Grüneisen screening')):
+        results = gruneisen_material(config, calc, idx, atoms0)
+        if results is not None:
+            append_result(config, idx, 'gruneisen', results)
+    get_writer().flush()
+    compact_results(config)
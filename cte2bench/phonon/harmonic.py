@@ -2,20 +2,28 @@ from __future__ import annotations
 
 from phonopy import Phonopy
 import phonopy.file_IO as ph_IO
+from phonopy.phonon.band_structure import get_band_qpoints_by_seekpath
 
 import os, gc, warnings, json
+import numpy as np
 from tqdm import tqdm
 import ase.io as ase_IO
 
-from cte2bench.util.io import loadPKL, dumpJSON, clean_for_json
-from cte2bench.util.utils import load_mesh_yaml, load_mesh_hdf5, imag_dos_frac, aseatoms2phonoatoms, check_imaginary_freqs
+from cte2bench.util.io import loadMeta, loadAtoms, dumpJSON, clean_for_json
+from cte2bench.util.utils import load_mesh_yaml, load_mesh_hdf5, imag_dos_frac, aseatoms2phonoatoms, check_imaginary_freqs, material_eps
+from cte2bench.util.writer import get_writer
+from cte2bench.util.memory import fit_budget, get_budget
+from cte2bench.util.plan import ordered_items
+from cte2bench.util.results import append_result, compact_results
+from cte2bench.phonon.thermo import thermal_properties, temperature_grid, compare_phonopy
+from cte2bench.util import log
 
-def process_harmonic(config):
+def harmonic_material(config, idx, _dct):
     warnings.filterwarnings("ignore", category=DeprecationWarning, module="seekpath.hpkot")
     calc_tag = config['calculator']['tag']
     base_dir = config['directory']['cwd']
- 
-    desc = 'Mesh properties'
+    writer = get_writer()
+
     mesh_args = {'is_time_reversal': True, 'is_mesh_symmetry': True,
                 'is_gamma_center': False, 'with_eigenvectors': True,
                 'with_group_velocities': True}
@@ -26,108 +34,157 @@ def process_harmonic(config):
                       't_max': config['harmonic']['t_max'],
                       't_step': config['harmonic']['t_step']}
    
-    distance = config['supercell']['distance']
-    unit_dct_file = f'{base_dir}/{calc_tag}-unitcell.pkl'
-    unit_dct = loadPKL(unit_dct_file)
-
-    RESULTS = {}
-    RESULTS['calc'] = calc_tag
-
-    for idx, _dct in tqdm(unit_dct.items(), desc=desc):
-        idx_dct = {}
-        suffix = _dct['suffix']
-        ID, mp, name, symm = suffix.split('_')
-        idx_dct['ID'] = ID
-        idx_dct['name'] = name
-        idx_dct['symm.no'] = symm
-        idx_dct['mp-id'] = mp
-
-        mesh_numbers = _dct.get('q_point_mesh', [19, 19, 19])
-
-        strain_dir = f'{base_dir}/{suffix}/{config["strain"]["save"]}'
-        strain_dct_file = f'{strain_dir}/{calc_tag}-strain_dct-{suffix}.pkl'
-        strain_dct = loadPKL(strain_dct_file)
-        strain_opt = ase_IO.read(f'{strain_dir}/{calc_tag}-strain_relax-{suffix}.extxyz', index=':')
-
-        phonon_kwargs = {'primitive_matrix': _dct.get('primitive_matrix', 'auto'),
-                'supercell_matrix': _dct['fc2_supercell'], 'symprec': 1e-05}
-
-        strain_dir = os.path.join(base_dir, suffix, config['strain']['save'])
-        supercell_dir = os.path.join(base_dir, suffix, config['supercell']['save'])
-        cwd = os.path.join(base_dir, suffix, config['harmonic']['save'])
-        os.makedirs(cwd, exist_ok = True)
-
-        idx_dct['harmonic'] = {}
-        for i, eps in enumerate(config['strain']['eps']):
-            idx_dct['harmonic'][f'e{eps}'] = {}
-            eps_dir = f'{cwd}/e{eps}'
-            os.makedirs(eps_dir, exist_ok=True)
-            h_dct = {'fc2': True, 'IMAGINARY': False, 'fraction': 0.0, 'QHA': True}
-
-            if config['harmonic']['cont']:
-                if os.path.isfile(f'{eps_dir}/mesh_e{eps}.hdf5'):
-                    freqs, weights = load_mesh_hdf5(f'{eps_dir}/mesh_e{eps}.hdf5')
-                    Im = check_imaginary_freqs(freqs)
-                    Fraction = imag_dos_frac(freqs, weights)
-                    QHA = (Fraction < 0.220)
-                
-                    h_dct['IMAGINARY'] = Im
-                    h_dct['QHA'] = QHA
-                    h_dct['fraction'] = Fraction
-                    idx_dct['harmonic'][f'e{eps}'].update(h_dct)
-                    continue
+    idx_dct = {}
+    suffix = _dct['suffix']
+    ID, mp, name, symm = suffix.split('_')
+    idx_dct['ID'] = ID
+    idx_dct['name'] = name
+    idx_dct['symm.no'] = symm
+    idx_dct['mp-id'] = mp
+
+    mesh_numbers = _dct.get('q_point_mesh', [19, 19, 19])
+
+    strain_dir = f'{base_dir}/{suffix}/{config["strain"]["save"]}'
+    strain_dct_file = f'{strain_dir}/{calc_tag}-strain_dct-{suffix}.pkl'
+    strain_dct = loadMeta(strain_dct_file)
+    strain_opt = loadAtoms(f'{strain_dir}/{calc_tag}-strain_relax-{suffix}.extxyz')
+
+    phonon_kwargs = {'primitive_matrix': _dct.get('primitive_matrix', 'auto'),
+            'supercell_matrix': _dct['fc2_supercell'], 'symprec': 1e-05}
+
+    if get_budget(config) and 'lean_mesh' not in _dct:
+        fit_budget(config, _dct, strain_opt[0])
+    if _dct.get('lean_mesh') or config['harmonic'].get('lean_mesh'):
+        mesh_args.update({'with_eigenvectors': False, 'with_group_velocities': False})
+
+    strain_dir = os.path.join(base_dir, suffix, config['strain']['save'])
+    supercell_dir = os.path.join(base_dir, suffix, config['supercell']['save'])
+    cwd = os.path.join(base_dir, suffix, config['harmonic']['save'])
+    os.makedirs(cwd, exist_ok = True)
+
+    # isotropic strain keeps the symmetry, so one seekpath call serves every eps
+    band_path = None
+
+    # numpy engine: thermal properties of every eps at once after the loop
+    numpy_thermo = config['harmonic']['run_thermal'] and config['harmonic'].get('thermo_engine', 'phonopy') == 'numpy'
+    thermo_mesh = {}
+    thermo_ref = None
+
+    idx_dct['harmonic'] = {}
+    for i, eps in enumerate(material_eps(config, _dct)):
+        idx_dct['harmonic'][f'e{eps}'] = {}
+        eps_dir = f'{cwd}/e{eps}'
+        os.makedirs(eps_dir, exist_ok=True)
+        h_dct = {'fc2': True, 'IMAGINARY': False, 'fraction': 0.0, 'QHA': True}
+
+        if config['harmonic']['cont']:
+            if os.path.isfile(f'{eps_dir}/mesh_e{eps}.hdf5'):
+                weights, freqs = load_mesh_hdf5(f'{eps_dir}/mesh_e{eps}.hdf5')
+                if numpy_thermo:
+                    thermo_mesh[f'e{eps}'] = (freqs, weights)
+                Im = check_imaginary_freqs(freqs)
+                Fraction = imag_dos_frac(freqs, weights)
+                QHA = (Fraction < 0.220)
             
-            strained = strain_opt[i]
-            unitcell = aseatoms2phonoatoms(strained)
-            phonon = Phonopy(unitcell=unitcell, **phonon_kwargs)
-            phonon.generate_displacements(distance=config['supercell']['distance'], is_plusminus=True,
-                    random_seed=config['supercell']['random_seed'])
-            fc2 = ph_IO.parse_FORCE_CONSTANTS(f'{supercell_dir}/FORCE_CONSTANTS_2ND_e{eps}')
-            phonon.force_constants = fc2
-
-            phonon.run_mesh(mesh_numbers, **mesh_args)
-            phonon.mesh.write_hdf5(filename=f'{eps_dir}/mesh_e{eps}.hdf5')
-            freqs = phonon.get_mesh_dict()['frequencies']
-            weights = phonon.get_mesh_dict()['weights']
-
-            Im = check_imaginary_freqs(freqs)
-            Fraction = imag_dos_frac(freqs,weights)
-            QHA = (Fraction < 0.220)
-
-            h_dct['IMAGINARY'] = Im
-            h_dct['QHA'] = QHA
-            h_dct['fraction'] = Fraction
+                h_dct['IMAGINARY'] = Im
+                h_dct['QHA'] = QHA
+                h_dct['fraction'] = Fraction
+                idx_dct['harmonic'][f'e{eps}'].update(h_dct)
+                continue
+        
+        # rejected by the FC2 gates
+        if not os.path.isfile(f'{supercell_dir}/FORCE_CONSTANTS_2ND_e{eps}'):
+            h_dct.update({'fc2': False, 'QHA': False, 'fraction': None})
             idx_dct['harmonic'][f'e{eps}'].update(h_dct)
-
-            phonon.save(f'{eps_dir}/phonopy_e{eps}.yaml', compression=True)
-
-            if config['harmonic']['run_thermal']:
-                if not os.path.isfile(f'{eps_dir}/thermal_properties_e{eps}.svg'):
-                    phonon.run_thermal_properties(**thermal_kwargs)
-                    phonon.write_yaml_thermal_properties(f'{eps_dir}/thermal_properties_e{eps}.yaml')
-                    thermal_plt = phonon.plot_thermal_properties()
-                    thermal_plt.savefig(f'{eps_dir}/thermal_properties_e{eps}.svg')
-                    thermal_plt.close()
-
-            if config['harmonic']['run_band']:
-                if not os.path.isfile(f'{eps_dir}/band_structure_e{eps}.svg'):
-                    phonon.auto_band_structure(write_yaml=True, filename=f'{eps_dir}/band_e{eps}.yaml')
-                    band_plt = phonon.plot_band_structure()
-                    band_plt.savefig(f'{eps_dir}/band_structure_e{eps}.svg')
-                    band_plt.close()
-
-            if config['harmonic']['run_dos']:
-                if not os.path.isfile(f'{eps_dir}/band_dos_e{eps}.svg'):
-                    phonon.auto_total_dos(write_dat=True, filename=f'{eps_dir}/total_dos_e{eps}.dat', mesh=mesh_numbers)
-                    band_dos_plt = phonon.plot_band_structure_and_dos()
-                    band_dos_plt.savefig(f'{eps_dir}/band_dos_e{eps}.svg')
-                    band_dos_plt.close()
-
-            del phonon, unitcell, strained, freqs, weights
-            gc.collect()
-
-        RESULTS[idx] = idx_dct
-        del strain_opt, strain_dct
+            continue
+
+        strained = strain_opt[i]
+        unitcell = aseatoms2phonoatoms(strained)
+        phonon = Phonopy(unitcell=unitcell, **phonon_kwargs)
+        phonon.generate_displacements(distance=config['supercell']['distance'], is_plusminus=True,
+                random_seed=config['supercell']['random_seed'])
+        fc2 = ph_IO.parse_FORCE_CONSTANTS(f'{supercell_dir}/FORCE_CONSTANTS_2ND_e{eps}')
+        phonon.force_constants = fc2
+
+        phonon.run_mesh(mesh_numbers, **mesh_args)
+        # phonon.mesh is not modified after this point
+        writer.submit(phonon.mesh.write_hdf5, filename=f'{eps_dir}/mesh_e{eps}.hdf5')
+        freqs = phonon.get_mesh_dict()['frequencies']
+        weights = phonon.get_mesh_dict()['weights']
+
+        Im = check_imaginary_freqs(freqs)
+        Fraction = imag_dos_frac(freqs,weights)
+        QHA = (Fraction < 0.220)
+
+        h_dct['IMAGINARY'] = Im
+        h_dct['QHA'] = QHA
+        h_dct['fraction'] = Fraction
+        idx_dct['harmonic'][f'e{eps}'].update(h_dct)
+
+        if numpy_thermo:
+            thermo_mesh[f'e{eps}'] = (freqs, weights)
+            if config['harmonic'].get('thermo_check') and thermo_ref is None:
+                phonon.run_thermal_properties(**thermal_kwargs)
+                thermo_ref = (f'e{eps}', phonon.get_thermal_properties_dict())
+        elif config['harmonic']['run_thermal']:
+            if not os.path.isfile(f'{eps_dir}/thermal_properties_e{eps}.svg'):
+                phonon.run_thermal_properties(**thermal_kwargs)
+                writer.submit(phonon.write_yaml_thermal_properties, f'{eps_dir}/thermal_properties_e{eps}.yaml')
+                thermal_plt = phonon.plot_thermal_properties()
+                thermal_plt.savefig(f'{eps_dir}/thermal_properties_e{eps}.svg')
+                thermal_plt.close()
+
+        if config['harmonic']['run_band']:
+            if not os.path.isfile(f'{eps_dir}/band_structure_e{eps}.svg'):
+                if band_path is None:
+                    band_path = get_band_qpoints_by_seekpath(phonon.primitive, 101)
+                bands, labels, path_connections = band_path
+                phonon.run_band_structure(bands, labels=labels, path_connections=path_connections)
+                phonon.write_yaml_band_structure(filename=f'{eps_dir}/band_e{eps}.yaml')
+                band_plt = phonon.plot_band_structure()
+                band_plt.savefig(f'{eps_dir}/band_structure_e{eps}.svg')
+                band_plt.close()
+
+        if config['harmonic']['run_dos']:
+            if not os.path.isfile(f'{eps_dir}/band_dos_e{eps}.svg'):
+                # DOS from the mesh already in memory
+                phonon.run_total_dos()
+                phonon.write_total_dos(filename=f'{eps_dir}/total_dos_e{eps}.dat')
+                band_dos_plt = phonon.plot_band_structure_and_dos()
+                band_dos_plt.savefig(f'{eps_dir}/band_dos_e{eps}.svg')
+                band_dos_plt.close()
+
+        writer.submit(phonon.save, f'{eps_dir}/phonopy_e{eps}.yaml', compression=True)
+        del phonon, unitcell, strained, freqs, weights
         gc.collect()
-    RESULTS = clean_for_json(RESULTS)
-    dumpJSON(RESULTS, f'{base_dir}/{calc_tag}_results.json')
+
+    if thermo_mesh:
+        keys = list(thermo_mesh)
+        temperatures = temperature_grid(**thermal_kwargs)
+        fe, entropy, cv = thermal_properties([thermo_mesh[k][0] for k in keys], [thermo_mesh[k][1] for k in keys],
+                                             temperatures, chunk=config['harmonic'].get('thermo_chunk', 4_000_000))
+        writer.submit(np.savez, f'{cwd}/thermal_properties.npz', temperatures=temperatures, eps=np.array(keys),
+                      free_energy=fe, entropy=entropy, heat_capacity=cv)
+        if thermo_ref is not None:
+            key, ref = thermo_ref
+            j = keys.index(key)
+            idx_dct['thermo_check'] = diff = compare_phonopy(ref, fe[:, j], entropy[:, j], cv[:, j])
+            if max(diff.values()) > 1e-6:
+                log.warning(f'{suffix} numpy thermal properties deviate from phonopy at {key}: {diff}')
+
+    del strain_opt, strain_dct
+    gc.collect()
+    return idx_dct
+
+def process_harmonic(config):
+    calc_tag = config['calculator']['tag']
+    base_dir = config['directory']['cwd']
+ 
+    desc = 'Mesh properties'
+    unit_dct_file = f'{base_dir}/{calc_tag}-unitcell.pkl'
+    unit_dct = loadMeta(unit_dct_file)
+
+    for idx, _dct in tqdm(ordered_items(config, unit_dct), desc=desc):
+        append_result(config, idx, 'harmonic', harmonic_material(config, idx, _dct))
+    get_writer().flush()
+    compact_results(config)
@@ -7,157 +7,274 @@ from contextlib import redirect_stdout, redirect_stderr
 import numpy as np
 import ase.io as ase_IO
 import matplotlib
-from cte2bench.util.io import loadPKL, loadJSON, dumpJSON, clean_for_json
-import pandas as pd
+from cte2bench.util.io import loadMeta, loadAtoms, loadJSON, dumpJSON, clean_for_json
+from cte2bench.util.results import append_result, load_results, compact_results
+from cte2bench.phonon.bootstrap import bootstrap_cte, summarize_cte
+from cte2bench.util import log
 
 #TODO: rcparams
 
-def process_qha(config):
+CTE_TEMPERATURES = [10, 300, 500, 800]
+QHA_KEYS = {'CALC': 'alpha', 'V': 'volume', 'B': 'bulk_modulus'}
+
+def extract_qha(qha, temperatures):
+    """
+    alpha(T) [1/K], V(T) [A^3] and B(T) [GPa] of a PhonopyQHA on the
+    temperature grid it was built with (PhonopyQHA does not expose it), cut
+    at its t_max
+    """
+    arrays = {'temperatures': temperatures, 'alpha': qha.thermal_expansion,
+              'volume': qha.volume_temperature, 'bulk_modulus': qha.bulk_modulus_temperature}
+    arrays = {k: np.asarray(v, dtype=float) for k, v in arrays.items()}
+    n = min(len(v) for v in arrays.values())
+    return {k: v[:n] for k, v in arrays.items()}
+
+def interp_batched(grid, values, temperatures):
+    """
+    Linear interpolation of many curves sharing one temperature grid.
+
+    Parameters
+    ----------
+    grid: (n_T,) ascending temperatures
+    values: (..., n_T) curves, NaN-padded where a curve is shorter
+    temperatures: (n_out,) query temperatures; NaN outside the grid
+
+    Returns
+    -------
+    np.ndarray, shape (..., n_out)
+    """
+    grid = np.asarray(grid, dtype=float)
+    values = np.asarray(values, dtype=float)
+    temperatures = np.asarray(temperatures, dtype=float)
+    i = np.clip(np.searchsorted(grid, temperatures) - 1, 0, len(grid) - 2)
+    w = (temperatures - grid[i]) / (grid[i+1] - grid[i])
+    out = values[..., i] * (1 - w) + values[..., i+1] * w
+    out[..., (temperatures < grid[0]) | (temperatures > grid[-1])] = np.nan
+    return out
+
+def _tkey(t):
+    return int(t) if float(t).is_integer() else float(t)
+
+def cte_at(arrays, temperatures):
+    """{'CALC': {T: alpha}, 'V': {T: V}, 'B': {T: B}} at arbitrary temperatures"""
+    out = {}
+    for key, name in QHA_KEYS.items():
+        values = interp_batched(arrays['temperatures'], arrays[name], temperatures)
+        out[key] = {_tkey(t): (None if np.isnan(v) else float(v)) for t, v in zip(temperatures, values)}
+    return out
+
+def aggregate_cte(config, unit_dct):
+    """
+    CTE table of all materials: stacks every material's QHA arrays on the
+    common temperature grid and interpolates them in one pass.
+    """
     calc_tag = config['calculator']['tag']
     base_dir = config['directory']['cwd']
-    distance = config['supercell']['distance']
- 
-    unit_dct_file = f'{base_dir}/{calc_tag}-unitcell.pkl'
-    unit_dct = loadPKL(unit_dct_file)
-    RESULTS = loadJSON(f'{base_dir}/{calc_tag}_results.json')
+    conf = config['qha']
+    temperatures = conf.get('temperatures', CTE_TEMPERATURES)
+
+    suffixes, loaded = [], []
+    for idx, _dct in unit_dct.items():
+        filename = f'{base_dir}/{_dct["suffix"]}/{conf["save"]}/{conf["data"]}/qha_arrays.npz'
+        if os.path.isfile(filename):
+            with np.load(filename) as arrays:
+                loaded.append({k: arrays[k] for k in arrays.files})
+            suffixes.append(_dct['suffix'])
+    if not loaded:
+        return None
+
+    grid = max((a['temperatures'] for a in loaded), key=len)
+    table = {}
+    for key, name in QHA_KEYS.items():
+        stacked = np.full((len(loaded), len(grid)), np.nan)
+        for i, a in enumerate(loaded):
+            stacked[i, :len(a[name])] = a[name]
+        table[key] = interp_batched(grid, stacked, temperatures)
 
-    # -------- preprocess --------- #
+    header = ['suffix'] + [f'{key}_{_tkey(t)}' for key in QHA_KEYS for t in temperatures]
+    with open(f'{base_dir}/{calc_tag}_cte.csv', 'w') as f:
+        f.write(','.join(header) + '\n')
+        for i, suffix in enumerate(suffixes):
+            row = [suffix] + [f'{table[key][i, j]:.6e}' for key in QHA_KEYS for j in range(len(temperatures))]
+            f.write(','.join(row) + '\n')
+    return suffixes, table
+
+def qha_material(config, idx, _dct, results):
+    calc_tag = config['calculator']['tag']
+    base_dir = config['directory']['cwd']
     conf = config['qha']
     thin_number = config['qha']['thin_number']
-    qha_eps_list = [f'e{eps}' for eps in conf['eps']]
-    desc = 'QHA'
+    # an adaptive grid was chosen for QHA as a whole
+    qha_eps_list = [f'e{eps}' for eps in _dct.get('strain.eps') or conf['eps']]
 
-    for idx, _dct in tqdm(unit_dct.items(), desc=desc):
-        results = RESULTS.get(str(idx), {str(idx): '??'})
+    suffix = _dct['suffix']
+    mesh_dir = f'{base_dir}/{suffix}/{config["harmonic"]["save"]}'
+    strain_dir = f'{base_dir}/{suffix}/{config["strain"]["save"]}'
+    strain_dct_file = f'{strain_dir}/{calc_tag}-strain_dct-{suffix}.pkl'
+    strain_dct = loadMeta(strain_dct_file)
+    strain_opt = loadAtoms(f'{strain_dir}/{calc_tag}-strain_relax-{suffix}.extxyz')
 
-        suffix = _dct['suffix']
-        mesh_dir = f'{base_dir}/{suffix}/{config["harmonic"]["save"]}'
-        strain_dir = f'{base_dir}/{suffix}/{config["strain"]["save"]}'
-        strain_dct_file = f'{strain_dir}/{calc_tag}-strain_dct-{suffix}.pkl'
-        strain_dct = loadPKL(strain_dct_file)
-        strain_opt = ase_IO.read(f'{strain_dir}/{calc_tag}-strain_relax-{suffix}.extxyz', index=':')
+    primitive_matrix = _dct.get('primitive_matrix', np.eye(3))
 
-        primitive_matrix = _dct.get('primitive_matrix', np.eye(3))
+    mesh_dct = results.get('harmonic', None)
+    if not mesh_dct:
+        log.warning(f'{suffix} - mesh calculation must be preceded')
+        return None
 
-        mesh_dct = results.get('harmonic', None)
-        if not mesh_dct:
-            print(f'WARNING: {suffix} - mesh calculation must be preceded')
-            continue
+    cwd = f'{base_dir}/{suffix}/{conf["save"]}'
+    cwd_plot = f'{cwd}/{conf["plot"]}'
+    cwd_data = f'{cwd}/{conf["data"]}'
+    cwd_full = f'{cwd}/{conf["full"]}'
 
-        cwd = f'{base_dir}/{suffix}/{conf["save"]}'
-        cwd_plot = f'{cwd}/{conf["plot"]}'
-        cwd_data = f'{cwd}/{conf["data"]}'
-        cwd_full = f'{cwd}/{conf["full"]}'
-
-        os.makedirs(cwd, exist_ok=True)
-        os.makedirs(cwd_plot, exist_ok=True)
-        os.makedirs(cwd_data, exist_ok=True)
-        os.makedirs(cwd_full, exist_ok=True)
-
-        eps_list = []
-        thermal_filenames= []
-        volumes = []
-        free_energies = []
-
-        for i, (key, m_dct) in enumerate(mesh_dct.items()):
-            if key not in qha_eps_list:
-                continue
-            thermal_props = f'{mesh_dir}/{key}/thermal_properties_{key}.yaml'
-            if not (m_dct.get('QHA') or os.path.isfile(thermal_props)):
-                continue
-            strained = strain_opt[i]
-            eps_list.append(key)
-            thermal_filenames.append(thermal_props)
-            volumes.append(strained.get_volume()* np.linalg.norm(np.linalg.det(primitive_matrix)))
-            free_energies.append(strained.info.get('e_fr_energy', strain_dct[key].get('e_fr_energy',0)) * np.linalg.norm(np.linalg.det(primitive_matrix)))
+    os.makedirs(cwd, exist_ok=True)
+    os.makedirs(cwd_plot, exist_ok=True)
+    os.makedirs(cwd_data, exist_ok=True)
+    os.makedirs(cwd_full, exist_ok=True)
 
-        temperatures, cv, entropy, fe_phonon, _, _ = read_thermal_properties_yaml(filenames=thermal_filenames)
-        temperatures = np.array(temperatures, dtype=float)
-        cv = np.array(cv, dtype=float)
-        entropy = np.array(entropy, dtype=float)
-        fe_phonon = np.array(fe_phonon, dtype=float)
-        volumes, free_energies = np.array(volumes, dtype=float), np.array(free_energies, dtype=float)
-
-        qha_kwargs = {'volumes': volumes, 'electronic_energies': free_energies,
-                      'temperatures': temperatures, 'free_energy': fe_phonon,
-                      'cv': cv, 'entropy': entropy, 'eos': conf['eos'], 't_max': conf['t_max'],
-                      'verbose': True}
-
-        if len(volumes) < 5:
-            print('At least 5 volume points needed for EOS fitting .. returning')
+    # thermal properties of the numpy engine, when harmonic wrote them
+    thermo = None
+    thermo_file = f'{mesh_dir}/thermal_properties.npz'
+    if config['harmonic'].get('thermo_engine', 'phonopy') == 'numpy' and os.path.isfile(thermo_file):
+        with np.load(thermo_file) as f:
+            thermo = {k: f[k] for k in f.files}
+        thermo_eps = [str(e) for e in thermo['eps']]
+
+    eps_list = []
+    thermal_filenames= []
+    volumes = []
+    free_energies = []
+    gated = []
+
+    for i, (key, m_dct) in enumerate(mesh_dct.items()):
+        if key not in qha_eps_list:
             continue
+        thermal_props = f'{mesh_dir}/{key}/thermal_properties_{key}.yaml'
+        if thermo is not None and key not in thermo_eps:
+            continue
+        if not (m_dct.get('QHA') or thermo is not None or os.path.isfile(thermal_props)):
+            continue
+        strained = strain_opt[i]
+        eps_list.append(key)
+        thermal_filenames.append(thermal_props)
+        gated.append(bool(m_dct.get('QHA')))
+        volumes.append(strained.get_volume()* np.linalg.norm(np.linalg.det(primitive_matrix)))
+        free_energies.append(strained.info.get('e_fr_energy', strain_dct[key].get('e_fr_energy',0)) * np.linalg.norm(np.linalg.det(primitive_matrix)))
+
+    if thermo is not None:
+        columns = [thermo_eps.index(key) for key in eps_list]
+        temperatures = thermo['temperatures']
+        cv, entropy, fe_phonon = (thermo[k][:, columns] for k in ['heat_capacity', 'entropy', 'free_energy'])
+    else:
+        temperatures, cv, entropy, fe_phonon, _, _ = read_thermal_properties_yaml(filenames=thermal_filenames)
+    temperatures = np.array(temperatures, dtype=float)
+    cv = np.array(cv, dtype=float)
+    entropy = np.array(entropy, dtype=float)
+    fe_phonon = np.array(fe_phonon, dtype=float)
+    volumes, free_energies = np.array(volumes, dtype=float), np.array(free_energies, dtype=float)
+
+    qha_kwargs = {'volumes': volumes, 'electronic_energies': free_energies,
+                  'temperatures': temperatures, 'free_energy': fe_phonon,
+                  'cv': cv, 'entropy': entropy, 'eos': conf['eos'], 't_max': conf['t_max'],
+                  'verbose': True}
 
-        with open(f'{cwd}/qha.x', 'w') as f, redirect_stdout(f), redirect_stderr(f):
-            qha = PhonopyQHA(**qha_kwargs)
+    if len(volumes) < 5:
+        print('At least 5 volume points needed for EOS fitting .. returning')
+        return None
+
+    with open(f'{cwd}/qha.x', 'w') as f, redirect_stdout(f), redirect_stderr(f):
+        qha = PhonopyQHA(**qha_kwargs)
    
-        # plot everything at once
-        print('plotting qha results')
-        os.chdir(cwd_plot)
-        qha.plot_qha(thin_number=thin_number).savefig(f'{cwd}/qha_plot.svg')
-        qha.plot_qha(thin_number=thin_number).savefig(f'{cwd}/qha_plot.pdf')
-        matplotlib.pyplot.close()
-
-        qha.plot_helmholtz_volume(thin_number=thin_number).savefig('helmholtz_volume.svg')
-        qha.plot_volume_temperature().savefig('volume_temperature.svg')
-        qha.plot_thermal_expansion().savefig('thermal_expansion.svg')
-        matplotlib.pyplot.close()
-
-        qha.plot_gibbs_temperature().savefig('gibbs_temperature.svg')
-        qha.plot_bulk_modulus_temperature().savefig('bulk_modulus.svg')
-        matplotlib.pyplot.close()
-
-        try:
-            qha.plot_heat_capacity_P_polyfit().savefig('heat_capacity_P_poly.svg')
-            qha.plot_heat_capacity_P_numerical().savefig('heat_capacity_P_numer.svg')
-
-        except Exception as exc:
-            print(exc)
-
-        qha.plot_gruneisen_temperature().savefig('gruneisen_temperature.svg')
-        matplotlib.pyplot.close()
-
-        # save dat files at once
-        print('writting down qha data')
-        os.chdir(cwd_data)
-        qha.write_helmholtz_volume()
-        qha.write_helmholtz_volume_fitted(thin_number=thin_number)
-        qha.write_volume_temperature()
-        qha.write_thermal_expansion()
-        qha.write_gibbs_temperature()
-        qha.write_bulk_modulus_temperature()
-
-        try:
-            qha.write_heat_capacity_P_numerical()
-            qha.write_heat_capacity_P_polyfit()
-        except Exception as exc:
-            print(exc)
-
-        qha.write_gruneisen_temperature()
-
-        results['CTE'] = {'CALC': {10: None, 300: None, 500: None, 800: None}}
-        df = pd.read_csv(f'{cwd_data}/thermal_expansion.dat',
-                              names=['temp', 'cte'], header=None,
-                              comment='#', sep=r'\s+')
-        results['CTE'] = {'CALC': {
-                                    10: df.loc[df['temp']==10, 'cte'].to_numpy(),
-                                    300: df.loc[df['temp']==300, 'cte'].to_numpy(),
-                                    500: df.loc[df['temp']==500, 'cte'].to_numpy(),
-                                    800: df.loc[df['temp']==800, 'cte'].to_numpy(),
-                                    }
-                          }
-        RESULTS[str(idx)].update(clean_for_json(results))
-        dumpJSON(RESULTS[str(idx)], f'{base_dir}/{suffix}/{calc_tag}_results.json')
-
-        # thin_numbers were set for readability, plot entire data
-        os.chdir(cwd_full)
-        qha.write_helmholtz_volume_fitted(thin_number=config['harmonic']['t_step'])
-        qha.plot_pdf_helmholtz_volume(thin_number=config['harmonic']['t_step'])
-
-        os.chdir(cwd)
-        # plot eos
-        qha._bulk_modulus.plot().savefig(f'{cwd}/{conf["eos"]}.svg')
-
-        matplotlib.pyplot.close()
-        del qha
-        gc.collect()
-    dumpJSON(clean_for_json(RESULTS), f'{base_dir}/{calc_tag}_results.json')
+    # plot everything at once
+    print('plotting qha results')
+    os.chdir(cwd_plot)
+    qha.plot_qha(thin_number=thin_number).savefig(f'{cwd}/qha_plot.svg')
+    qha.plot_qha(thin_number=thin_number).savefig(f'{cwd}/qha_plot.pdf')
+    matplotlib.pyplot.close()
+
+    qha.plot_helmholtz_volume(thin_number=thin_number).savefig('helmholtz_volume.svg')
+    qha.plot_volume_temperature().savefig('volume_temperature.svg')
+    qha.plot_thermal_expansion().savefig('thermal_expansion.svg')
+    matplotlib.pyplot.close()
+
+    qha.plot_gibbs_temperature().savefig('gibbs_temperature.svg')
+    qha.plot_bulk_modulus_temperature().savefig('bulk_modulus.svg')
+    matplotlib.pyplot.close()
+
+    try:
+        qha.plot_heat_capacity_P_polyfit().savefig('heat_capacity_P_poly.svg')
+        qha.plot_heat_capacity_P_numerical().savefig('heat_capacity_P_numer.svg')
+
+    except Exception as exc:
+        print(exc)
+
+    qha.plot_gruneisen_temperature().savefig('gruneisen_temperature.svg')
+    matplotlib.pyplot.close()
+
+    # save dat files at once
+    print('writting down qha data')
+    os.chdir(cwd_data)
+    qha.write_helmholtz_volume()
+    qha.write_helmholtz_volume_fitted(thin_number=thin_number)
+    qha.write_volume_temperature()
+    qha.write_thermal_expansion()
+    qha.write_gibbs_temperature()
+    qha.write_bulk_modulus_temperature()
+
+    try:
+        qha.write_heat_capacity_P_numerical()
+        qha.write_heat_capacity_P_polyfit()
+    except Exception as exc:
+        print(exc)
+
+    qha.write_gruneisen_temperature()
+
+    arrays = extract_qha(qha, temperatures)
+    np.savez(f'{cwd_data}/qha_arrays.npz', **arrays)
+    results['CTE'] = cte_at(arrays, conf.get('temperatures', CTE_TEMPERATURES))
+
+    boot = conf.get('bootstrap', {})
+    if boot.get('run'):
+        # only points passing the imaginary-fraction gate, up to t_max
+        mask = np.array(gated)
+        t_mask = temperatures <= conf['t_max']
+        if mask.sum() < boot.get('min_points', 5):
+            log.warning(f'{suffix} - too few gated strain points for bootstrap ({mask.sum()})')
+        else:
+            t_boot, alpha = bootstrap_cte(volumes[mask], free_energies[mask], fe_phonon[t_mask][:, mask],
+                                          temperatures[t_mask], boot)
+            np.save(f'{cwd_data}/bootstrap_alpha.npy', alpha)
+            results['CTE']['BOOTSTRAP'] = summarize_cte(t_boot, alpha, conf.get('temperatures', CTE_TEMPERATURES),
+                                                        ci=boot.get('ci', 0.95))
+    results = clean_for_json(results)
+    dumpJSON(results, f'{base_dir}/{suffix}/{calc_tag}_results.json')
+
+    # thin_numbers were set for readability, plot entire data
+    os.chdir(cwd_full)
+    qha.write_helmholtz_volume_fitted(thin_number=config['harmonic']['t_step'])
+    qha.plot_pdf_helmholtz_volume(thin_number=config['harmonic']['t_step'])
+
+    os.chdir(cwd)
+    # plot eos
+    qha._bulk_modulus.plot().savefig(f'{cwd}/{conf["eos"]}.svg')
+
+    matplotlib.pyplot.close()
+    del qha
+    gc.collect()
+    return results
+
+def process_qha(config):
+    calc_tag = config['calculator']['tag']
+    base_dir = config['directory']['cwd']
+ 
+    unit_dct_file = f'{base_dir}/{calc_tag}-unitcell.pkl'
+    unit_dct = loadMeta(unit_dct_file)
+    RESULTS = load_results(config)
+
+    desc = 'QHA'
+    for idx, _dct in tqdm(unit_dct.items(), desc=desc):
+        results = RESULTS.get(str(idx), {str(idx): '??'})
+        results = qha_material(config, idx, _dct, results)
+        if results is not None:
+            append_result(config, idx, 'qha', results)
+    compact_results(config)
+    aggregate_cte(config, unit_dct)
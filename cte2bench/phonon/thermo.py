@@ -0,0 +1,119 @@
+"""
+Harmonic thermodynamics of all strains of a material in one pass.
+
+Same definitions as phonopy's ThermalProperties (default cutoff_frequency,
+modes with f <= 0 excluded, zero-point energy included), evaluated on the
+temperature x volume x mode grid at once instead of one phonopy run per eps.
+
+    F  [kJ/mol]  = sum_w [kT ln(1 - exp(-x)) + f/2] / sum(w)
+    S  [J/K/mol] = sum_w k [x exp(-x) / (1 - exp(-x)) - ln(1 - exp(-x))] / sum(w)
+    Cv [J/K/mol] = sum_w k x^2 exp(-x) / (1 - exp(-x))^2 / sum(w),   x = f / kT
+"""
+
+import numpy as np
+
+
+def _units():
+    try:
+        from phonopy.physical_units import get_physical_units
+        units = get_physical_units()
+        return units.THzToEv, units.KB, units.EvTokJmol
+    except ImportError:
+        from phonopy.units import THzToEv, Kb, EvTokJmol
+        return THzToEv, Kb, EvTokJmol
+
+
+def temperature_grid(t_min, t_max, t_step):
+    """phonopy's temperature range"""
+    return np.arange(max(t_min, 0), t_max + t_step / 2.0, t_step, dtype=float)
+
+
+def _stack(freqs_list, weights_list):
+    """pad meshes of different size; padded modes get zero weight"""
+    n_v = len(freqs_list)
+    n_mode = max(np.asarray(f).size for f in freqs_list)
+    freqs = np.zeros((n_v, n_mode))
+    weights = np.zeros((n_v, n_mode))
+    norm = np.zeros(n_v)
+    for i, (f, w) in enumerate(zip(freqs_list, weights_list)):
+        f = np.asarray(f, dtype=float)
+        w = np.asarray(w, dtype=float)
+        freqs[i, :f.size] = f.ravel()
+        weights[i, :f.size] = np.repeat(w, f.shape[1])
+        norm[i] = w.sum()
+    return freqs, weights, norm
+
+
+def thermal_properties(freqs_list, weights_list, temperatures, chunk=4_000_000):
+    """
+    Parameters
+    ----------
+    freqs_list: n_v arrays (n_q, n_bands) of mesh frequencies in THz
+    weights_list: n_v arrays (n_q,) of q-point weights
+    temperatures: (n_T,) in K
+    chunk: max elements of one (T, V, mode) block
+
+    Returns
+    -------
+    free_energy: (n_T, n_v) in kJ/mol
+    entropy, heat_capacity: (n_T, n_v) in J/K/mol
+    """
+    THzToEv, KB, EvTokJmol = _units()
+    temperatures = np.asarray(temperatures, dtype=float)
+    freqs, weights, norm = _stack(freqs_list, weights_list)
+    freqs = freqs * THzToEv
+    weights = np.where(freqs > 0, weights, 0.0)
+    # excluded modes only need a harmless value, their weight is zero
+    freqs = np.where(weights > 0, freqs, 1.0)
+
+    n_T, n_v = len(temperatures), len(freqs)
+    fe = np.zeros((n_T, n_v))
+    entropy = np.zeros((n_T, n_v))
+    cv = np.zeros((n_T, n_v))
+
+    zpe = np.einsum('vm,vm->v', freqs / 2, weights)
+    fe[temperatures <= 0] = zpe
+
+    pos = np.flatnonzero(temperatures > 0)
+    block = max(1, chunk // max(1, freqs.size))
+    for lo in range(0, len(pos), block):
+        idx = pos[lo:lo+block]
+        kT = KB * temperatures[idx][:, None, None]
+        x = freqs[None] / kT
+        em = np.exp(-x)
+        om = -np.expm1(-x)
+        log_om = np.log(om)
+        fe[idx] = np.einsum('tvm,vm->tv', kT * log_om, weights) + zpe
+        entropy[idx] = KB * np.einsum('tvm,vm->tv', x * em / om - log_om, weights)
+        cv[idx] = KB * np.einsum('tvm,vm->tv', x**2 * em / om**2, weights)
+
+    return fe / norm * EvTokJmol, entropy / norm * EvTokJmol * 1000, cv / norm * EvTokJmol * 1000
+
+
+def gruneisen_heat_capacity(freqs, weights, gammas, temperatures):
+    """
+    sum_qv w gamma C_v / sum(w) in eV/K per cell, so that alpha = this / (B V)
+
+    freqs, gammas: (n_q, n_bands), THz and dimensionless
+    weights: (n_q,)
+    """
+    THzToEv, KB, _ = _units()
+    temperatures = np.asarray(temperatures, dtype=float)
+    freqs = np.asarray(freqs, dtype=float) * THzToEv
+    norm = np.sum(weights)
+    weights = np.repeat(np.asarray(weights, dtype=float)[:, None], freqs.shape[1], axis=1)
+    weights = np.where(freqs > 0, weights * gammas, 0.0)
+    freqs = np.where(weights != 0, freqs, 1.0)
+
+    out = np.zeros(len(temperatures))
+    pos = temperatures > 0
+    x = freqs[None] / (KB * temperatures[pos][:, None, None])
+    out[pos] = KB * np.einsum('tqm,qm->t', x**2 * np.exp(-x) / np.expm1(-x)**2, weights)
+    return out / norm
+
+
+def compare_phonopy(ref, fe, entropy, cv):
+    """largest deviation from phonopy's get_thermal_properties_dict() of the same mesh"""
+    return {'free_energy': float(np.abs(fe - ref['free_energy']).max()),
+            'entropy': float(np.abs(entropy - ref['entropy']).max()),
+            'heat_capacity': float(np.nanmax(np.abs(cv - ref['heat_capacity'])))}
@@ -4,44 +4,92 @@ import yaml
 
 from cte2bench.util.parser import parse_args, parse_config
 from cte2bench.util.io import dumpYAML
+from cte2bench.util.writer import init_writer
+from cte2bench.util.log import flush_stats
 
 import datetime
 warnings.filterwarnings("ignore", category=DeprecationWarning, module="seekpath.hpkot")
 def main(argv: list[str] | None=None) -> None:
     args = parse_args(argv)
 
+    if args.task.lower() in ['serve']:
+        from cte2bench.scripts.serve import serve
+        serve(args.socket)
+        return
+
+    if args.task.lower() in ['submit']:
+        from cte2bench.scripts.serve import submit
+        sys.exit(submit(args.socket, sys.argv[1:] if argv is None else argv))
+
+    run(argv)
+
+def run(argv: list[str] | None=None, get_calc=None) -> None:
+    """
+    One full invocation. `get_calc(config)` supplies the calculator; the
+    server passes its cache so the model is loaded only once.
+    """
+    args = parse_args(argv)
+
     # config.yaml file to read
     config_dir = args.config 
 
     with open(config_dir, 'r') as f:
         config = yaml.load(f, Loader=yaml.FullLoader)
-    config = parse_config(config)
+    config = parse_config(config, argv)
 
     now = datetime.datetime.now()
     timestamp = now.strftime("%Y-%m-%d_%H-%M-%S")
     dumpYAML(config, f'{config["directory"]["cwd"]}/{timestamp}_config.yaml')
 
+    if args.task.lower() in ['plan']:
+        from cte2bench.util.plan import process_plan
+        process_plan(config)
+        return
+
+    writer = init_writer(config)
+    calc = None
+    # set once the pipeline has run strain, supercell, harmonic and QHA
+    pipelined = False
+
     if any([config['unitcell']['run'], config['strain']['run'], config['supercell']['run']]):
         from cte2bench.calculator.loader import load_calc
-        calc = load_calc(config)
+        calc = (get_calc or load_calc)(config)
 
         if config['unitcell']['run']:
             from cte2bench.structure.unitcell import process_unitcell
             process_unitcell(config, calc)
 
-        if config['strain']['run']:
+        # the adaptive grid relaxes and computes FC2 point by point
+        adaptive = config['strain'].get('adaptive', {}).get('run')
+        if config.get('pipeline', {}).get('run'):
+            from cte2bench.util.pipeline import process_pipeline
+            process_pipeline(config, calc)
+            pipelined = True
+
+        elif config['strain']['run'] and adaptive:
+            from cte2bench.structure.adaptive import process_adaptive
+            process_adaptive(config, calc)
+
+        elif config['strain']['run']:
             from cte2bench.structure.strain import process_strain
             process_strain(config, calc)
 
-        if config['supercell']['run']:
+        if config['supercell']['run'] and not (adaptive or pipelined):
             from cte2bench.structure.supercell import process_supercell
             process_supercell(config, calc)
 
-    if config['harmonic']['run']:
+    # screening estimate, ahead of the full QHA
+    if config.get('gruneisen', {}).get('run') or args.task.lower() in ['gruneisen']:
+        from cte2bench.calculator.loader import load_calc
+        from cte2bench.phonon.gruneisen import process_gruneisen
+        calc = calc if calc is not None else (get_calc or load_calc)(config)
+        process_gruneisen(config, calc)
+
+    if config['harmonic']['run'] and not pipelined:
         from cte2bench.phonon.harmonic import process_harmonic
         process_harmonic(config)
 
-    if config['qha']['run']:
+    if config['qha']['run'] and not pipelined:
         from cte2bench.phonon.qha import process_qha
         process_qha(config)
 
@@ -49,5 +97,19 @@ def main(argv: list[str] | None=None) -> None:
         from cte2bench.phonon.qha import process_qha
         process_qha(config)
 
+    if config.get('anisotropic', {}).get('run'):
+        from cte2bench.calculator.loader import load_calc
+        from cte2bench.structure.anisotropic import process_anisotropic
+        calc = calc if calc is not None else (get_calc or load_calc)(config)
+        process_anisotropic(config, calc)
+
+    if config.get('fc3', {}).get('run'):
+        from cte2bench.calculator.loader import load_calc
+        from cte2bench.structure.fc3 import process_fc3
+        process_fc3(config, calc if calc is not None else (get_calc or load_calc)(config))
+
+    flush_stats()
+    writer.close()
+
 if __name__ == '__main__':
     main()
@@ -0,0 +1,150 @@
+"""
+Persistent local server: keeps calculators loaded between runs so repeated
+small reruns skip interpreter start-up, the torch import and the checkpoint
+load.
+
+    cte2bench --task serve                       # start the server
+    cte2bench --task submit --config config.yaml # run through it
+
+Requests are handled one at a time; output is streamed back to the client.
+"""
+
+import io
+import os
+import sys
+import json
+import socket
+import socketserver
+import traceback
+from contextlib import redirect_stdout, redirect_stderr
+
+EXIT = '\x00EXIT '
+
+CALCS = {}
+
+
+# everything load_calc builds the calculator from; calculator.pre has its own cache
+CALC_KEYS = ['calc', 'model', 'modal', 'path', 'tag', 'd3', 'batch', 'avg_atom_num', 'calc_args', 'pool', 'graph_reuse']
+
+
+def calc_key(config):
+    conf = config['calculator']
+    return json.dumps({k: conf.get(k) for k in CALC_KEYS}, sort_keys=True, default=str)
+
+
+def get_calc(config):
+    """calculator cache keyed by the calculator settings"""
+    from cte2bench.calculator.loader import load_calc
+    conf = config['calculator']
+    key = calc_key(config)
+    if key not in CALCS:
+        CALCS[key] = load_calc(config)
+    else:
+        print(f'INFO: reusing loaded calculator {conf["tag"]}')
+    return CALCS[key]
+
+
+class _SocketStream(io.TextIOBase):
+    def __init__(self, wfile):
+        self.wfile = wfile
+
+    def write(self, text):
+        self.wfile.write(text.encode())
+        self.wfile.flush()
+        return len(text)
+
+    def isatty(self):
+        return False
+
+
+class RunHandler(socketserver.StreamRequestHandler):
+    def handle(self):
+        from cte2bench.scripts.main import run
+        from cte2bench.util.writer import close_writer, WriteError
+
+        request = json.loads(self.rfile.readline())
+        stream = _SocketStream(self.wfile)
+        status = 0
+        with redirect_stdout(stream), redirect_stderr(stream):
+            try:
+                os.chdir(request['cwd'])
+                run(request['argv'], get_calc=get_calc)
+            except SystemExit as exc:
+                status = exc.code if isinstance(exc.code, int) else 1
+            except Exception:
+                traceback.print_exc()
+                status = 1
+            finally:
+                # pending writes and their errors belong to this request, not the next client's
+                try:
+                    close_writer()
+                except WriteError:
+                    traceback.print_exc()
+                    status = status or 1
+        self.wfile.write(f'{EXIT}{json.dumps({"status": status})}\n'.encode())
+
+
+def serve(socket_path):
+    if os.path.exists(socket_path):
+        os.remove(socket_path)
+    print(f'INFO: serving on {socket_path}')
+    with socketserver.UnixStreamServer(socket_path, RunHandler) as server:
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
+        finally:
+            os.remove(socket_path)
+
+
+def _strip_task(argv):
+    """drop '--task submit' so the server runs the default task"""
+    out, skip = [], False
+    for i, arg in enumerate(argv):
+        if skip:
+            skip = False
+            continue
+        if arg == '--task':
+            skip = True
+            continue
+        if arg.startswith('--task='):
+            continue
+        out.append(arg)
+    return out
+
+
+def _absolute_config(argv):
+    out = list(argv)
+    for i, arg in enumerate(out):
+        if arg == '--config' and i + 1 < len(out):
+            out[i+1] = os.path.abspath(out[i+1])
+        elif arg.startswith('--config='):
+            out[i] = f'--config={os.path.abspath(arg.split("=", 1)[1])}'
+    return out
+
+
+def submit(socket_path, argv):
+    """send a run to the server and stream its output; returns the exit status"""
+    request = {'argv': _absolute_config(_strip_task(argv)), 'cwd': os.getcwd()}
+    with socket.socket(socket.AF_UNIX, socket.SOCK_STREAM) as sock:
+        sock.connect(socket_path)
+        sock.sendall((json.dumps(request) + '\n').encode())
+
+        buffer = ''
+        while True:
+            chunk = sock.recv(4096)
+            if not chunk:
+                break
+            buffer += chunk.decode(errors='replace')
+            if EXIT in buffer:
+                head, tail = buffer.split(EXIT, 1)
+                sys.stdout.write(head)
+                if tail.endswith('\n'):
+                    return json.loads(tail)['status']
+                buffer = EXIT + tail
+                continue
+            sys.stdout.write(buffer)
+            sys.stdout.flush()
+            buffer = ''
+    print('ERROR: server closed the connection')
+    return 1
@@ -0,0 +1,199 @@
+"""
+Adaptive strain grid: instead of relaxing and computing FC2 at every
+strain.eps point, start from strain.adaptive.initial and add points only where
+they are needed:
+
+    rejected : fewer than min_points pass the imaginary-mode gate
+               -> bisect the widest gap between accepted points
+    expansion: V0(T) leaves the sampled volumes or is within half a spacing of the
+               edge at qha.t_max -> extend the grid on that side
+    residual : the F(V) fit misses a point by more than residual_tol
+               -> bisect next to that point
+
+The grid stops growing once the CTE at qha.temperatures changes by less than
+tol between iterations, or at max_points. The chosen grid is stored as
+'strain.eps' in the unit-cell pickle and read by the later stages.
+"""
+
+import os, gc
+import numpy as np
+from tqdm import tqdm
+
+from cte2bench.structure.strain import relax_strain, enumerate_strained
+from cte2bench.structure.supercell import fc2_strain, get_fc2_mode
+from cte2bench.phonon.thermo import thermal_properties, temperature_grid
+from cte2bench.phonon.bootstrap import fit_equilibrium_volumes, fit_residuals, EV_TO_KJMOL
+from cte2bench.phonon.qha import interp_batched, CTE_TEMPERATURES
+from cte2bench.util.utils import aseatoms2phonoatoms, get_mesh_frequencies, imag_dos_frac
+from cte2bench.util.io import loadAtoms, loadMeta, dumpMeta, dumpJSON, clean_for_json
+from cte2bench.util.writer import get_writer
+from cte2bench.calculator.pool import map_calc
+from cte2bench.util import log
+
+
+def _round(eps):
+    return round(float(eps), 6)
+
+
+def _scaled(atoms0, eps):
+    strained = atoms0.copy()
+    strained.set_cell(atoms0.get_cell() * (1 + eps), scale_atoms=True)
+    strained.info = atoms0.info.copy()
+    return strained
+
+
+def evaluate_point(config, calc, atoms0, eps, strained, cwd_fc2, phonon_kwargs, mesh, mode, fc_calculator):
+    """FC2 and mesh of one relaxed strain; None if the FC2 failed"""
+    suffix = atoms0.info['suffix']
+    fc2 = fc2_strain(config, calc, cwd_fc2, eps, strained, phonon_kwargs, suffix, mode, fc_calculator, load=True)
+    if fc2 is None:
+        return None
+    freqs, weights = get_mesh_frequencies(aseatoms2phonoatoms(strained), fc2, phonon_kwargs['phonon_supercell_matrix'],
+                                          primitive_matrix=phonon_kwargs['primitive_matrix'], mesh=mesh)
+    scale = np.linalg.norm(np.linalg.det(atoms0.info.get('primitive_matrix', np.eye(3))))
+    fraction = imag_dos_frac(freqs, weights)
+    return {'atoms': strained, 'volume': strained.get_volume() * scale,
+            'energy': strained.info['e_fr_energy'] * scale,
+            'freqs': freqs, 'weights': weights, 'fraction': fraction, 'accepted': bool(fraction < 0.220)}
+
+
+def fit_grid(points, temperatures, query):
+    """
+    QHA of the accepted points.
+    Returns CTE at the query temperatures, V0(T) and the per-point max residual.
+    """
+    keys = sorted(eps for eps, p in points.items() if p['accepted'])
+    volumes = np.array([points[eps]['volume'] for eps in keys])
+    energies = np.array([points[eps]['energy'] for eps in keys])
+    fe, _, _ = thermal_properties([points[eps]['freqs'] for eps in keys],
+                                  [points[eps]['weights'] for eps in keys], temperatures)
+    free_energies = fe / EV_TO_KJMOL + energies[None, :]
+    v0 = fit_equilibrium_volumes(volumes, free_energies, np.ones((1, len(keys))))[0]
+    alpha = np.gradient(np.log(v0), temperatures)
+    residual = np.abs(fit_residuals(volumes, free_energies)).max(axis=0)
+    return interp_batched(temperatures, alpha, query), v0, dict(zip(keys, residual)), volumes
+
+
+def propose(points, v0, residual, volumes, conf):
+    """next strains to evaluate, with the reason for each"""
+    step = conf.get('step', 0.01)
+    lo, hi = conf.get('bounds', [-0.05, 0.08])
+    accepted = sorted(eps for eps, p in points.items() if p['accepted'])
+    evaluated = set(points)
+    proposals = []
+
+    def _add(eps, reason):
+        eps = _round(eps)
+        if lo <= eps <= hi and eps not in evaluated and eps not in [p[0] for p in proposals]:
+            proposals.append((eps, reason))
+
+    if len(accepted) < conf.get('min_points', 5):
+        gaps = sorted(zip(np.diff(accepted), accepted[:-1]), reverse=True) if len(accepted) > 1 else []
+        for width, left in gaps:
+            if width > step / 2:
+                _add(left + width / 2, 'rejected')
+                break
+        _add(max(points) + step, 'rejected')
+        _add(min(points) - step, 'rejected')
+        return proposals[:conf.get('add_per_iter', 2)]
+
+    vmin, vmax = volumes.min(), volumes.max()
+    margin = (vmax - vmin) / max(len(volumes) - 1, 1)
+    if not np.isfinite(v0[-1]) or v0[-1] > vmax - margin / 2:
+        _add(max(accepted) + step, 'expansion')
+    if not np.isfinite(v0[0]) or v0[0] < vmin + margin / 2:
+        _add(min(accepted) - step, 'expansion')
+
+    worst = max(residual, key=residual.get)
+    if residual[worst] > conf.get('residual_tol', 1e-3):
+        i = accepted.index(worst)
+        neighbours = [accepted[j] for j in (i - 1, i + 1) if 0 <= j < len(accepted)]
+        other = max(neighbours, key=lambda eps: abs(eps - worst))
+        if abs(other - worst) > step / 2:
+            _add((other + worst) / 2, 'residual')
+    return proposals[:conf.get('add_per_iter', 2)]
+
+
+def adaptive_material(config, calc, idx, atoms0):
+    base_dir = config['directory']['cwd']
+    conf = config['strain']['adaptive']
+    _dct = atoms0.info
+    suffix = _dct['suffix']
+
+    cwd_strain = os.path.join(base_dir, suffix, config['strain']['save'])
+    cwd_fc2 = os.path.join(base_dir, suffix, config['supercell']['save'])
+    os.makedirs(cwd_strain, exist_ok=True)
+    os.makedirs(cwd_fc2, exist_ok=True)
+
+    phonon_kwargs = {'primitive_matrix': _dct.get('primitive_matrix', 'auto'),
+        'supercell_matrix': np.diag(_dct['fc3_supercell']),
+        'phonon_supercell_matrix': np.diag(_dct['fc2_supercell'])}
+    mode, fc_calculator = get_fc2_mode(config)
+    mesh = conf.get('mesh', _dct.get('q_point_mesh', [19, 19, 19]))
+    harmonic = config['harmonic']
+    temperatures = temperature_grid(harmonic['t_min'], min(harmonic['t_max'], config['qha']['t_max']), harmonic['t_step'])
+    query = config['qha'].get('temperatures', CTE_TEMPERATURES)
+
+    points = {}
+    todo = [(_round(eps), 'initial') for eps in conf.get('initial', [-0.02, -0.01, 0.0, 0.01, 0.02])]
+    record = {'iterations': [], 'converged': False}
+    cte = None
+    while todo:
+        # the relaxations of one iteration fan out over a calculator pool
+        relaxed = map_calc(calc, relax_strain, [(config, _scaled(atoms0, eps), eps, cwd_strain) for eps, _ in todo],
+                           desc=f'{suffix} strains')
+        for (eps, reason), strained in zip(todo, relaxed):
+            point = evaluate_point(config, calc, atoms0, eps, strained, cwd_fc2, phonon_kwargs, mesh, mode, fc_calculator)
+            if point is None:
+                point = {'accepted': False, 'fraction': None}
+            point['reason'] = reason
+            points[eps] = point
+
+        iteration = {'added': todo, 'accepted': sorted(e for e, p in points.items() if p['accepted'])}
+        record['iterations'].append(iteration)
+        v0, residual, volumes, new_cte = None, None, None, None
+        if len(iteration['accepted']) >= conf.get('min_points', 5):
+            new_cte, v0, residual, volumes = fit_grid(points, temperatures, query)
+            iteration['cte'] = new_cte
+        proposals = propose(points, v0, residual, volumes, conf)
+        todo = proposals[:conf.get('max_points', 9) - len(points)]
+
+        if new_cte is not None:
+            expanding = any(reason == 'expansion' for _, reason in proposals)
+            stable = not proposals or (cte is not None and
+                np.max(np.abs(new_cte - cte) / np.maximum(np.abs(cte), 1e-12)) < conf.get('tol', 0.02))
+            if stable and not expanding and np.all(np.isfinite(new_cte)):
+                record['converged'] = True
+                cte = new_cte
+                break
+            cte = new_cte
+
+    eps_list = sorted(eps for eps, p in points.items() if 'atoms' in p)
+    record.update({'eps': eps_list, 'n_points': len(eps_list), 'n_fixed': len(config['strain']['eps']), 'cte': cte})
+    log.info(f'{suffix} adaptive grid: {len(eps_list)} strains ({len(config["strain"]["eps"])} in strain.eps), '
+             f'converged={record["converged"]}')
+
+    # same files as the fixed-grid strain stage, in grid order
+    get_writer().flush()
+    strain_dct = {f'e{eps}': points[eps]['atoms'].info.copy() for eps in eps_list}
+    enumerate_strained(strain_dct, suffix, config)
+    dumpJSON(clean_for_json(record), f'{cwd_strain}/adaptive.json')
+    del points
+    gc.collect()
+    return eps_list, record
+
+
+def process_adaptive(config, calc):
+    calc_tag = config['calculator']['tag']
+    base_dir = config['directory']['cwd']
+    unit_dct_file = f'{base_dir}/{calc_tag}-unitcell.pkl'
+    unit_dct = loadMeta(unit_dct_file)
+    input_atoms = loadAtoms(f'{base_dir}/{calc_tag}-unitcell_relax.extxyz')
+
+    log.info(f'adaptive strain grid with MLIP {calc_tag}')
+    # unit_dct keys skip the duplicates removed by dedup
+    for idx, atoms0 in zip(unit_dct, tqdm(input_atoms, desc='Adaptive strain grid')):
+        eps_list, _ = adaptive_material(config, calc, idx, atoms0)
+        unit_dct[idx]['strain.eps'] = eps_list
+        dumpMeta(unit_dct, unit_dct_file, slim=config.get('io', {}).get('slim', False))
+    get_writer().flush()
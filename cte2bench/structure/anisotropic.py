@@ -0,0 +1,206 @@
+"""
+Anisotropic QHA: per-axis thermal expansion from a strain grid over the
+independent lattice parameters of the crystal system
+
+    cubic                              a          -> 5 points on a line
+    tetragonal / trigonal / hexagonal  a, c       -> 7 points
+    lower symmetry                     a, b, c    -> 13 points
+
+(centre, +-delta along every axis and the ++ / -- pairs of every two axes,
+a few points more than the quadratic surface has coefficients).
+Cell angles are kept fixed, so monoclinic and triclinic cells only get
+their lattice-length response. Positions are relaxed at fixed cell.
+
+The FC2 displacement dataset of the unstrained cell is generated once and
+reused at every grid point. F(strains, T) is fitted by a quadratic surface
+per temperature; its minimum gives the lattice parameters a_i(T) and
+alpha_i = d ln a_i / dT.
+"""
+
+import os, gc
+import numpy as np
+from tqdm import tqdm
+from phono3py import Phono3py
+from phonopy import file_IO as ph_IO
+
+from cte2bench.structure.strain import relax_strain
+from cte2bench.structure.supercell import generate_fc2, calculate_fc2, get_fc2_mode
+from cte2bench.phonon.thermo import thermal_properties, temperature_grid
+from cte2bench.phonon.bootstrap import EV_TO_KJMOL
+from cte2bench.phonon.qha import interp_batched, _tkey, CTE_TEMPERATURES
+from cte2bench.util.utils import aseatoms2phonoatoms, get_mesh_frequencies, get_spgnum
+from cte2bench.util.io import loadAtoms, loadMeta, dumpJSON, clean_for_json
+from cte2bench.util.writer import get_writer
+from cte2bench.calculator.pool import map_calc
+from cte2bench.util.results import append_result, compact_results
+from cte2bench.util import log
+
+AXIS_NAMES = {1: ['a'], 2: ['a', 'c'], 3: ['a', 'b', 'c']}
+
+
+def strain_axes(atoms, symprec=1e-5):
+    """groups of lattice vectors that are strained together"""
+    number = get_spgnum(atoms, symprec=symprec)
+    lengths = atoms.cell.cellpar()[:3]
+    gamma = atoms.cell.cellpar()[5]
+    if number >= 195:
+        groups = [[0, 1, 2]]
+    elif number >= 75:
+        groups = [[0, 1], [2]]
+        # c must be the unique axis: a = b, and 120 deg for the hexagonal setting
+        if number >= 143 and not np.isclose(gamma, 120, atol=1e-2):
+            groups = None
+    else:
+        groups = [[0], [1], [2]]
+    if groups is None or not all(np.allclose(lengths[g], lengths[g[0]], rtol=1e-4) for g in groups):
+        log.warning(f'non-standard setting of space group {number} .. straining a, b and c independently')
+        groups = [[0], [1], [2]]
+    return groups
+
+
+def strain_grid(n_axes, delta):
+    """(n_points, n_axes) strains of the minimal design"""
+    if n_axes == 1:
+        return np.array([[-2*delta], [-delta], [0.0], [delta], [2*delta]])
+    eye = np.eye(n_axes) * delta
+    points = [np.zeros(n_axes)] + [s * e for e in eye for s in (-1, 1)]
+    for i in range(n_axes):
+        for j in range(i + 1, n_axes):
+            points += [eye[i] + eye[j], -eye[i] - eye[j]]
+    return np.array(points)
+
+
+def _features(strains):
+    n = strains.shape[1]
+    pairs = [(i, j) for i in range(n) for j in range(i, n)]
+    columns = [np.ones(len(strains))] + [strains[:, i] for i in range(n)] + [strains[:, i] * strains[:, j] for i, j in pairs]
+    return np.stack(columns, axis=1), pairs
+
+
+def fit_axes(strains, free_energies):
+    """
+    Parameters
+    ----------
+    strains: (n_p, n_axes)
+    free_energies: (n_T, n_p)
+
+    Returns
+    -------
+    np.ndarray, shape (n_T, n_axes), strains at the minimum of the quadratic
+    surface; NaN where the surface has no minimum
+    """
+    n = strains.shape[1]
+    X, pairs = _features(strains)
+    beta, *_ = np.linalg.lstsq(X, np.asarray(free_energies, dtype=float).T, rcond=None)   # (n_f, n_T)
+    grad = beta[1:1+n].T                                                                  # (n_T, n)
+    hessian = np.zeros((len(grad), n, n))
+    for k, (i, j) in enumerate(pairs):
+        c = beta[1+n+k]
+        if i == j:
+            hessian[:, i, i] = 2 * c
+        else:
+            hessian[:, i, j] = hessian[:, j, i] = c
+    x0 = np.linalg.solve(hessian, -grad[..., None])[..., 0]
+    x0[~np.all(np.linalg.eigvalsh(hessian) > 0, axis=1)] = np.nan
+    return x0
+
+
+def _strained(atoms0, groups, strain):
+    strained = atoms0.copy()
+    cell = atoms0.get_cell()[:]
+    for g, x in zip(groups, strain):
+        cell[g] *= (1 + x)
+    strained.set_cell(cell, scale_atoms=True)
+    strained.info = atoms0.info.copy()
+    return strained
+
+
+def anisotropic_material(config, calc, idx, atoms0):
+    conf = config['anisotropic']
+    base_dir = config['directory']['cwd']
+    _dct = atoms0.info
+    suffix = _dct['suffix']
+
+    cwd = os.path.join(base_dir, suffix, conf.get('save', './anisotropic'))
+    os.makedirs(cwd, exist_ok=True)
+
+    phonon_kwargs = {'primitive_matrix': _dct.get('primitive_matrix', 'auto'),
+        'supercell_matrix': np.diag(_dct['fc3_supercell']),
+        'phonon_supercell_matrix': np.diag(_dct['fc2_supercell'])}
+    mode, fc_calculator = get_fc2_mode(config)
+    mesh = conf.get('mesh') or _dct.get('q_point_mesh', [19, 19, 19])
+    scale = np.linalg.norm(np.linalg.det(_dct.get('primitive_matrix', np.eye(3))))
+
+    groups = strain_axes(atoms0, symprec=config['supercell'].get('symprec', 1e-5))
+    names = AXIS_NAMES[len(groups)]
+    strains = strain_grid(len(groups), conf.get('delta', 0.01))
+    log.info(f'{suffix} anisotropic grid over {", ".join(names)}: {len(strains)} points')
+
+    # cell fixed at every grid point, only positions relax
+    fixed = dict(config, opt=dict(config['opt'], strain=dict(config['opt']['strain'], mask=[0, 0, 0, 0, 0, 0])))
+    # one displacement dataset for the whole grid
+    dataset = generate_fc2(config, aseatoms2phonoatoms(atoms0), phonon_kwargs, mode=mode).phonon_dataset
+
+    tags = ['_'.join(f'{x:+.4f}' for x in strain) for strain in strains]
+    relaxed = map_calc(calc, relax_strain, [(fixed, _strained(atoms0, groups, strain), tag, cwd)
+                                            for strain, tag in zip(strains, tags)], desc=f'{suffix} anisotropic relaxations')
+    freqs_list, weights_list, energies = [], [], []
+    for tag, strained in tqdm(list(zip(tags, relaxed)), desc=f'{suffix} anisotropic grid', leave=False):
+        fc2_file = f'{cwd}/FORCE_CONSTANTS_2ND_e{tag}'
+        if config['supercell']['cont'] and os.path.isfile(fc2_file):
+            get_writer().flush()
+            fc2 = ph_IO.parse_FORCE_CONSTANTS(fc2_file)
+        else:
+            ph3 = Phono3py(unitcell=aseatoms2phonoatoms(strained), **phonon_kwargs)
+            ph3.phonon_dataset = dataset
+            fc2 = calculate_fc2(config, cwd, tag, ph3, calc, fc_calculator=fc_calculator).fc2
+            get_writer().submit(ph_IO.write_FORCE_CONSTANTS, fc2, filename=fc2_file)
+            del ph3
+        freqs, weights = get_mesh_frequencies(aseatoms2phonoatoms(strained), fc2, phonon_kwargs['phonon_supercell_matrix'],
+                                              primitive_matrix=phonon_kwargs['primitive_matrix'], mesh=mesh)
+        freqs_list.append(freqs)
+        weights_list.append(weights)
+        energies.append(strained.info['e_fr_energy'] * scale)
+        gc.collect()
+
+    temperatures = temperature_grid(config['harmonic']['t_min'], config['qha']['t_max'], config['harmonic']['t_step'])
+    fe, _, _ = thermal_properties(freqs_list, weights_list, temperatures)
+    free_energies = fe / EV_TO_KJMOL + np.array(energies)[None, :]
+    x0 = fit_axes(strains, free_energies)                                   # (n_T, n_axes)
+
+    lengths0 = atoms0.cell.cellpar()[[g[0] for g in groups]]
+    lattice = lengths0[None, :] * (1 + x0)
+    alpha = np.gradient(np.log(1 + x0), temperatures, axis=0)
+    volumetric = alpha @ np.array([len(g) for g in groups], dtype=float)
+    np.savez(f'{cwd}/anisotropic_arrays.npz', temperatures=temperatures, strains=strains, free_energy=free_energies,
+             axes=np.array(names), lattice=lattice, alpha=alpha, volumetric=volumetric)
+
+    query = config['qha'].get('temperatures', CTE_TEMPERATURES)
+    alpha_q = interp_batched(temperatures, alpha.T, query)
+    lattice_q = interp_batched(temperatures, lattice.T, query)
+    volumetric_q = interp_batched(temperatures, volumetric, query)
+
+    def _table(values):
+        return {_tkey(t): (None if np.isnan(v) else float(v)) for t, v in zip(query, values)}
+
+    record = {'AXES': {name: [int(i) for i in g] for name, g in zip(names, groups)}, 'N_POINTS': len(strains),
+              'CALC': {name: _table(alpha_q[k]) for k, name in enumerate(names)},
+              'LATTICE': {name: _table(lattice_q[k]) for k, name in enumerate(names)},
+              'VOLUMETRIC': _table(volumetric_q)}
+    dumpJSON(clean_for_json(record), f'{cwd}/anisotropic.json')
+    if np.isnan(x0).any():
+        log.warning(f'{suffix} F(strains) has no minimum at some temperatures .. widen anisotropic.delta')
+    return {'CTE_AXES': record}
+
+
+def process_anisotropic(config, calc):
+    calc_tag = config['calculator']['tag']
+    base_dir = config['directory']['cwd']
+    unit_dct = loadMeta(f'{base_dir}/{calc_tag}-unitcell.pkl')
+    input_atoms = loadAtoms(f'{base_dir}/{calc_tag}-unitcell_relax.extxyz')
+
+    log.info(f'anisotropic QHA with MLIP {calc_tag}')
+    for idx, atoms0 in zip(unit_dct, tqdm(input_atoms, desc='Anisotropic QHA')):
+        append_result(config, idx, 'anisotropic', anisotropic_material(config, calc, idx, atoms0))
+    get_writer().flush()
+    compact_results(config)
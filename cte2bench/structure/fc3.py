@@ -0,0 +1,149 @@
+"""
+Opt-in FC3 stage.
+
+Displacement pairs farther apart than fc3.cutoff_pair_distance are pruned by
+phono3py (their supercells are None). The remaining supercells are evaluated
+in batches of fc3.batch_size through the same calculator path as FC2; with
+fc3.n_shards > 1 every job evaluates only its own share (fc3.shard) and
+whichever job finds every force on disk writes fc3.hdf5.
+Forces are saved per displacement, so an interrupted job resumes where it stopped.
+"""
+
+import os, gc
+import numpy as np
+from tqdm import tqdm
+from ase import Atoms
+
+from phono3py import Phono3py
+from phono3py import file_IO as ph3_IO
+
+from cte2bench.util.calc import single_point_calculate_list
+from cte2bench.util.utils import aseatoms2phonoatoms, material_eps
+from cte2bench.util.io import loadAtoms, loadMeta, dumpJSON, clean_for_json
+from cte2bench.util.writer import get_writer
+from cte2bench.util.results import append_result, compact_results
+from cte2bench.structure.supercell import displacement_fingerprint, _save_force, _load_force
+from cte2bench.util import log
+
+
+def fc3_strain(config, calc, cwd, eps, atoms, phonon_kwargs, suffix):
+    """
+    Returns the record of one strain:
+    n_pairs/n_computed/n_saved by the cutoff, n_missing after this job.
+    """
+    conf = config['fc3']
+    eps_dir = f'{cwd}/e{eps}'
+    fc3_file = f'{cwd}/fc3_e{eps}.hdf5'
+    os.makedirs(eps_dir, exist_ok=True)
+
+    ph3 = Phono3py(unitcell=aseatoms2phonoatoms(atoms), **phonon_kwargs)
+    ph3.generate_displacements(distance=config['supercell']['distance'],
+                               cutoff_pair_distance=conf.get('cutoff_pair_distance'))
+    supercells = ph3.supercells_with_displacements
+    nat = len(ph3.supercell)
+
+    included = [i for i, sc in enumerate(supercells) if sc is not None]
+    record = {'cutoff_pair_distance': conf.get('cutoff_pair_distance'), 'n_pairs': len(supercells),
+              'n_computed': len(included), 'n_saved': len(supercells) - len(included)}
+
+    if conf.get('cont', True) and os.path.isfile(fc3_file):
+        record['n_missing'] = 0
+        return record
+
+    fingerprint = displacement_fingerprint(supercells)
+    fingerprint_file = f'{eps_dir}/displacements.sha1'
+    if os.path.isfile(fingerprint_file):
+        with open(fingerprint_file, 'r') as f:
+            if f.read().strip() != fingerprint:
+                log.warning(f'{suffix}-e{eps} FC3 displacement dataset changed .. discarding saved forces')
+                for name in os.listdir(eps_dir):
+                    if name.startswith('force-'):
+                        os.remove(f'{eps_dir}/{name}')
+    with open(fingerprint_file, 'w') as f:
+        f.write(f'{fingerprint}\n')
+
+    def _force_file(i):
+        return f'{eps_dir}/force-{str(i+1).zfill(5)}.npy'
+
+    shard, n_shards = conf.get('shard', 0), conf.get('n_shards', 1)
+    todo = [i for i in included[shard::n_shards] if _load_force(_force_file(i), nat) is None]
+    log.info(f'{suffix}-e{eps} FC3: {len(included)} of {len(supercells)} supercells within cutoff, '
+             f'{len(todo)} left in shard {shard}/{n_shards}')
+
+    writer = get_writer()
+    batch_size = conf.get('batch_size', 64)
+    for lo in tqdm(range(0, len(todo), batch_size), desc=f'FC3 e{eps}', leave=False):
+        batch = todo[lo:lo+batch_size]
+        atoms_list = [Atoms(supercells[i].symbols, cell=supercells[i].cell, positions=supercells[i].positions, pbc=True)
+                      for i in batch]
+
+        def _store(j, result):
+            writer.submit(_save_force, _force_file(batch[j]), result.get_forces())
+
+        single_point_calculate_list(atoms_list, calc, callback=_store, reuse_graph=True)
+        del atoms_list
+    writer.flush()
+
+    forces = np.zeros((len(supercells), nat, 3))
+    missing = 0
+    for i in included:
+        force = _load_force(_force_file(i), nat)
+        if force is None:
+            missing += 1
+        else:
+            forces[i] = force
+    record['n_missing'] = missing
+    if missing:
+        log.info(f'{suffix}-e{eps} FC3 waiting for {missing} supercells of other shards')
+        return record
+
+    ph3.forces = forces
+    ph3.produce_fc3(fc_calculator=conf.get('fc_calculator'))
+    ph3_IO.write_fc3_to_hdf5(ph3.fc3, filename=f'{fc3_file}.tmp')
+    os.replace(f'{fc3_file}.tmp', fc3_file)
+    del ph3
+    gc.collect()
+    return record
+
+
+def fc3_material(config, calc, idx, _dct):
+    calc_tag = config['calculator']['tag']
+    base_dir = config['directory']['cwd']
+    suffix = _dct['suffix']
+
+    phonon_kwargs = {'primitive_matrix': _dct.get('primitive_matrix', 'auto'),
+        'supercell_matrix': np.diag(_dct['fc3_supercell']),
+        'phonon_supercell_matrix': np.diag(_dct['fc2_supercell'])}
+
+    strain_dir = f'{base_dir}/{suffix}/{config["strain"]["save"]}'
+    strain_dct = loadMeta(f'{strain_dir}/{calc_tag}-strain_dct-{suffix}.pkl')
+    strain_opt = loadAtoms(f'{strain_dir}/{calc_tag}-strain_relax-{suffix}.extxyz')
+
+    cwd = os.path.join(base_dir, suffix, config['fc3']['save'])
+    os.makedirs(cwd, exist_ok=True)
+
+    records = {}
+    for i, eps in enumerate(material_eps(config, _dct)):
+        if eps not in config['fc3'].get('eps', [0.0]):
+            continue
+        if not strain_dct.get(f'e{eps}', None):
+            log.warning(f'Skipping FC3 of {suffix} - e{eps} .. no meta data available')
+            continue
+        records[f'e{eps}'] = fc3_strain(config, calc, cwd, eps, strain_opt[i], phonon_kwargs, suffix)
+
+    dumpJSON(clean_for_json(records), f'{cwd}/fc3_record.json')
+    saved = sum(r['n_saved'] for r in records.values())
+    total = sum(r['n_pairs'] for r in records.values())
+    log.info(f'{suffix} FC3 cutoff saved {saved} of {total} supercell calculations')
+    return records
+
+
+def process_fc3(config, calc):
+    calc_tag = config['calculator']['tag']
+    base_dir = config['directory']['cwd']
+    unit_dct = loadMeta(f'{base_dir}/{calc_tag}-unitcell.pkl')
+
+    for idx, _dct in tqdm(unit_dct.items(), desc='FC3 supercells'):
+        append_result(config, idx, 'fc3', {'fc3': fc3_material(config, calc, idx, _dct)})
+    get_writer().flush()
+    compact_results(config)
@@ -1,11 +1,14 @@
 from tqdm import tqdm
 import ase.io as ase_IO
-import torch, gc, os
+import gc, os
 import numpy as np
 
-from cte2bench.util.utils import get_spgnum, log_stats
-from cte2bench.util.relax import get_relaxer
-from cte2bench.util.io import dumpPKL
+from cte2bench.util.utils import get_spgnum, log_stats, empty_cuda_cache
+from cte2bench.util.relax import get_relaxer, step_summary
+from cte2bench.util.io import dumpAtoms, dumpMeta, loadAtoms
+from cte2bench.util.writer import get_writer
+from cte2bench.calculator.pool import map_calc
+from cte2bench.util import log
 
 def enumerate_strained(strain_dct, suffix, config):
     calc_tag = config['calculator']['tag']
@@ -16,8 +19,9 @@ def enumerate_strained(strain_dct, suffix, config):
         atoms = ase_IO.read(f'{output_dir}/CONTCAR_e{_dct["eps"]}')
         atoms.info.update(_dct.copy())
         output_atoms.append(atoms)
-    ase_IO.write(f'{output_dir}/{calc_tag}-strain_relax-{suffix}.extxyz', output_atoms, format='extxyz')
-    dumpPKL(strain_dct, f'{output_dir}/{calc_tag}-strain_dct-{suffix}.pkl')
+    slim = config.get('io', {}).get('slim', False)
+    dumpAtoms(output_atoms, f'{output_dir}/{calc_tag}-strain_relax-{suffix}.extxyz', slim=slim)
+    dumpMeta(strain_dct, f'{output_dir}/{calc_tag}-strain_dct-{suffix}.pkl', slim=slim)
 
 def scale_unitcell(suffix, config):
     base_dir = config['directory']['cwd']
@@ -38,69 +42,89 @@ def scale_unitcell(suffix, config):
     ase_IO.write(f'{cwd}/{calc_tag}-strain-{suffix}.extxyz', scaled_list, format='extxyz', append=True)
     return
 
+def relax_strain(calc, config, strained, eps, cwd):
+    writer = get_writer()
+    suffix = strained.info['suffix']
+    strained.info['eps'] = eps
+    logfile = f'{cwd}/strain_e{eps}.log'
+    relaxer = get_relaxer(config, calc, opt_type='strain', logfile=logfile)
+    strained = relaxer.update_atoms(strained)
+    log_stats(config, strained, task='strain', stat='oneshot', eps=eps)
+
+    init_vol = round(strained.get_volume()/len(strained), 4)
+
+    strained = relaxer.relax_atoms(strained)
+    strained = relaxer.update_atoms(strained)
+    writer.submit(ase_IO.write, f'{cwd}/CONTCAR_e{eps}', strained.copy(), format='vasp')
+    strained.info["symm.no.strain"] = strain_sgn = get_spgnum(strained)
+    log_stats(config, strained, task='strain', stat='relax', eps=eps)
+    steps, force_conv = strained.info['steps'], strained.info['force_conv']
+    strain_vol = round(strained.get_volume()/len(strained), 4)
+
+    if steps >= config['opt']['strain']['steps'] or not force_conv:
+        strained.info['strain.opt'] = False
+        log.warning(f'{suffix} e{eps} relaxation did not reach convergence in {steps}')
+    else:
+        strained.info['strain.opt'] = True
+
+    if (unit_sgn := strained.info['symm.no.unit']) != strain_sgn:
+        strained.info['strain.symm'] = False
+        log.warning(f'symmetry of {suffix} changed from {unit_sgn} to {strain_sgn}')
+    else:
+        strained.info['strain.symm'] = True
+
+    if init_vol != strain_vol:
+        strained.info['strain.vol'] = False
+        log.warning(f'volume of {suffix} changed from {init_vol} to {strain_vol}')
+    else:
+        strained.info['strain.vol'] = True
+
+    strained.calc = None
+    del relaxer
+    gc.collect()
+    return strained
+
+def strain_material(config, calc, atoms0):
+    writer = get_writer()
+    calc_tag = config['calculator']['tag']
+    base_dir = config['directory']['cwd']
+    _dct = atoms0.info.copy()
+    suffix = _dct['suffix']
+    cwd = os.path.join(base_dir, suffix, config['strain']['save'])
+    os.makedirs(cwd, exist_ok = True)
+    scale_unitcell(suffix, config)
+
+    strained_input = ase_IO.read(f'{cwd}/{calc_tag}-strain-{suffix}.extxyz', index=':')
+
+    strain_dct = {}
+    tasks = []
+    for strained, eps in zip(strained_input, config['strain']['eps']):
+        strained.info = _dct.copy()
+        tasks.append((config, strained, eps, cwd))
+
+    desc = f'{suffix} strains'
+    relaxed = map_calc(calc, relax_strain, tasks, desc=desc)
+    if (summary := step_summary(relaxed)) is not None:
+        log.info(f'{suffix} strains: {summary["pre"]} pre-relaxer steps, {summary["final"]} production steps')
+    for strained, eps in zip(relaxed, config['strain']['eps']):
+        strain_dct[f'e{eps}'] = {}
+        strain_dct[f'e{eps}'].update(strained.info)
+
+    # CONTCARs are read back below
+    writer.flush()
+    enumerate_strained(strain_dct, suffix, config)
+    del strained_input, strain_dct
+    gc.collect()
+
 def process_strain(config, calc):
     calc_tag = config['calculator']['tag']
     base_dir = config['directory']['cwd']
-    input_atoms = ase_IO.read(f'{base_dir}/{calc_tag}-unitcell_relax.extxyz', index=':')
+    input_atoms = loadAtoms(f'{base_dir}/{calc_tag}-unitcell_relax.extxyz')
 
-    print(f'INFO: pre-processing with MLIP {calc_tag}')
+    log.info(f'pre-processing with MLIP {calc_tag}')
     desc = 'v-ZSISA relaxation'
     for idx, atoms0 in enumerate(tqdm(input_atoms, desc=desc)):
-        _dct = atoms0.info.copy()
-        suffix = _dct['suffix']
-        cwd = os.path.join(base_dir, suffix, config['strain']['save'])
-        os.makedirs(cwd, exist_ok = True)
-        scale_unitcell(suffix, config)
-
-        strained_input = ase_IO.read(f'{cwd}/{calc_tag}-strain-{suffix}.extxyz', index=':')
-
-        det = np.linalg.norm(np.linalg.det(_dct['primitive_matrix']))
-
-        strain_dct = {}
-
-        for i, (strained, eps) in enumerate(zip(strained_input, config['strain']['eps'])):
-            strain_dct[f'e{eps}'] = {} 
-            strained.info = _dct
-            strained.info['eps'] = eps
-            logfile = f'{cwd}/strain_e{eps}.log'
-            relaxer = get_relaxer(config, calc, opt_type='strain', logfile=logfile)
-            strained = relaxer.update_atoms(strained)
-            log_stats(config, strained, task='strain', stat='oneshot', eps=eps)
-
-            init_vol = round(strained.get_volume()/len(strained), 4)
-
-            strained = relaxer.relax_atoms(strained)
-            strained = relaxer.update_atoms(strained)
-            ase_IO.write(f'{cwd}/CONTCAR_e{eps}', strained, format='vasp')
-            strained.info["symm.no.strain"] = strain_sgn = get_spgnum(strained)
-            log_stats(config, strained, task='strain', stat='relax', eps=eps)
-            steps, force_conv = strained.info['steps'], strained.info['force_conv']
-            strain_vol = round(strained.get_volume()/len(strained), 4)
-
-            if steps >= config['opt']['strain']['steps'] or not force_conv:
-                strained.info['strain.opt'] = False
-                print(f'WARNING: {suffix} e{eps} relaxation did not reach convergence in {steps}')
-            else:
-                strained.info['strain.opt'] = True
-
-            if (unit_sgn := strained.info['symm.no.unit']) != strain_sgn:
-                strained.info['strain.symm'] = False
-                print(f'WARNING: symmetry of {suffix} changed from {unit_sgn} to {strain_sgn}')
-            else:
-                strained.info['strain.symm'] = True
-
-            if init_vol != strain_vol:
-                strained.info['strain.vol'] = False
-                print(f'WARNING: volume of {suffix} changed from {init_vol} to {strain_vol}')
-            else:
-                strained.info['strain.vol'] = True
-
-            strain_dct[f'e{eps}'].update(strained.info)
-            del relaxer
-            gc.collect()
-        enumerate_strained(strain_dct, suffix, config)
-        del strained_input, strain_dct
-        gc.collect()
-
-    torch.cuda.empty_cache()
+        strain_material(config, calc, atoms0)
+
+    empty_cuda_cache()
     gc.collect()
@@ -1,57 +1,472 @@
 from phono3py import Phono3py
-import torch, gc
+import gc
 import numpy as np
 from tqdm import tqdm
 import ase.io as ase_IO
 from ase import Atoms
-import os, sys
+import os, sys, shutil
+import hashlib
+import importlib.util
 
 from phono3py import file_IO as ph3_IO
 from phonopy import file_IO as ph_IO
 
 from cte2bench.util.calc import single_point_calculate_list
-from cte2bench.util.utils import aseatoms2phonoatoms, phonoatoms2aseatoms, log_stats
-from cte2bench.util.io import dumpPKL, loadPKL
+from cte2bench.util.utils import aseatoms2phonoatoms, phonoatoms2aseatoms, log_stats, get_mesh_frequencies, minimal_supercell, material_eps, imag_dos_frac, empty_cuda_cache
+from cte2bench.util.io import dumpAtoms, loadAtoms, loadMeta, dumpJSON, clean_for_json
+from cte2bench.util.writer import get_writer, WriteError
+from cte2bench.util.results import append_result
+from cte2bench.util.dedup import find_aliases
+from cte2bench.util.plan import ordered_items
+from cte2bench.util import log
 
 
-def calculate_fc2(config, cwd, eps, ph3, calc, symmetrize_fc2=True):
+def _write_result(filename, result, slim=False):
+    try:
+        # slim: forces are already saved as force-XXXXX.npy, so the calculator
+        # results are dropped and only positions and scalars are kept
+        dumpAtoms(result, filename, slim=slim)
+    except Exception as exec:
+        print(f'Error {exec} occured while saving result atoms list of single point calc.')
+
+def generate_fc2(config, unitcell, phonon_kwargs, mode='systematic'):
+    """
+    systematic: +- displacement of every symmetry-inequivalent atom
+    random: supercell.n_random snapshots with every atom displaced, for least-squares fitting
+    """
+    conf = config['supercell']
+    phonon = Phono3py(unitcell=unitcell, **phonon_kwargs)
+    if mode == 'random':
+        phonon.generate_fc2_displacements(distance=conf['distance'], number_of_snapshots=conf['n_random'],
+            is_plusminus=conf.get('random_plusminus', False), random_seed=conf['random_seed'])
+    else:
+        phonon.generate_fc2_displacements(distance=conf['distance'], is_plusminus=True,
+            random_seed=conf['random_seed'])
+    return phonon
+
+def get_fc2_mode(config):
+    """fc2 mode and the force-constant calculator it needs"""
+    conf = config['supercell']
+    mode = conf.get('fc2_mode', 'systematic')
+    if mode != 'random':
+        return 'systematic', None
+
+    fc_calculator = conf.get('fc_calculator', 'symfc')
+    if importlib.util.find_spec(fc_calculator) is None:
+        log.warning(f'{fc_calculator} not available for random-displacement fitting .. using systematic displacements')
+        return 'systematic', None
+    return mode, fc_calculator
+
+def check_random_fc2(config, unitcell, phonon_kwargs, phonon, reference):
+    """compare random-displacement FC2 against the systematic one on a coarse mesh"""
+    mesh = config['supercell'].get('check_mesh', [8, 8, 8])
+    kwargs = {'supercell_matrix': phonon_kwargs['phonon_supercell_matrix'],
+              'primitive_matrix': phonon_kwargs['primitive_matrix']}
+    freqs, _ = get_mesh_frequencies(unitcell, phonon.fc2, mesh=mesh, **kwargs)
+    freqs_ref, _ = get_mesh_frequencies(unitcell, reference.fc2, mesh=mesh, **kwargs)
+    diff = np.abs(freqs - freqs_ref)
+    return {'n_random': len(phonon.phonon_supercells_with_displacements),
+            'n_systematic': len(reference.phonon_supercells_with_displacements),
+            'max_freq_diff': float(diff.max()),
+            'rms_freq_diff': float(np.sqrt(np.mean(diff**2))),
+            'fc2_rel_diff': float(np.linalg.norm(phonon.fc2 - reference.fc2) / np.linalg.norm(reference.fc2))}
+
+def auto_fc2_supercell(config, calc, atoms, cwd, suffix):
+    """
+    FC2 supercell from supercell.auto.min_length. With supercell.auto.check the
+    mesh frequencies are compared against the next larger supercell
+    (min_length + step) and the larger one is taken until they agree within tol.
+    Returns the diagonal and the record of the choice.
+    """
+    conf = config['supercell']['auto']
+    min_length = conf.get('min_length', 10.0)
+    n_sc = minimal_supercell(atoms, min_length)
+    record = {'min_length': min_length, 'checks': []}
+    if not conf.get('check'):
+        return n_sc, record
+
+    unitcell = aseatoms2phonoatoms(atoms)
+    primitive_matrix = atoms.info.get('primitive_matrix', 'auto')
+    mesh = conf.get('check_mesh', config['supercell'].get('check_mesh', [8, 8, 8]))
+
+    def _freqs(n):
+        kwargs = {'primitive_matrix': primitive_matrix, 'supercell_matrix': np.diag(n), 'phonon_supercell_matrix': np.diag(n)}
+        phonon = generate_fc2(config, unitcell, kwargs)
+        phonon = calculate_fc2(config, f'{cwd}/auto', '_'.join(str(i) for i in n), phonon, calc)
+        freqs, _ = get_mesh_frequencies(unitcell, phonon.fc2, np.diag(n), primitive_matrix=primitive_matrix, mesh=mesh)
+        del phonon
+        return freqs
+
+    freqs = _freqs(n_sc)
+    for _ in range(conf.get('max_iter', 2)):
+        min_length += conf.get('step', 3.0)
+        n_next = minimal_supercell(atoms, min_length)
+        if n_next == n_sc:
+            continue
+        freqs_next = _freqs(n_next)
+        diff = float(np.abs(freqs - freqs_next).max())
+        record['checks'].append({'fc2_supercell': n_sc, 'next': n_next, 'max_freq_diff': diff})
+        if diff <= conf.get('tol', 0.05):
+            break
+        log.info(f'{suffix} FC2 supercell {n_sc} not converged ({diff:.4f} THz) .. trying {n_next}')
+        n_sc, freqs = n_next, freqs_next
+        record['min_length'] = min_length
+    else:
+        if record['checks']:
+            log.warning(f'{suffix} FC2 supercell frequencies not converged within max_iter .. using {n_sc}')
+    gc.collect()
+    return n_sc, record
+
+def displacement_fingerprint(supercells):
+    """hash of the displaced supercells; forces on disk are reused only for the same dataset"""
+    digest = hashlib.sha1()
+    for sc in supercells:
+        if sc is None:
+            digest.update(b'none')
+            continue
+        digest.update(np.ascontiguousarray(np.round(sc.cell, 8)).tobytes())
+        digest.update(np.ascontiguousarray(np.round(sc.positions, 8)).tobytes())
+        digest.update(np.ascontiguousarray(sc.numbers).tobytes())
+    return digest.hexdigest()
+
+def _save_force(filename, force):
+    # written under a temporary name so a killed job never leaves a torn file
+    with open(f'{filename}.tmp', 'wb') as f:
+        np.save(f, force)
+    os.replace(f'{filename}.tmp', filename)
+
+def _load_force(filename, nat):
+    """force array of a previous run, None if missing or unusable"""
+    if not os.path.isfile(filename):
+        return None
+    try:
+        force = np.load(filename)
+    except Exception:
+        return None
+    if force.shape != (nat, 3) or not np.all(np.isfinite(force)):
+        return None
+    return force
+
+def calculate_fc2(config, cwd, eps, ph3, calc, symmetrize_fc2=True, fc_calculator=None):
+    """
+    With supercell.cont, force-XXXXX.npy files of an interrupted run are
+    reused when they belong to the same displacement dataset and only the
+    missing displacements are evaluated.
+    """
     desc = 'FC2 calculation'
-    forces = []
+    eps_dir = f'{cwd}/e{eps}'
+    os.makedirs(eps_dir, exist_ok = True)
     nat = len(ph3.phonon_supercell)
+    supercells = ph3.phonon_supercells_with_displacements
+    writer = get_writer()
+
+    fingerprint = displacement_fingerprint(supercells)
+    fingerprint_file = f'{eps_dir}/displacements.sha1'
+    resume = False
+    if config['supercell']['cont'] and os.path.isfile(fingerprint_file):
+        with open(fingerprint_file, 'r') as f:
+            resume = f.read().strip() == fingerprint
+        if not resume:
+            log.warning(f'e{eps} displacement dataset changed .. recomputing every displacement')
+    with open(fingerprint_file, 'w') as f:
+        f.write(f'{fingerprint}\n')
+
+    forces = [None] * len(supercells)
     indices = []
     atoms_list = []
-    for i, sc in enumerate(ph3.phonon_supercells_with_displacements):
+    for i, sc in enumerate(supercells):
         label = str(i+1).zfill(5)
-        if sc is not None:
+        if sc is None:
+            forces[i] = np.zeros((nat, 3))
+            continue
+        if resume:
+            forces[i] = _load_force(f'{eps_dir}/force-{label}.npy', nat)
+        if forces[i] is None:
             atoms_list.append(Atoms(sc.symbols, cell=sc.cell, positions=sc.positions, pbc=True))
-            # ase_IO.write(f"{cwd}/e{eps}/POSCAR_e{eps}_FC2-{label}", ase_sc, format='vasp')
-            # atoms_list.append(ase_sc)
             indices.append(i)
 
-    result = single_point_calculate_list(atoms_list, calc, desc=desc)
-    try:
-        ase_IO.write(f'{cwd}/e{eps}_FC2.extxyz', result, format='extxyz')
-    except Exception as exec:
-        print(f'Error {exec} occured while saving result atoms list of single point calc.')
+    n_reused = len(supercells) - len(indices) - sum(sc is None for sc in supercells)
+    if n_reused:
+        log.info(f'e{eps} reusing {n_reused} of {n_reused + len(indices)} displacement forces')
 
-    for j, sc in enumerate(ph3.phonon_supercells_with_displacements):
-        label = str(j+1).zfill(5)
-        if sc is not None:
-            atoms = result[indices.index(j)]
-            f = atoms.get_forces()
-            log_stats(config, atoms, task='fc2', eps=eps, disp=label)
-        else:
-            f = np.zeros((nat, 3))
-        np.save(f'{cwd}/e{eps}/force-{label}.npy', f)
-        forces.append(f)
+    def _store(j, atoms):
+        i = indices[j]
+        label = str(i+1).zfill(5)
+        forces[i] = f = atoms.get_forces()
+        log_stats(config, atoms, task='fc2', eps=eps, disp=label)
+        writer.submit(_save_force, f'{eps_dir}/force-{label}.npy', f)
+
+    result = single_point_calculate_list(atoms_list, calc, desc=desc, callback=_store, reuse_graph=True)
+    if result:
+        # a resumed run only holds the displacements evaluated this time
+        filename = f'{cwd}/e{eps}_FC2-resumed.extxyz' if n_reused else f'{cwd}/e{eps}_FC2.extxyz'
+        writer.submit(_write_result, filename, result, slim=config.get('io', {}).get('slim', False))
 
     # append forces
     force_set = np.array(forces)
     ph3.phonon_forces = force_set
-    ph3.produce_fc2(symmetrize_fc2=symmetrize_fc2)
+    ph3.produce_fc2(symmetrize_fc2=symmetrize_fc2, fc_calculator=fc_calculator)
 
     return ph3
 
+def fc2_strain(config, calc, cwd, eps, atoms, phonon_kwargs, suffix, mode='systematic', fc_calculator=None, check_dct=None, load=False):
+    """
+    FC2 of one strained cell, written to FORCE_CONSTANTS_2ND_e{eps}.
+    Returns the force constants, or None on failure. With supercell.cont an
+    existing file is skipped, and only parsed back when `load` is set.
+    """
+    fc2_file = f'{cwd}/FORCE_CONSTANTS_2ND_e{eps}'
+    if config['supercell']['cont'] and os.path.isfile(fc2_file):
+        if not load:
+            return None
+        get_writer().flush()
+        return ph_IO.parse_FORCE_CONSTANTS(fc2_file)
+
+    unitcell = aseatoms2phonoatoms(atoms)
+    phonon = generate_fc2(config, unitcell, phonon_kwargs, mode=mode)
+
+    try:
+        phonon = calculate_fc2(config, cwd, eps, phonon, calc, fc_calculator=fc_calculator)
+        get_writer().submit(ph_IO.write_FORCE_CONSTANTS, phonon.fc2, filename=fc2_file)
+    except WriteError:
+        # an earlier artifact was lost, not this strain's FC2
+        raise
+    except Exception as exec:
+        log.error(f'Exception {exec} occurred while calculating FC2 of {suffix}-e{eps}')
+        del phonon
+        return None
+
+    if mode == 'random' and check_dct is not None and eps in config['supercell'].get('check_eps', []):
+        reference = generate_fc2(config, unitcell, phonon_kwargs, mode='systematic')
+        reference = calculate_fc2(config, cwd, f'{eps}_systematic', reference, calc)
+        check_dct[f'e{eps}'] = check = check_random_fc2(config, unitcell, phonon_kwargs, phonon, reference)
+        log.info(f'{suffix}-e{eps} random FC2 ({check["n_random"]} supercells) vs systematic '
+              f'({check["n_systematic"]}): max |dfreq| = {check["max_freq_diff"]:.4f} THz')
+        del reference
+
+    fc2 = phonon.fc2
+    del phonon
+    gc.collect()
+    return fc2
+
+def gate_material(config, calc, cwd, strain_opt, strain_eps, eps_list, phonon_kwargs, suffix, mode, fc_calculator, check_dct,
+                  fc2_cache=None):
+    """
+    Rejection gates ahead of the FC2 loop, in order of cost:
+
+        symm / vol : drop strains whose relaxation changed symmetry / volume
+        eos        : reject if the E(V) of the kept strains has no minimum
+                     inside the grid or misses a point by more than eos_tol
+        imag       : FC2 at eps=0 first, reject if its imaginary fraction on a
+                     coarse mesh reaches imag_tol
+
+    Returns the strains still to compute (empty if rejected) and the record;
+    the FC2 at eps=0 is kept in fc2_cache for the stages after the gates.
+    """
+    from cte2bench.phonon.bootstrap import fit_equilibrium_volumes, fit_residuals
+
+    conf = config['supercell']['gates']
+    index = {eps: i for i, eps in enumerate(strain_eps)}
+    record = {'passed': True, 'reasons': [], 'dropped': {}}
+
+    for key in ['symm', 'vol']:
+        if not conf.get(key, True):
+            continue
+        for eps in eps_list:
+            if strain_opt[index[eps]].info.get(f'strain.{key}', True) is False and f'e{eps}' not in record['dropped']:
+                record['dropped'][f'e{eps}'] = f'strain.{key}'
+    kept = [eps for eps in eps_list if f'e{eps}' not in record['dropped']]
+    if record['dropped']:
+        log.warning(f'{suffix} dropping strains {list(record["dropped"])} before FC2')
+
+    min_points = conf.get('min_points', 5)
+    if len(kept) < min_points:
+        record['reasons'].append(f'{len(kept)} strains left, {min_points} needed')
+
+    if not record['reasons'] and conf.get('eos', True):
+        volumes = np.array([strain_opt[index[eps]].get_volume() for eps in kept])
+        energies = np.array([[strain_opt[index[eps]].info['e_fr_energy'] for eps in kept]])
+        nat = len(strain_opt[index[kept[0]]])
+        v0 = fit_equilibrium_volumes(volumes, energies, np.ones((1, len(kept))))[0, 0]
+        record['eos_residual'] = residual = float(np.abs(fit_residuals(volumes, energies)).max() / nat)
+        if not np.isfinite(v0):
+            record['reasons'].append('E(V) minimum outside the strain grid')
+        elif residual > conf.get('eos_tol', 1e-3):
+            record['reasons'].append(f'E(V) fit residual {residual:.2e} eV/atom')
+
+    if not record['reasons'] and conf.get('imag', True) and 0.0 in kept:
+        atoms = strain_opt[index[0.0]]
+        fc2 = fc2_strain(config, calc, cwd, 0.0, atoms, phonon_kwargs, suffix, mode, fc_calculator, check_dct, load=True)
+        if fc2 is None:
+            record['reasons'].append('FC2 at e0.0 failed')
+        else:
+            if fc2_cache is not None:
+                fc2_cache[0.0] = fc2
+            freqs, weights = get_mesh_frequencies(aseatoms2phonoatoms(atoms), fc2, phonon_kwargs['phonon_supercell_matrix'],
+                                                  primitive_matrix=phonon_kwargs['primitive_matrix'],
+                                                  mesh=conf.get('imag_mesh', [8, 8, 8]))
+            record['fraction'] = fraction = imag_dos_frac(freqs, weights)
+            if fraction >= conf.get('imag_tol', 0.220):
+                record['reasons'].append(f'imaginary fraction {fraction:.3f} at e0.0')
+
+    if record['reasons']:
+        record['passed'] = False
+        log.warning(f'{suffix} rejected before FC2: {"; ".join(record["reasons"])}')
+        return [], record
+    return kept, record
+
+def interpolate_fc2(volumes, fcs, targets, order=2):
+    """
+    Element-wise polynomial fit of force constants in volume.
+
+    Parameters
+    ----------
+    volumes: (n_anchor,) volumes of the explicit FC2
+    fcs: (n_anchor, ...) explicit force constants
+    targets: (n_target,) volumes to interpolate at
+
+    Returns
+    -------
+    np.ndarray, shape (n_target, ...)
+    """
+    fcs = np.asarray(fcs)
+    shape = fcs.shape[1:]
+    order = min(order, len(volumes) - 1)
+    coeffs = np.polyfit(np.asarray(volumes, dtype=float), fcs.reshape(len(volumes), -1), deg=order)
+    fit = np.vander(np.asarray(targets, dtype=float), order + 1) @ coeffs
+    return fit.reshape((len(targets),) + shape)
+
+def interpolate_material(config, calc, cwd, strain_opt, strain_eps, eps_list, phonon_kwargs, suffix, mode, fc_calculator, check_dct,
+                         fc2_cache=None):
+    """
+    Explicit FC2 at the anchor and hold-out strains (taken from fc2_cache
+    where the gates already computed them), interpolated FC2 elsewhere.
+    Falls back to explicit FC2 for every strain when the hold-out frequency error exceeds the tolerance.
+    Returns the interpolation record, None if interpolation was not used.
+    """
+    conf = config['supercell']['interpolate']
+    anchors, holdout = conf['anchors'], conf['holdout']
+    index = {eps: i for i, eps in enumerate(strain_eps)}
+    if not all(eps in eps_list for eps in anchors + [holdout]):
+        log.warning(f'{suffix} anchor or hold-out strain missing .. computing every FC2 explicitly')
+        return None
+
+    fc2_cache = {} if fc2_cache is None else fc2_cache
+    for eps in anchors + [holdout]:
+        if eps not in fc2_cache:
+            fc2 = fc2_strain(config, calc, cwd, eps, strain_opt[index[eps]], phonon_kwargs, suffix, mode, fc_calculator, check_dct, load=True)
+            if fc2 is None:
+                return None
+            fc2_cache[eps] = fc2
+    fcs = [fc2_cache[eps] for eps in anchors]
+    fc2_holdout = fc2_cache[holdout]
+
+    volumes = [strain_opt[index[eps]].get_volume() for eps in anchors]
+    order = conf.get('order', 2)
+    fc2_fit = interpolate_fc2(volumes, fcs, [strain_opt[index[holdout]].get_volume()], order=order)[0]
+
+    unitcell = aseatoms2phonoatoms(strain_opt[index[holdout]])
+    kwargs = {'supercell_matrix': phonon_kwargs['phonon_supercell_matrix'],
+              'primitive_matrix': phonon_kwargs['primitive_matrix'],
+              'mesh': config['supercell'].get('check_mesh', [8, 8, 8])}
+    freqs, _ = get_mesh_frequencies(unitcell, fc2_fit, **kwargs)
+    freqs_ref, _ = get_mesh_frequencies(unitcell, fc2_holdout, **kwargs)
+    error = float(np.abs(freqs - freqs_ref).max())
+
+    record = {'anchors': anchors, 'holdout': holdout, 'order': order, 'max_freq_diff': error, 'interpolated': []}
+    if error > conf.get('tol', 0.05):
+        log.warning(f'{suffix} interpolated FC2 off by {error:.4f} THz at e{holdout} .. computing every FC2 explicitly')
+        record['fallback'] = True
+        return record
+
+    # explicit FC2 already at hand are not replaced by interpolated ones
+    targets = [eps for eps in eps_list if eps not in fc2_cache]
+    fit = interpolate_fc2(volumes, fcs, [strain_opt[index[eps]].get_volume() for eps in targets], order=order)
+    for eps, fc2 in zip(targets, fit):
+        get_writer().submit(ph_IO.write_FORCE_CONSTANTS, fc2, filename=f'{cwd}/FORCE_CONSTANTS_2ND_e{eps}')
+        record['interpolated'].append(eps)
+    log.info(f'{suffix} FC2 interpolated at {len(targets)} strains (hold-out error {error:.4f} THz)')
+    record['fallback'] = False
+    return record
+
+def supercell_material(config, calc, idx, _dct):
+    calc_tag = config['calculator']['tag']
+    base_dir = config['directory']['cwd']
+    suffix = _dct['suffix']
+    primitive_matrix = _dct.get('primitive_matrix', 'auto')
+
+    phonon_kwargs = {'primitive_matrix': primitive_matrix,
+        'supercell_matrix': np.diag(_dct['fc3_supercell']),
+        'phonon_supercell_matrix': np.diag(_dct['fc2_supercell'])}
+
+
+    strain_dir = f'{base_dir}/{suffix}/{config["strain"]["save"]}'
+    strain_dct_file = f'{strain_dir}/{calc_tag}-strain_dct-{suffix}.pkl'
+    strain_dct = loadMeta(strain_dct_file)
+    strain_opt = loadAtoms(f'{strain_dir}/{calc_tag}-strain_relax-{suffix}.extxyz')
+
+    cwd = os.path.join(base_dir,suffix,config['supercell']['save'])
+    os.makedirs(cwd, exist_ok=True)
+
+    mode, fc_calculator = get_fc2_mode(config)
+    check_dct = {}
+
+    strain_eps = material_eps(config, _dct)
+    eps_list = []
+    for eps in strain_eps:
+        if not strain_dct.get(f'e{eps}',None):
+            log.warning(f'Skipping {suffix} - e{eps} .. no meta data available')
+            continue
+        eps_list.append(eps)
+
+    # FC2 already computed for this material, by eps
+    fc2_cache = {}
+    gates = None
+    if config['supercell'].get('gates', {}).get('run'):
+        eps_list, gates = gate_material(config, calc, cwd, strain_opt, strain_eps, eps_list, phonon_kwargs, suffix, mode, fc_calculator, check_dct,
+                                        fc2_cache)
+
+    # strains relaxed to the same geometry share one FC2
+    eps_aliases = {}
+    dedup = config.get('dedup', {})
+    if dedup.get('run') and dedup.get('fc2', True) and len(eps_list) > 1:
+        tol = dedup.get('fc2_tol', 1e-3)
+        index = {eps: i for i, eps in enumerate(strain_eps)}
+        found = find_aliases([strain_opt[index[eps]] for eps in eps_list],
+                             dict(dedup, ltol=tol, stol=tol, angle_tol=0.1, scale=False))
+        eps_aliases = {eps_list[i]: eps_list[j] for i, j in found.items()}
+        if eps_aliases:
+            log.info(f'{suffix} strains {list(eps_aliases)} share the geometry of {list(eps_aliases.values())} .. one FC2 each')
+            eps_list = [eps for eps in eps_list if eps not in eps_aliases]
+
+    done = []
+    if config['supercell'].get('interpolate', {}).get('run'):
+        record = interpolate_material(config, calc, cwd, strain_opt, strain_eps, eps_list, phonon_kwargs, suffix, mode, fc_calculator, check_dct,
+                                      fc2_cache)
+        if record is not None:
+            dumpJSON(clean_for_json(record), f'{cwd}/fc2_interpolation.json')
+            if not record['fallback']:
+                done = record['interpolated']
+
+    for i, eps in enumerate(strain_eps):
+        if eps not in eps_list or eps in fc2_cache or eps in done:
+            continue
+        fc2_strain(config, calc, cwd, eps, strain_opt[i], phonon_kwargs, suffix, mode, fc_calculator, check_dct)
+
+    if eps_aliases:
+        get_writer().flush()
+        for eps, canonical in eps_aliases.items():
+            if os.path.isfile(f'{cwd}/FORCE_CONSTANTS_2ND_e{canonical}'):
+                shutil.copyfile(f'{cwd}/FORCE_CONSTANTS_2ND_e{canonical}', f'{cwd}/FORCE_CONSTANTS_2ND_e{eps}')
+        dumpJSON({f'e{eps}': f'e{canonical}' for eps, canonical in eps_aliases.items()}, f'{cwd}/fc2_aliases.json')
+
+    if check_dct:
+        dumpJSON(clean_for_json(check_dct), f'{cwd}/fc2_random_check.json')
+    empty_cuda_cache()
+    del strain_opt, strain_dct
+    gc.collect()
+    return gates
+
 def process_supercell(config, calc):
     calc_tag = config['calculator']['tag']
     base_dir = config['directory']['cwd']
@@ -59,53 +474,10 @@ def process_supercell(config, calc):
     desc = 'Phonon supercells'
 
     unit_dct_file = f'{base_dir}/{calc_tag}-unitcell.pkl'
-    unit_dct = loadPKL(unit_dct_file)
-
-    for idx, _dct in tqdm(unit_dct.items(), desc=desc):
-        suffix = _dct['suffix']
-        primitive_matrix = _dct.get('primitive_matrix', 'auto')
-
-        phonon_kwargs = {'primitive_matrix': primitive_matrix,
-            'supercell_matrix': np.diag(_dct['fc3_supercell']),
-            'phonon_supercell_matrix': np.diag(_dct['fc2_supercell'])}
-
-
-        strain_dir = f'{base_dir}/{suffix}/{config["strain"]["save"]}'
-        strain_dct_file = f'{strain_dir}/{calc_tag}-strain_dct-{suffix}.pkl'
-        strain_dct = loadPKL(strain_dct_file)
-        strain_opt = ase_IO.read(f'{strain_dir}/{calc_tag}-strain_relax-{suffix}.extxyz', index=':')
-
-        for i, eps in enumerate(config['strain']['eps']):
-            cwd = os.path.join(base_dir,suffix,config['supercell']['save'])
-            os.makedirs(cwd, exist_ok=True)
-            s_dct = strain_dct.get(f'e{eps}',None)
-
-            if not s_dct:
-                print(f'WARNING: Skipping {suffix} - e{eps} .. no meta data available')
-                continue
-            if config['supercell']['cont']: 
-                if os.path.isfile(f'{cwd}/FORCE_CONSTANTS_2ND_e{eps}'):
-                    # try:
-                        # ph_IO.parse_FORCE_CONSTANTS(f'{cwd}/FORCE_CONSTANTS_2ND_e{eps}')
-                    continue
-                    # except:
-                        # print(f'INFO: Re-calculating FC2 of {suffix}-e{eps}')
-
-            os.makedirs(f'{cwd}/e{eps}', exist_ok = True)
-            unitcell = aseatoms2phonoatoms(strain_opt[i])
-
-            phonon = Phono3py(unitcell=unitcell, **phonon_kwargs)
-            phonon.generate_fc2_displacements(distance=config['supercell']['distance'], is_plusminus=True,
-                random_seed=config['supercell']['random_seed'])
-
-            try:
-                phonon = calculate_fc2(config, cwd, eps, phonon, calc)
-                ph_IO.write_FORCE_CONSTANTS(phonon.fc2, filename=f'{cwd}/FORCE_CONSTANTS_2ND_e{eps}')
-            except Exception as exec:
-                print(f'ERROR: Exception {exec} occurred while calculating FC2 of {suffix}-e{eps}')
-            
-            del phonon
-            gc.collect()
-        torch.cuda.empty_cache()
-        del strain_opt, strain_dct
-        gc.collect()
+    unit_dct = loadMeta(unit_dct_file)
+
+    for idx, _dct in tqdm(ordered_items(config, unit_dct), desc=desc):
+        gates = supercell_material(config, calc, idx, _dct)
+        if gates is not None:
+            append_result(config, idx, 'gates', {'GATES': gates})
+    get_writer().flush()
@@ -2,12 +2,16 @@ import numpy as np
 import ase.io as ase_IO
 from copy import deepcopy
 import gc, os
-import torch
 from tqdm import tqdm
-from cte2bench.util.relax import get_relaxer
-from cte2bench.util.utils import get_spgnum, log_stats
+from cte2bench.util.relax import get_relaxer, step_summary
+from cte2bench.util.utils import get_spgnum, log_stats, empty_cuda_cache
 import sys
-from cte2bench.util.io import dumpPKL
+from cte2bench.util.io import dumpAtoms, dumpMeta, dumpJSON, clean_for_json
+from cte2bench.util.writer import get_writer
+from cte2bench.util.dedup import find_aliases, save_aliases, alias_file
+from cte2bench.calculator.pool import map_calc
+from cte2bench.structure.supercell import auto_fc2_supercell
+from cte2bench.util import log
 
 def enumerate_atoms(unitcell_dict, config):
     calc_tag = config['calculator']['tag']
@@ -18,71 +22,106 @@ def enumerate_atoms(unitcell_dict, config):
         atoms.info.update(_dct.copy())
         output_atoms.append(atoms)
     try:
-        ase_IO.write(f'{base_dir}/{calc_tag}-unitcell_relax.extxyz', output_atoms)
+        dumpAtoms(output_atoms, f'{base_dir}/{calc_tag}-unitcell_relax.extxyz', slim=config.get('io', {}).get('slim', False))
     except Exception as exec:
         print(f'Exception {exec} Occured While Saving Unitcell data')
 
+def material_suffix(idx, _dct):
+    return f"ID-{idx}_{_dct['material_id']}_{_dct['name']}_{_dct['symm.no']}"
+
+def relax_unitcell(calc, config, idx, atoms0):
+    calc_tag = config['calculator']['tag']
+    base_dir = config['directory']['cwd']
+    writer = get_writer()
+
+    atoms0.info['ID'] = f'ID-{idx}'
+    _dct = atoms0.info
+    suffix = material_suffix(idx, _dct)
+
+    cwd = os.path.join(base_dir, suffix, config["unitcell"]["save"])
+    os.makedirs(cwd, exist_ok = True)
+    logfile = f'{cwd}/{calc_tag}-unitcell0.log' 
+    
+    relaxer = get_relaxer(config, calc, opt_type='unitcell', logfile=logfile)
+    atoms = atoms0.copy()
+
+    if _dct.get('symm.no', get_spgnum(atoms)) == 186:
+        atoms.info['primitive_matrix'] = np.eye(3)
+
+    atoms = relaxer.update_atoms(atoms)
+    atoms.info['suffix'] = suffix
+    atoms.info['calc_tag'] = calc_tag
+    log_stats(config, atoms, task='unit')
+
+    atoms = relaxer.relax_atoms(atoms)
+    atoms = relaxer.update_atoms(atoms)
+    log_stats(config, atoms, task='unit', stat='relax')
+
+    steps = atoms.info['steps']
+    init_sgn = atoms.info['symm.no']
+    atoms.info['symm.no.unit'] = unit_sgn = get_spgnum(atoms)
+    force_conv = atoms.info['force_conv']
+    writer.submit(ase_IO.write, f'{cwd}/CONTCAR', atoms.copy(), format='vasp')
+
+    if steps >= config['opt']['unitcell']['steps'] or not force_conv:
+        atoms.info['unitcell.opt'] = False
+        log.warning(f'{suffix} unit cell relaxation did not reach convergence in {steps}')
+    else:
+        atoms.info['unitcell.opt'] = True
+
+    if init_sgn != unit_sgn:
+        atoms.info['unitcell.symm'] = False
+        log.warning(f'symmetry of {suffix} changed from {init_sgn} to {unit_sgn}')
+    else:
+        atoms.info['unitcell.symm'] = True
+
+    if config['supercell'].get('auto', {}).get('run'):
+        # later stages read fc2_supercell from the unit-cell pickle
+        n_sc, record = auto_fc2_supercell(config, calc, atoms, cwd, suffix)
+        atoms.info['fc2_supercell.input'] = _dct.get('fc2_supercell')
+        atoms.info['fc2_supercell.auto'] = record['min_length']
+        dumpJSON(clean_for_json(record), f'{cwd}/fc2_supercell_auto.json')
+        atoms.info['fc2_supercell'] = n_sc
+        log.info(f'{suffix} FC2 supercell {atoms.info["fc2_supercell.input"]} -> {n_sc}')
+
+    atoms.calc = None
+    del relaxer
+    gc.collect()
+    return atoms
+
 def process_unitcell(config, calc):
     calc_tag = config['calculator']['tag']
     base_dir = config['directory']['cwd']
     desc = 'Unit cell optimization'
-    print(f'INFO: relaxing unit cell with MLIP {calc_tag}')
+    log.info(f'relaxing unit cell with MLIP {calc_tag}')
     unitcell_dict = {}
+    writer = get_writer()
 
     input_atoms = ase_IO.read(config['directory']['input'], **config['directory']['load_args'])
-    
-    for idx, atoms0 in enumerate(tqdm(input_atoms, desc=desc)):
-        atoms0.info['ID'] = f'ID-{idx}'
-        _dct = atoms0.info
-        suffix = f"ID-{idx}_{_dct['material_id']}_{_dct['name']}_{_dct['symm.no']}"
-
-        unitcell_dict[idx] =  {}
-        unitcell_dict[idx].update(atoms0.info)
-        cwd = os.path.join(base_dir, suffix, config["unitcell"]["save"])
-        os.makedirs(cwd, exist_ok = True)
-        logfile = f'{cwd}/{calc_tag}-unitcell0.log' 
-        
-        relaxer = get_relaxer(config, calc, opt_type='unitcell', logfile=logfile)
-        atoms = atoms0.copy()
-
-        if _dct.get('symm.no', get_spgnum(atoms)) == 186:
-            atoms.info['primitive_matrix'] = np.eye(3)
-
-        atoms = relaxer.update_atoms(atoms)
-        atoms.info['suffix'] = suffix
-        atoms.info['calc_tag'] = calc_tag
-        log_stats(config, atoms, task='unit')
-
-        atoms = relaxer.relax_atoms(atoms)
-        atoms = relaxer.update_atoms(atoms)
-        log_stats(config, atoms, task='unit', stat='relax')
-
-        steps = atoms.info['steps']
-        init_sgn = atoms.info['symm.no']
-        atoms.info['symm.no.unit'] = unit_sgn = get_spgnum(atoms)
-        force_conv = atoms.info['force_conv']
-        ase_IO.write(f'{cwd}/CONTCAR', atoms, format='vasp')
-
-        if steps >= config['opt']['unitcell']['steps'] or not force_conv:
-            atoms.info['unitcell.opt'] = False
-            print(f'WARNING: {suffix} unit cell relaxation did not reach convergence in {steps}')
-        else:
-            atoms.info['unitcell.opt'] = True
-
-        if init_sgn != unit_sgn:
-            atoms.info['unitcell.symm'] = False
-            print(f'WARNING: symmetry of {suffix} changed from {init_sgn} to {unit_sgn}')
-        else:
-            atoms.info['unitcell.symm'] = True
 
+    # equivalent inputs are relaxed once, later stages only see the canonical one
+    aliases = {}
+    if config.get('dedup', {}).get('run'):
+        aliases = find_aliases(input_atoms, config['dedup'])
+        save_aliases(config, {idx: {'alias_of': canonical, 'suffix': material_suffix(idx, input_atoms[idx].info)}
+                              for idx, canonical in aliases.items()})
+        log.info(f'{len(aliases)} of {len(input_atoms)} input structures are duplicates')
+    elif os.path.isfile(alias_file(config)):
+        os.remove(alias_file(config))
+
+    tasks = [(config, idx, atoms0) for idx, atoms0 in enumerate(input_atoms) if idx not in aliases]
+    relaxed = map_calc(calc, relax_unitcell, tasks, desc=desc)
+    if (summary := step_summary(relaxed)) is not None:
+        log.info(f'unit cells: {summary["pre"]} pre-relaxer steps, {summary["final"]} production steps ({summary["n"]} relaxations)')
+    for (_, idx, _), atoms in zip(tasks, relaxed):
+        unitcell_dict[idx] = {}
         unitcell_dict[idx].update(atoms.info)
-        atoms.calc = None
-        del relaxer
-        gc.collect()
  
-    dumpPKL(unitcell_dict, filename=f'{base_dir}/{calc_tag}-unitcell.pkl')
+    dumpMeta(unitcell_dict, f'{base_dir}/{calc_tag}-unitcell.pkl', slim=config.get('io', {}).get('slim', False))
 
+    # CONTCARs are read back by enumerate_atoms
+    writer.flush()
     enumerate_atoms(unitcell_dict, config)
     del input_atoms
     gc.collect()
-    torch.cuda.empty_cache()
+    empty_cuda_cache()
@@ -1,3 +1,4 @@
+import contextlib
 import numpy as np
 from tqdm import tqdm
 import time
@@ -5,6 +6,9 @@ from datetime import datetime
 
 from ase.calculators.singlepoint import SinglePointCalculator
 
+from cte2bench.calculator.pool import CalcPool
+from cte2bench.calculator.graph import graph_reuse
+
 def calc_from_py(script): # TODO
     import importlib.util
     from pathlib import Path
@@ -41,8 +45,31 @@ def single_point_calculate(atoms, calc):
     return new_atoms
 
 
-def single_point_calculate_list(atoms_list, calc, desc=None):
-    calculated = []
+def _single_point(calc, atoms, reuse_graph=False):
+    if reuse_graph:
+        with graph_reuse(calc):
+            return single_point_calculate(atoms, calc)
+    return single_point_calculate(atoms, calc)
+
+def _single_point_iter(atoms_list, calc, desc=None):
     for atoms in tqdm(atoms_list, desc=desc, leave=False):
-        calculated.append(single_point_calculate(atoms, calc))
+        yield single_point_calculate(atoms, calc)
+
+def single_point_calculate_list(atoms_list, calc, desc=None, callback=None, reuse_graph=False):
+    """
+    callback(i, atoms) is called as soon as the i-th result is available.
+    reuse_graph: atoms_list are small displacements of one structure, so a
+    GraphReuseCalculator may keep its neighbour list across them
+    """
+    if isinstance(calc, CalcPool):
+        results = calc.imap(_single_point, [(atoms, reuse_graph) for atoms in atoms_list], desc=desc)
+    else:
+        results = _single_point_iter(atoms_list, calc, desc=desc)
+
+    calculated = []
+    with graph_reuse(calc) if reuse_graph else contextlib.nullcontext():
+        for i, atoms in enumerate(results):
+            if callback is not None:
+                callback(i, atoms)
+            calculated.append(atoms)
     return calculated
@@ -0,0 +1,108 @@
+"""
+Equivalent-structure detection.
+
+    dedup:
+        run: false
+        symprec: 1.0e-02   # spglib tolerance of the hash
+        ltol: 0.2          # StructureMatcher tolerances
+        stol: 0.3
+        angle_tol: 5.0
+        scale: true        # input structures: match up to a volume change
+        fc2: true          # strains relaxed to the same geometry share one FC2
+        fc2_tol: 1.0e-03   # ltol / stol of that comparison, no volume scaling
+
+Structures are bucketed by a hash of their spglib symmetry (space group and
+the Wyckoff letters per element, reduced to the primitive cell) and only
+compared within a bucket by pymatgen's StructureMatcher. The first structure
+of each equivalence class is computed; the others are aliases whose results
+are copied from it when the results store is compacted.
+"""
+
+import os
+import hashlib
+from copy import deepcopy
+from collections import Counter
+from math import gcd
+from functools import reduce
+
+import spglib
+
+from cte2bench.util.io import loadJSON, dumpJSON
+
+
+def structure_hash(atoms, symprec=1e-2):
+    """sha1 of the space group and Wyckoff occupation, independent of the cell setting"""
+    cell = (atoms.get_cell()[:], atoms.get_scaled_positions(), atoms.get_atomic_numbers())
+    dataset = spglib.get_symmetry_dataset(cell, symprec=symprec)
+    if dataset is None:
+        number, sites = 0, Counter((int(z), '') for z in atoms.get_atomic_numbers())
+    else:
+        number, sites = dataset.number, Counter(zip((int(z) for z in atoms.get_atomic_numbers()), dataset.wyckoffs))
+    # a supercell of the same crystal occupies the same sites more often
+    n = reduce(gcd, sites.values())
+    key = f'{number}|' + ','.join(f'{z}{w}{c // n}' for (z, w), c in sorted(sites.items()))
+    return hashlib.sha1(key.encode()).hexdigest()
+
+
+def get_matcher(conf):
+    from pymatgen.analysis.structure_matcher import StructureMatcher
+    return StructureMatcher(ltol=conf.get('ltol', 0.2), stol=conf.get('stol', 0.3), angle_tol=conf.get('angle_tol', 5.0),
+                            primitive_cell=True, scale=conf.get('scale', True))
+
+
+def find_aliases(atoms_list, conf):
+    """
+    Returns {position: position of its canonical structure} for every
+    structure equivalent to an earlier one in atoms_list.
+    """
+    from pymatgen.io.ase import AseAtomsAdaptor
+
+    matcher = get_matcher(conf)
+    structures = {}
+
+    def _structure(i):
+        if i not in structures:
+            structures[i] = AseAtomsAdaptor.get_structure(atoms_list[i])
+        return structures[i]
+
+    buckets = {}
+    aliases = {}
+    for i, atoms in enumerate(atoms_list):
+        bucket = buckets.setdefault(structure_hash(atoms, conf.get('symprec', 1e-2)), [])
+        for j in bucket:
+            if matcher.fit(_structure(j), _structure(i)):
+                aliases[i] = j
+                break
+        else:
+            bucket.append(i)
+    return aliases
+
+
+def alias_file(config):
+    return f'{config["directory"]["cwd"]}/{config["calculator"]["tag"]}_aliases.json'
+
+
+def save_aliases(config, aliases):
+    """aliases: {idx: {'alias_of': canonical idx, 'suffix': suffix of the alias}}"""
+    dumpJSON({str(k): v for k, v in aliases.items()}, alias_file(config))
+
+
+def load_aliases(config):
+    if not os.path.isfile(alias_file(config)):
+        return {}
+    return loadJSON(alias_file(config))
+
+
+def fan_out(RESULTS, aliases):
+    """copy every canonical material's results to its aliases, under their own identity"""
+    for idx, entry in aliases.items():
+        canonical = str(entry['alias_of'])
+        if canonical not in RESULTS:
+            continue
+        record = deepcopy(RESULTS[canonical])
+        record['ALIAS_OF'] = canonical
+        if 'ID' in record:
+            ID, mp, name, symm = entry['suffix'].split('_')
+            record.update({'ID': ID, 'mp-id': mp, 'name': name, 'symm.no': symm})
+        RESULTS[str(idx)] = record
+    return RESULTS
@@ -46,6 +46,120 @@ def loadPKL(path):
     return data
 
 
+# compact metadata schema: scalars and flags stay in atoms.info / the pickle,
+# arrays (forces, stresses, ...) are stored once in a binary .npz side store
+SIDE_KEYS = ('force', 'stress')
+SEP = '__'
+
+def side_file(filename):
+    return f'{os.path.splitext(filename)[0]}.npz'
+
+def flatten_info(info, prefix=''):
+    """nested dicts (timings) to SEP-joined scalar keys"""
+    flat = {}
+    for k, v in info.items():
+        key = f'{prefix}{SEP}{k}' if prefix else k
+        if isinstance(v, dict):
+            flat.update(flatten_info(v, key))
+        else:
+            flat[key] = v
+    return flat
+
+def unflatten_info(info):
+    nested = {}
+    for k, v in info.items():
+        if SEP not in k:
+            nested[k] = v
+            continue
+        *parents, leaf = k.split(SEP)
+        d = nested
+        for p in parents:
+            d = d.setdefault(p, {})
+        d[leaf] = v
+    return nested
+
+def slim_info(info):
+    """
+    Returns
+    -------
+    info : dict, scalars, short lists and small (<= 3x3) arrays only
+    arrays : dict, everything moved to the side store
+    """
+    info, arrays = flatten_info(info), {}
+    for k in list(info.keys()):
+        v = info[k]
+        if k in SIDE_KEYS or (isinstance(v, np.ndarray) and v.size > 9):
+            arrays[k] = np.asarray(info.pop(k))
+    return info, arrays
+
+def _attach(info, arrays, key):
+    prefix = f'{key}/'
+    for name in arrays.files:
+        if name.startswith(prefix):
+            info[name[len(prefix):]] = arrays[name]
+    return unflatten_info(info)
+
+def _drop_side_file(filename):
+    # a stale side store would be re-attached on load
+    if os.path.isfile(side_file(filename)):
+        os.remove(side_file(filename))
+
+def dumpAtoms(atoms_list, filename, slim=False, format='extxyz'):
+    from ase.io import write
+    _drop_side_file(filename)
+    if not slim:
+        write(filename, atoms_list, format=format)
+        return
+
+    arrays, output = {}, []
+    for i, atoms in enumerate(atoms_list):
+        atoms = atoms.copy()
+        atoms.info, arr = slim_info(atoms.info)
+        arrays.update({f'{i}/{k}': v for k, v in arr.items()})
+        output.append(atoms)
+    write(filename, output, format=format)
+    if arrays:
+        np.savez(side_file(filename), **arrays)
+
+def loadAtoms(filename, index=':'):
+    """reads both the slim schema and files written before it"""
+    from ase.io import read
+    atoms_list = read(filename, index=':')
+    if os.path.isfile(side_file(filename)):
+        with np.load(side_file(filename)) as arrays:
+            for i, atoms in enumerate(atoms_list):
+                atoms.info = _attach(atoms.info, arrays, i)
+    else:
+        for atoms in atoms_list:
+            atoms.info = unflatten_info(atoms.info)
+    if isinstance(index, int):
+        return atoms_list[index]
+    return atoms_list
+
+def dumpMeta(data, filename, slim=False):
+    _drop_side_file(filename)
+    if not slim:
+        dumpPKL(data, filename)
+        return
+
+    arrays, output = {}, {}
+    for key, info in data.items():
+        output[key], arr = slim_info(info)
+        arrays.update({f'{key}/{k}': v for k, v in arr.items()})
+    dumpPKL(output, filename)
+    if arrays:
+        np.savez(side_file(filename), **arrays)
+
+def loadMeta(filename):
+    data = loadPKL(filename)
+    if os.path.isfile(side_file(filename)):
+        with np.load(side_file(filename)) as arrays:
+            data = {key: _attach(info, arrays, key) for key, info in data.items()}
+    else:
+        data = {key: unflatten_info(info) for key, info in data.items()}
+    return data
+
+
 def dict_representer(dumper, data=None):
     return dumper.represent_mapping(yaml.resolver.BaseResolver.DEFAULT_MAPPING_TAG, data, flow_style=False)
 
@@ -0,0 +1,119 @@
+"""
+Levelled console messages and a buffered stats sink.
+
+    logging:
+        level: info         # debug, info, warning, error
+        stats_format: csv   # csv ({tag}_stats.log) or jsonl ({tag}_stats.jsonl)
+        stats_batch: 100    # stats rows held in memory before one append
+        opt_log_every: 0    # optimizer log every n steps, 0 = off
+
+Messages keep the 'INFO: ...' / 'WARNING: ...' form of the stages. Stats rows
+are buffered and appended in batches through the background writer; the
+buffer is flushed at exit, also in calculator pool workers.
+"""
+
+import os
+import json
+import atexit
+import multiprocessing.util
+
+from cte2bench.util.writer import get_writer, append_line
+
+LEVELS = {'debug': 10, 'info': 20, 'warning': 30, 'error': 40}
+
+STATS_HEADER = 'ID,MP-ID,NAME,TASK,EPSILON,DISP,TYPE,STEPS,FORCE_CONV,WALL_I,WALL_F,SYMM,NATOM,ENERGY,VOLUME,A,B,C,ALPHA,BETA,GAMMA'
+
+_LEVEL = LEVELS['info']
+
+
+def set_level(level):
+    global _LEVEL
+    _LEVEL = LEVELS[level.lower()]
+
+
+def enabled(level):
+    return LEVELS[level] >= _LEVEL
+
+
+def _emit(level, msg):
+    if enabled(level):
+        print(f'{level.upper()}: {msg}')
+
+
+def debug(msg):
+    _emit('debug', msg)
+
+
+def info(msg):
+    _emit('info', msg)
+
+
+def warning(msg):
+    _emit('warning', msg)
+
+
+def error(msg):
+    _emit('error', msg)
+
+
+def stats_file(config):
+    conf = config.get('logging', {})
+    ext = 'jsonl' if conf.get('stats_format', 'csv') == 'jsonl' else 'log'
+    return f'{config["directory"]["cwd"]}/{config["calculator"]["tag"]}_stats.{ext}'
+
+
+class StatsSink:
+    """rows of one stats file, appended `batch` at a time"""
+    def __init__(self, filename, fmt='csv', batch=100):
+        self.filename = filename
+        self.fmt = fmt
+        self.batch = batch
+        self._rows = []
+
+    def add(self, stat_dct):
+        if self.fmt == 'jsonl':
+            self._rows.append(json.dumps(stat_dct, default=str))
+        else:
+            self._rows.append(','.join(str(v) for v in stat_dct.values()))
+        if len(self._rows) >= self.batch:
+            self.flush()
+
+    def flush(self):
+        if not self._rows:
+            return
+        lines, self._rows = ''.join(f'{row}\n' for row in self._rows), []
+        get_writer().submit(append_line, self.filename, lines)
+
+
+_SINKS = {}
+
+
+def get_sink(config):
+    filename = config['directory']['logfile']
+    if filename not in _SINKS:
+        conf = config.get('logging', {})
+        _SINKS[filename] = StatsSink(filename, fmt=conf.get('stats_format', 'csv'), batch=conf.get('stats_batch', 100))
+    return _SINKS[filename]
+
+
+def flush_stats():
+    for sink in _SINKS.values():
+        sink.flush()
+    get_writer().flush()
+
+
+def init_logging(config):
+    """level from config, stats file created with its header unless a previous run did"""
+    conf = config.get('logging', {})
+    set_level(conf.get('level', 'info'))
+    filename = config['directory']['logfile']
+    if os.path.isfile(filename) and os.path.getsize(filename):
+        return
+    with open(filename, 'w') as f:
+        if conf.get('stats_format', 'csv') != 'jsonl':
+            f.write(f'{STATS_HEADER}\n')
+
+
+atexit.register(flush_stats)
+# forked workers leave through os._exit, which skips atexit; a second flush finds nothing to write
+multiprocessing.util.Finalize(None, flush_stats, exitpriority=10)
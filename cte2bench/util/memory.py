@@ -0,0 +1,133 @@
+import numpy as np
+from cte2bench.util import log
+
+GB = 1024**3
+
+FLOAT, COMPLEX = 8, 16
+
+
+def _natoms_supercell(natoms, supercell):
+    return int(round(natoms * abs(np.linalg.det(np.diag(supercell) if np.ndim(supercell) == 1 else supercell))))
+
+
+def count_fc2_displacements(atoms, _dct, config):
+    """number of displaced FC2 supercells phonopy will generate (symmetry only, no calculator)"""
+    from phonopy import Phonopy
+    from cte2bench.util.utils import aseatoms2phonoatoms
+
+    phonon = Phonopy(aseatoms2phonoatoms(atoms),
+                     supercell_matrix=_dct['fc2_supercell'],
+                     primitive_matrix=_dct.get('primitive_matrix', 'auto'))
+    phonon.generate_displacements(distance=config['supercell']['distance'], is_plusminus=True)
+    return len(phonon.dataset['first_atoms'])
+
+
+def estimate_memory(config, _dct, atoms, lean=None):
+    """
+    Rough per-material peak memory in bytes, from atom, displacement and q-point counts.
+
+    Parameters
+    ----------
+    config: dict
+        parsed config; reads config['memory'] and config['strain']
+    _dct: dict
+        unit-cell info (fc2_supercell, fc3_supercell, primitive_matrix, q_point_mesh)
+    atoms: ase.Atoms
+        relaxed unit cell
+    lean: bool | None
+        mesh without eigenvectors / group velocities; defaults to _dct['lean_mesh']
+
+    Returns
+    -------
+    dict
+        'calc': producer side (FC2 supercells + model), 'post': worker side (mesh + thermal),
+        plus the counts used for the estimate
+    """
+    conf = config.get('memory', {})
+    if lean is None:
+        lean = _dct.get('lean_mesh', False)
+
+    natoms = len(atoms)
+    n_prim = natoms / abs(np.linalg.det(np.asarray(_dct.get('primitive_matrix', np.eye(3)), dtype=float)))
+    n_fc2 = _natoms_supercell(natoms, _dct['fc2_supercell'])
+    # Phono3py builds the FC3 supercell even when only FC2 is computed
+    n_fc3 = _natoms_supercell(natoms, _dct.get('fc3_supercell', _dct['fc2_supercell']))
+
+    if conf.get('count_displacements', True):
+        n_disp = count_fc2_displacements(atoms, _dct, config)
+    else:
+        # upper bound: +- along x, y, z for every atom
+        n_disp = 6 * natoms
+
+    # positions, forces, result atoms and saved forces of every displaced supercell
+    structures = (n_fc2 + n_fc3) * 3 * FLOAT * 4 + n_disp * n_fc2 * 3 * FLOAT * 4
+    fc2 = n_fc2 * n_fc2 * 9 * FLOAT
+    model = n_fc2 * conf.get('bytes_per_atom', 5.0e+5)
+
+    n_q = int(np.prod(_dct.get('q_point_mesh', [19, 19, 19])))
+    n_b = int(round(3 * n_prim))
+    mesh = n_q * n_b * FLOAT
+    if not lean:
+        mesh += n_q * n_b * n_b * COMPLEX + n_q * n_b * 3 * FLOAT
+
+    return {'natoms': natoms, 'n_fc2': n_fc2, 'n_fc3': n_fc3, 'n_disp': n_disp,
+            'n_q': n_q, 'n_bands': n_b, 'lean': lean,
+            'calc': int(structures + fc2 + model),
+            'post': int(fc2 + mesh)}
+
+
+def get_budget(config):
+    """RAM budget in bytes, None if unbounded"""
+    budget = config.get('memory', {}).get('budget')
+    return None if not budget else budget * GB
+
+
+def fit_budget(config, _dct, atoms):
+    """
+    Degrade a material until its post-processing fits in the budget.
+
+    Sets _dct['lean_mesh'] when the full mesh does not fit and returns the
+    estimate together with whether the material must run alone.
+    """
+    budget = get_budget(config)
+    est = estimate_memory(config, _dct, atoms)
+    if budget is None:
+        return est, False
+
+    if est['post'] > budget and not est['lean']:
+        log.warning(f'{_dct["suffix"]} mesh needs {est["post"]/GB:.1f} GB, falling back to lean mesh')
+        _dct['lean_mesh'] = True
+        est = estimate_memory(config, _dct, atoms)
+
+    alone = max(est['calc'], est['post']) > budget
+    if alone:
+        log.warning(f'{_dct["suffix"]} estimated at {max(est["calc"], est["post"])/GB:.1f} GB '
+              f'exceeds budget {budget/GB:.1f} GB .. running it alone')
+    return est, alone
+
+
+class MemoryScheduler:
+    """
+    Book-keeping of reserved memory against a fixed budget.
+
+    A reservation larger than the whole budget is still admitted when nothing
+    else is reserved, so oversized work runs alone instead of never running.
+    """
+    def __init__(self, budget=None):
+        self.budget = budget
+        self.reserved = {}
+
+    @property
+    def used(self):
+        return sum(self.reserved.values())
+
+    def fits(self, nbytes):
+        if self.budget is None or not self.reserved:
+            return True
+        return self.used + nbytes <= self.budget
+
+    def reserve(self, key, nbytes):
+        self.reserved[key] = nbytes
+
+    def release(self, key):
+        self.reserved.pop(key, None)
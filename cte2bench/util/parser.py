@@ -1,11 +1,13 @@
 import os
 import argparse
 
+from cte2bench.util import log
+
 def parse_args(argv: list[str]| None=None):
     parser = argparse.ArgumentParser(description= "cli tool")
 
     parser.add_argument('--task', type=str, default='all',
-            help= 'relax, fc2, phonon, gpu, cpu, qha etc')
+            help= 'relax, fc2, phonon, gpu, cpu, qha, gruneisen, plan, serve, submit etc')
 
     parser.add_argument('--config', type=str, default='./config.yaml', 
             help='config yaml file directory')
@@ -19,6 +21,9 @@ def parse_args(argv: list[str]| None=None):
     parser.add_argument('--modal', type=str, default='omat24',
             help='mpa, omat24, matpes_pbe, mp_r2scan, matpes_r2scan')
 
+    parser.add_argument('--socket', type=str, default=f'/tmp/cte2bench-{os.getuid()}.sock',
+            help='unix socket of the persistent server (--task serve / submit)')
+
     return parser.parse_args(argv)
 
 def overwrite_default(config, argv: list[str] | None=None):
@@ -43,13 +48,7 @@ def overwrite_default(config, argv: list[str] | None=None):
 
     config['directory']['cwd'] = os.path.abspath(config['directory']['prefix'])
     os.makedirs(config['directory']['cwd'], exist_ok = True)
-    config['directory']['logfile'] = f'{config["directory"]["cwd"]}/{tag}_stats.log'
-    if os.path.isfile(config['directory']['logfile']):
-        logfile = open(config['directory']['logfile'], 'a')
-    else:
-        logfile = open(config['directory']['logfile'], 'w')
-    logfile.write(f'ID,MP-ID,NAME,TASK,EPSILON,DISP,TYPE,STEPS,FORCE_CONV,WALL_I,WALL_F,SYMM,NATOM,ENERGY,VOLUME,A,B,C,ALPHA,BETA,GAMMA\n')
-    logfile.close()
+    config['directory']['logfile'] = log.stats_file(config)
     config['calculator']['calc_args']['modal'] = args.modal.lower()
     # TODO: enable flash if avail
     return config
@@ -71,6 +70,14 @@ def check_strain_config(config):
         assert os.path.isfile(conf['load'])
     if conf.get('load_opt'):
         assert os.path.isfile(conf['load_opt'])
+    adaptive = conf.get('adaptive', {})
+    if adaptive.get('run'):
+        lo, hi = adaptive.get('bounds', [-0.05, 0.08])
+        assert lo < hi and all(lo <= eps <= hi for eps in adaptive.get('initial', [-0.02, -0.01, 0.0, 0.01, 0.02]))
+        assert adaptive.get('step', 0.01) > 0
+        assert 4 <= adaptive.get('min_points', 5) <= adaptive.get('max_points', 9)
+        assert isinstance(adaptive.get('add_per_iter', 2), int) and adaptive.get('add_per_iter', 2) > 0
+        assert not config.get('pipeline', {}).get('run'), 'strain.adaptive does not run in the pipeline'
 
 def check_supercell_config(config):
     conf = config['supercell']
@@ -78,12 +85,60 @@ def check_supercell_config(config):
     if conf.get('load'):
         assert os.path.isfile(conf['load'])
     assert isinstance(conf['distance'], float)
+    assert conf.get('fc2_mode', 'systematic') in ['systematic', 'random']
+    if conf.get('fc2_mode') == 'random':
+        assert isinstance(conf['n_random'], int) and conf['n_random'] > 0
+    if conf.get('interpolate', {}).get('run'):
+        interp = conf['interpolate']
+        assert len(interp['anchors']) >= 2
+        assert interp['holdout'] not in interp['anchors']
+        for eps in interp['anchors'] + [interp['holdout']]:
+            assert eps in config['strain']['eps'], f'interpolation strain {eps} not in strain.eps'
+    if conf.get('auto', {}).get('run'):
+        auto = conf['auto']
+        assert isinstance(auto.get('min_length', 10.0), (int, float)) and auto.get('min_length', 10.0) > 0
+        assert isinstance(auto.get('check'), (type(None), bool))
+        assert auto.get('step', 3.0) > 0
+    if conf.get('gates', {}).get('run'):
+        gates = conf['gates']
+        for key in ['symm', 'vol', 'eos', 'imag']:
+            assert isinstance(gates.get(key), (type(None), bool))
+        assert gates.get('min_points', 5) >= 4
+        assert gates.get('eos_tol', 1e-3) > 0 and 0 < gates.get('imag_tol', 0.22) <= 1
     # assert isinstance(conf.get('symm_fc2'), (bool, int))
 
+def check_fc3_config(config):
+    conf = config.get('fc3', {})
+    if not conf.get('run'):
+        return
+    for eps in conf.get('eps', [0.0]):
+        assert eps in config['strain']['eps'], f'fc3 strain {eps} not in strain.eps'
+    if conf.get('cutoff_pair_distance') is not None:
+        assert isinstance(conf['cutoff_pair_distance'], (int, float)) and conf['cutoff_pair_distance'] > 0
+    assert isinstance(conf.get('batch_size', 64), int) and conf.get('batch_size', 64) > 0
+    assert isinstance(conf.get('n_shards', 1), int) and 0 <= conf.get('shard', 0) < conf.get('n_shards', 1)
+
+def check_gruneisen_config(config):
+    conf = config.get('gruneisen', {})
+    assert isinstance(conf.get('run'), (type(None), bool))
+    assert 0 < conf.get('delta', 0.005) < 0.05
+    if conf.get('mesh'):
+        assert len(conf['mesh']) == 3
+
+def check_anisotropic_config(config):
+    conf = config.get('anisotropic', {})
+    assert isinstance(conf.get('run'), (type(None), bool))
+    assert 0 < conf.get('delta', 0.01) < 0.05
+    if conf.get('mesh'):
+        assert len(conf['mesh']) == 3
+
 def check_harmonic_config(config):
     conf = config['harmonic']
     for run in ['run_mesh', 'run_thermal', 'run_dos', 'run_band']:
         assert isinstance(conf.get(run), (type(None), bool))
+    assert conf.get('thermo_engine', 'phonopy') in ['phonopy', 'numpy']
+    if conf.get('thermo_chunk'):
+        assert isinstance(conf['thermo_chunk'], int) and conf['thermo_chunk'] > 0
 
     for load in ['load_thermal']:
         if conf.get('load'):
@@ -98,29 +153,110 @@ def check_qha_config(config):
     conf = config['qha']
     assert isinstance(conf.get('run'), (type(None), bool))
     assert conf['eos'] in ['birch', 'vinet', 'birch_murnaghan']
+    for t in conf.get('temperatures', []):
+        assert isinstance(t, (int, float)) and t <= conf['t_max']
+    boot = conf.get('bootstrap', {})
+    if boot.get('run'):
+        assert boot.get('mode', 'resample') in ['resample', 'subsets']
+        assert isinstance(boot.get('n_samples', 500), int) and boot.get('n_samples', 500) > 0
+        assert 0 < boot.get('ci', 0.95) < 1
+        assert boot.get('min_points', 5) >= 4
     
     if conf.get('thin_number'):
         assert isinstance(conf['thin_number'], (int, float))
     elif conf.get('spares'):
         assert isinstance(conf['sparse'], (int, float))
     else:
-        print("WARNING: your QHA plot's going to look like rubbish")
+        log.warning("your QHA plot's going to look like rubbish")
 
 def check_calc_config(config):
     conf = config['calculator']
+    pool = conf.get('pool', {})
+    for key in ['workers', 'threads']:
+        if pool.get(key):
+            assert isinstance(pool[key], int) and pool[key] > 0
+    assert isinstance(pool.get('affinity'), (type(None), bool))
+    reuse = conf.get('graph_reuse', {})
+    if reuse.get('run'):
+        assert reuse.get('skin', 0.1) > 2 * config['supercell']['distance'], 'graph_reuse.skin must exceed twice supercell.distance'
+        assert isinstance(reuse.get('check', 3), int)
+    pre = conf.get('pre', {})
+    if pre.get('run'):
+        assert pre.get('fmax', 1e-2) > 0
+        for opt_type in pre.get('opt_types', ['unitcell', 'strain']):
+            assert opt_type in config['opt'], f'calculator.pre.opt_types: no opt.{opt_type}'
+        if pre.get('calc', conf['calc']).lower() in ['sevennet', 'seven', 'sevenn', '7net']:
+            assert os.path.isfile(pre.get('path', conf['path']))
     if conf['calc'].lower() in ['sevennet', 'seven', 'sevenn', '7net']:
         assert os.path.isfile(conf['path'])
 
+def check_io_config(config):
+    conf = config.get('io', {})
+    assert isinstance(conf.get('async'), (type(None), bool))
+    assert isinstance(conf.get('slim'), (type(None), bool))
+    if conf.get('queue_size'):
+        assert isinstance(conf['queue_size'], int) and conf['queue_size'] > 0
+
+def check_pipeline_config(config):
+    conf = config.get('pipeline', {})
+    assert isinstance(conf.get('run'), (type(None), bool))
+    for key in ['workers', 'max_inflight']:
+        if conf.get(key):
+            assert isinstance(conf[key], int) and conf[key] > 0
+
+def check_memory_config(config):
+    conf = config.get('memory', {})
+    for key in ['budget', 'bytes_per_atom']:
+        if conf.get(key):
+            assert isinstance(conf[key], (int, float)) and conf[key] > 0
+    assert isinstance(conf.get('count_displacements'), (type(None), bool))
+
+def check_plan_config(config):
+    conf = config.get('plan', {})
+    for key in ['sec_per_atom_call', 'relax_steps', 'sec_per_band3']:
+        if conf.get(key):
+            assert isinstance(conf[key], (int, float)) and conf[key] > 0
+    for key in ['calibrate', 'order']:
+        assert isinstance(conf.get(key), (type(None), bool))
+
+def check_dedup_config(config):
+    conf = config.get('dedup', {})
+    assert isinstance(conf.get('run'), (type(None), bool))
+    for key in ['symprec', 'ltol', 'stol', 'angle_tol', 'fc2_tol']:
+        if conf.get(key) is not None:
+            assert isinstance(conf[key], (int, float)) and conf[key] > 0
+    for key in ['scale', 'fc2']:
+        assert isinstance(conf.get(key), (type(None), bool))
+
+def check_logging_config(config):
+    conf = config.get('logging', {})
+    assert conf.get('level', 'info') in log.LEVELS
+    assert conf.get('stats_format', 'csv') in ['csv', 'jsonl']
+    for key in ['stats_batch', 'opt_log_every']:
+        if conf.get(key) is not None:
+            assert isinstance(conf[key], int) and conf[key] >= 0
+    assert conf.get('stats_batch', 100) > 0
+
 def parse_config(config, argv: list[str] | None=None):
     config = overwrite_default(config, argv)
 
     check_dir_config(config)
+    check_logging_config(config)
+    log.init_logging(config)
+    check_io_config(config)
     check_calc_config(config)
 
+    check_dedup_config(config)
     check_unitcell_config(config)
     check_strain_config(config)
     check_supercell_config(config)
+    check_fc3_config(config)
+    check_gruneisen_config(config)
+    check_anisotropic_config(config)
     check_harmonic_config(config)
     check_qha_config(config)
+    check_pipeline_config(config)
+    check_memory_config(config)
+    check_plan_config(config)
 
     return config
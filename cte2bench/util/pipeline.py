@@ -0,0 +1,118 @@
+import gc
+import multiprocessing as mp
+from concurrent.futures import ProcessPoolExecutor, wait, FIRST_COMPLETED
+
+from tqdm import tqdm
+
+from cte2bench.util.io import loadAtoms, loadMeta, clean_for_json
+from cte2bench.util.results import append_result, compact_results, load_results
+from cte2bench.util.memory import MemoryScheduler, fit_budget, get_budget
+from cte2bench.util.writer import get_writer
+from cte2bench.util import log
+
+
+def postprocess_material(config, idx, _dct):
+    """
+    Phonopy-only part of the workflow for one material (mesh, thermal, QHA).
+    Runs in a CPU worker process, so it must not touch the calculator.
+    """
+    from cte2bench.phonon.harmonic import harmonic_material
+    from cte2bench.phonon.qha import qha_material
+
+    stage = 'harmonic' if config['harmonic']['run'] else 'qha'
+    if config['harmonic']['run']:
+        results = harmonic_material(config, idx, _dct)
+        get_writer().flush()
+    else:
+        results = load_results(config).get(str(idx), {})
+    if config['qha']['run']:
+        out = qha_material(config, idx, _dct, clean_for_json(results))
+        if out is not None:
+            results = out
+    return idx, stage, clean_for_json(results)
+
+
+def _collect(done, pending, config, scheduler):
+    for future in done:
+        suffix = pending.pop(future)
+        scheduler.release(suffix)
+        try:
+            idx, stage, results = future.result()
+            append_result(config, idx, stage, results)
+        except Exception as exc:
+            log.error(f'Exception {exc} occurred while post-processing {suffix}')
+
+
+def process_pipeline(config, calc):
+    """
+    Producer/consumer scheduler over materials.
+
+    The main process keeps the calculator busy with the strain relaxations and
+    FC2 displacements of one material after another, and hands every material
+    whose FC2 set is complete to a pool of CPU workers for the harmonic and
+    QHA stages. At most `pipeline.max_inflight` materials wait in the pool, so
+    the producer blocks instead of piling up finished FC2 sets.
+
+    With `memory.budget` set, the estimated post-processing memory of queued
+    materials plus the FC2 memory of the material being produced is kept under
+    the budget; oversized materials get a lean mesh or run alone.
+    """
+    from cte2bench.structure.strain import strain_material
+    from cte2bench.structure.supercell import supercell_material
+
+    conf = config['pipeline']
+    calc_tag = config['calculator']['tag']
+    base_dir = config['directory']['cwd']
+    writer = get_writer()
+
+    unit_dct = loadMeta(f'{base_dir}/{calc_tag}-unitcell.pkl')
+    input_atoms = loadAtoms(f'{base_dir}/{calc_tag}-unitcell_relax.extxyz')
+    atoms_dct = {atoms.info['suffix']: atoms for atoms in input_atoms}
+
+    workers = conf.get('workers', 2)
+    max_inflight = conf.get('max_inflight', workers)
+
+    budget = get_budget(config)
+    scheduler = MemoryScheduler(budget)
+
+    desc = 'Pipeline'
+    pending = {}
+    # spawn: workers must not inherit the CUDA context of the producer
+    ctx = mp.get_context('spawn')
+    with ProcessPoolExecutor(max_workers=workers, mp_context=ctx) as pool:
+        items = [(idx, atoms_dct[_dct['suffix']], _dct) for idx, _dct in unit_dct.items()]
+        if config.get('plan', {}).get('order'):
+            from cte2bench.util.plan import order_longest_first
+            items = order_longest_first(config, items)
+
+        for idx, _, _dct in tqdm(items, desc=desc):
+            suffix = _dct['suffix']
+            est, alone = fit_budget(config, _dct, atoms_dct[suffix])
+            while pending and (len(pending) >= max_inflight or alone or not scheduler.fits(est['calc'])):
+                done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                _collect(done, pending, config, scheduler)
+
+            if config['strain']['run']:
+                strain_material(config, calc, atoms_dct[suffix])
+            if config['supercell']['run']:
+                gates = supercell_material(config, calc, idx, _dct)
+                if gates is not None:
+                    append_result(config, idx, 'gates', {'GATES': gates})
+            # FC2 files must be on disk before a worker reads them
+            writer.flush()
+
+            future = pool.submit(postprocess_material, config, idx, _dct)
+            pending[future] = suffix
+            # an oversized material blocks the budget until it is done
+            scheduler.reserve(suffix, budget if (alone and budget) else est['post'])
+            gc.collect()
+
+        while pending:
+            done, _ = wait(pending, return_when=FIRST_COMPLETED)
+            _collect(done, pending, config, scheduler)
+
+    RESULTS = compact_results(config)
+    if config['qha']['run']:
+        from cte2bench.phonon.qha import aggregate_cte
+        aggregate_cte(config, unit_dct)
+    return RESULTS
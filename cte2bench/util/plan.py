@@ -0,0 +1,235 @@
+"""
+Dry-run cost model: lists the work units a config implies and estimates their
+wall time without loading a calculator.
+
+    calculator calls: seconds = atoms x calls x sec_per_atom_call
+    q-points        : seconds = irreducible q-points x bands^3 x sec_per_band3
+
+FC2 calls follow supercell.fc2_mode and supercell.interpolate, strain counts
+strain.adaptive; what depends on the run itself (gates, fallbacks, grid
+growth) is listed in the plan's notes.
+"""
+
+import csv
+import os
+import json
+
+import numpy as np
+import ase.io as ase_IO
+import spglib
+
+from cte2bench.util.io import loadAtoms, dumpJSON, clean_for_json
+from cte2bench.util.memory import estimate_memory, GB
+from cte2bench.util.utils import minimal_supercell
+from cte2bench.util import log
+
+DEFAULT_COEFFS = {'sec_per_atom_call': 2.0e-5, 'relax_steps': 200, 'sec_per_band3': 1.0e-9}
+
+
+def _median(values):
+    return float(np.median(values)) if len(values) else None
+
+
+def _stats_rows(logfile):
+    """(type, steps, wall_i, wall_f, natom) of every row of a csv or jsonl stats log"""
+    with open(logfile, 'r') as f:
+        if logfile.endswith('.jsonl'):
+            for line in f:
+                try:
+                    row = json.loads(line)
+                except json.JSONDecodeError:
+                    continue
+                yield row.get('type'), row.get('steps'), row.get('wall_i'), row.get('wall_f'), row.get('natom')
+            return
+        for row in csv.reader(f):
+            if len(row) < 13 or row[0] == 'ID':
+                continue
+            yield row[6], row[7], row[9], row[10], row[12]
+
+def calibrate_from_log(logfile):
+    """
+    Throughput measured in a previous run, read from the stats log
+    (ID,MP-ID,NAME,TASK,EPSILON,DISP,TYPE,STEPS,FORCE_CONV,WALL_I,WALL_F,...,NATOM,...).
+    """
+    per_atom, steps = [], []
+    for stat, n_steps, wall_i, wall_f, natom in _stats_rows(logfile):
+        try:
+            wall = float(wall_f) - float(wall_i)
+            natom = int(natom)
+        except (TypeError, ValueError):
+            continue
+        if stat == 'oneshot' and wall > 0:
+            per_atom.append(wall / natom)
+        elif stat == 'relax':
+            try:
+                steps.append(int(n_steps))
+            except (TypeError, ValueError):
+                pass
+
+    coeffs = {}
+    if per_atom:
+        coeffs['sec_per_atom_call'] = _median(per_atom)
+    if steps:
+        coeffs['relax_steps'] = _median(steps)
+    return coeffs
+
+
+def get_coeffs(config):
+    conf = config.get('plan', {})
+    coeffs = DEFAULT_COEFFS.copy()
+    coeffs.update({k: conf[k] for k in DEFAULT_COEFFS if conf.get(k)})
+    logfile = config['directory'].get('logfile')
+    if conf.get('calibrate', True) and logfile and os.path.isfile(logfile):
+        measured = calibrate_from_log(logfile)
+        if measured:
+            log.info(f'cost model calibrated from {logfile}: {measured}')
+        coeffs.update(measured)
+    return coeffs
+
+
+def count_ir_qpoints(atoms, mesh):
+    cell = (atoms.get_cell(), atoms.get_scaled_positions(), atoms.get_atomic_numbers())
+    mapping, _ = spglib.get_ir_reciprocal_mesh(mesh, cell, is_shift=[0, 0, 0])
+    return len(np.unique(mapping))
+
+
+def plan_eps(config):
+    """strains relaxed per material; the adaptive grid is counted at its initial points"""
+    adaptive = config['strain'].get('adaptive', {})
+    if adaptive.get('run'):
+        return list(adaptive.get('initial', [-0.02, -0.01, 0.0, 0.01, 0.02]))
+    return list(config['strain']['eps'])
+
+
+def fc2_units(config, eps_list, n_disp):
+    """
+    FC2 supercells evaluated per material: n_random snapshots per strain in
+    random mode (plus the systematic reference at check_eps), and only the
+    anchor and hold-out strains when the FC2 is interpolated
+    """
+    conf = config['supercell']
+    explicit = eps_list
+    interp = conf.get('interpolate', {})
+    if interp.get('run') and not config['strain'].get('adaptive', {}).get('run'):
+        explicit = [eps for eps in eps_list if eps in interp['anchors'] + [interp['holdout']]]
+
+    mode = conf.get('fc2_mode', 'systematic')
+    if mode == 'random':
+        per_strain = conf['n_random'] * (2 if conf.get('random_plusminus') else 1)
+        checks = [eps for eps in explicit if eps in conf.get('check_eps', [])]
+        supercells = per_strain * len(explicit) + n_disp * len(checks)
+    else:
+        supercells = n_disp * len(explicit)
+    return {'mode': mode, 'explicit': len(explicit), 'supercells': supercells}
+
+
+def material_units(config, atoms, _dct):
+    """work units of one material over the strain grid"""
+    eps_list = plan_eps(config)
+    n_eps = len(eps_list)
+    mesh = _dct.get('q_point_mesh', [19, 19, 19])
+    est = estimate_memory(config, _dct, atoms)
+    # counted by symmetry, or the 6 x natoms upper bound without memory.count_displacements
+    n_disp = est['n_disp']
+    return {
+        'natoms': len(atoms),
+        'relax': {'unitcell': 1, 'strain': n_eps},
+        'fc2': dict(fc2_units(config, eps_list, n_disp), natoms=est['n_fc2']),
+        'mesh': {'meshes': n_eps, 'qpoints': count_ir_qpoints(atoms, mesh), 'bands': est['n_bands']},
+        'memory_gb': max(est['calc'], est['post']) / GB,
+    }
+
+
+def plan_notes(config):
+    """what the estimate cannot know before the run"""
+    notes = []
+    adaptive = config['strain'].get('adaptive', {})
+    if adaptive.get('run'):
+        notes.append(f'strain.adaptive: counted at {len(plan_eps(config))} initial strains, '
+                     f'a material may grow to {adaptive.get("max_points", 9)}')
+    if config['supercell'].get('interpolate', {}).get('run') and not adaptive.get('run'):
+        notes.append('supercell.interpolate: counted without fallback, a failed hold-out check '
+                     'computes every strain explicitly')
+    if config['supercell'].get('gates', {}).get('run'):
+        notes.append('supercell.gates: rejected materials and dropped strains are counted in full')
+    if config.get('dedup', {}).get('run'):
+        notes.append('dedup: duplicate structures are counted in full')
+    for stage in ['gruneisen', 'anisotropic', 'fc3']:
+        if config.get(stage, {}).get('run'):
+            notes.append(f'{stage}: not part of the estimate')
+    return notes
+
+
+def ordered_items(config, unit_dct):
+    """
+    (idx, _dct) of the unit-cell pickle, most expensive first with plan.order,
+    in pickle order otherwise
+    """
+    if not config.get('plan', {}).get('order'):
+        return list(unit_dct.items())
+    filename = f'{config["directory"]["cwd"]}/{config["calculator"]["tag"]}-unitcell_relax.extxyz'
+    atoms_dct = {atoms.info['suffix']: atoms for atoms in loadAtoms(filename)}
+    items = [(idx, atoms_dct[_dct['suffix']], _dct) for idx, _dct in unit_dct.items()]
+    return [(idx, _dct) for idx, _, _dct in order_longest_first(config, items)]
+
+
+def material_cost(units, coeffs):
+    """estimated seconds per stage"""
+    natoms = units['natoms']
+    # update_atoms before and after each relaxation
+    relax_calls = coeffs['relax_steps'] + 2
+    cost = {
+        'unitcell': units['relax']['unitcell'] * natoms * relax_calls * coeffs['sec_per_atom_call'],
+        'strain': units['relax']['strain'] * natoms * relax_calls * coeffs['sec_per_atom_call'],
+        'fc2': units['fc2']['supercells'] * units['fc2']['natoms'] * coeffs['sec_per_atom_call'],
+        'mesh': units['mesh']['meshes'] * units['mesh']['qpoints'] * units['mesh']['bands']**3 * coeffs['sec_per_band3'],
+    }
+    cost['total'] = sum(cost.values())
+    return cost
+
+
+def order_longest_first(config, items):
+    """
+    Sort (key, atoms, _dct) items by estimated cost, most expensive first, so
+    parallel or sharded runs do not end on a single straggler.
+    """
+    coeffs = get_coeffs(config)
+    costs = {key: material_cost(material_units(config, atoms, _dct), coeffs)['total'] for key, atoms, _dct in items}
+    return sorted(items, key=lambda item: costs[item[0]], reverse=True)
+
+
+def process_plan(config):
+    calc_tag = config['calculator']['tag']
+    base_dir = config['directory']['cwd']
+    coeffs = get_coeffs(config)
+
+    input_atoms = ase_IO.read(config['directory']['input'], **config['directory']['load_args'])
+
+    PLAN = {'calc': calc_tag, 'coeffs': coeffs, 'materials': {}}
+    for idx, atoms in enumerate(input_atoms):
+        _dct = atoms.info
+        if config['supercell'].get('auto', {}).get('run'):
+            # without the frequency check, the size picked after relaxation
+            _dct['fc2_supercell'] = minimal_supercell(atoms, config['supercell']['auto'].get('min_length', 10.0))
+        suffix = f"ID-{idx}_{_dct['material_id']}_{_dct['name']}_{_dct['symm.no']}"
+        units = material_units(config, atoms, _dct)
+        PLAN['materials'][suffix] = {'units': units, 'cost': material_cost(units, coeffs)}
+
+    order = sorted(PLAN['materials'], key=lambda k: PLAN['materials'][k]['cost']['total'], reverse=True)
+    PLAN['order'] = order
+    stages = ['unitcell', 'strain', 'fc2', 'mesh', 'total']
+    PLAN['total'] = {s: sum(m['cost'][s] for m in PLAN['materials'].values()) for s in stages}
+
+    print(f'{"material":<48}{"natom":>7}{"fc2 sc":>8}{"sc natom":>10}{"q-pts":>8}{"mem[GB]":>9}{"cost[h]":>9}')
+    for suffix in order:
+        m = PLAN['materials'][suffix]
+        u = m['units']
+        print(f'{suffix:<48}{u["natoms"]:>7}{u["fc2"]["supercells"]:>8}{u["fc2"]["natoms"]:>10}'
+              f'{u["mesh"]["qpoints"]:>8}{u["memory_gb"]:>9.2f}{m["cost"]["total"]/3600:>9.2f}')
+    print('total [h]: ' + ', '.join(f'{s}={PLAN["total"][s]/3600:.2f}' for s in stages))
+    PLAN['notes'] = plan_notes(config)
+    for note in PLAN['notes']:
+        print(f'note: {note}')
+
+    dumpJSON(clean_for_json(PLAN), f'{base_dir}/{calc_tag}_plan.json')
+    return PLAN
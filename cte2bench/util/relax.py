@@ -4,7 +4,8 @@ from ase.optimize import LBFGS, FIRE, FIRE2
 import numpy as np
 import time
 from datetime import datetime
-import torch
+
+from cte2bench.util.utils import cuda_synchronize
 
 OPT_DCT = {'fire': FIRE, 'fire2':FIRE2,'lbfgs': LBFGS}
 FILTER_DCT = {'frechet': FrechetCellFilter, 'unitcell': UnitCellFilter}
@@ -25,6 +26,10 @@ class AseAtomRelax:
         fmax=0.000001,
         steps=5000,
         logfile='ase_relaxer.log',
+        log_every=1,
+        pre_calc=None,
+        pre_fmax=1e-2,
+        pre_steps=None,
         time_dct={'oneshot': {
                         'start': {'wall': 0, 'date': 0},
                         'end': {'wall': 0, 'date': 0},
@@ -43,6 +48,10 @@ class AseAtomRelax:
         self.fmax = fmax
         self.steps = steps
         self.logfile = logfile
+        self.log_every = log_every
+        self.pre_calc = pre_calc
+        self.pre_fmax = pre_fmax
+        self.pre_steps = pre_steps
         self.constant_volume = const_vol
         self.time_dct = time_dct
 
@@ -70,6 +79,21 @@ class AseAtomRelax:
         atoms.info['oneshot'] = oneshot_dct
         return atoms
 
+    def _optimize(self, atoms, fmax, steps, logfile):
+        cell_filter = self.cell_filter(atoms, constant_volume = self.constant_volume, mask=self.mask)
+        if self.log_every == 1:
+            optimizer = self.optimizer(cell_filter, logfile=logfile)
+            optimizer.run(fmax=fmax, steps=steps)
+        elif self.log_every and logfile:
+            optimizer = self.optimizer(cell_filter, logfile=None)
+            with open(logfile, 'w') as f:
+                optimizer.attach(log_step, self.log_every, f, optimizer, cell_filter)
+                optimizer.run(fmax=fmax, steps=steps)
+        else:
+            optimizer = self.optimizer(cell_filter, logfile=None)
+            optimizer.run(fmax=fmax, steps=steps)
+        return optimizer.get_number_of_steps()
+
     def relax_atoms(self, atoms):
         start_wall = time.time()
         start_dt = datetime.now()
@@ -78,13 +102,19 @@ class AseAtomRelax:
         if self.fix_symm:
             atoms.set_constraint(FixSymmetry(atoms, symprec=1e-05))
 
-        atoms.calc = self.calc
-        cell_filter = self.cell_filter(atoms, constant_volume = self.constant_volume, mask=self.mask)
-        optimizer = self.optimizer(cell_filter, logfile=self.logfile)
+        if self.pre_calc is not None:
+            # cheap calculator to pre_fmax, the production one only polishes
+            atoms.calc = self.pre_calc
+            pre_logfile = f'{self.logfile}.pre' if self.logfile else None
+            atoms.info['steps.pre'] = self._optimize(atoms, self.pre_fmax, self.pre_steps or self.steps, pre_logfile)
 
-        optimizer.run(fmax=self.fmax, steps=self.steps)
-        torch.cuda.synchronize()
-        atoms.info['steps'] = optimizer.get_number_of_steps()
+        atoms.calc = self.calc
+        steps = self._optimize(atoms, self.fmax, self.steps, self.logfile)
+        cuda_synchronize()
+        # 'steps' counts production-calculator steps only
+        atoms.info['steps'] = steps
+        if self.pre_calc is not None:
+            atoms.info['steps.final'] = steps
 
         end_wall = time.time()
         end_dt = datetime.now()
@@ -110,6 +140,14 @@ def get_relaxer(config, calc, opt_type='unitcell', logfile='ase_relax.log'):
 
     arr_args['calc'] = calc
     arr_args['logfile'] = logfile
+    arr_args['log_every'] = config.get('logging', {}).get('opt_log_every', 0)
+
+    pre = config['calculator'].get('pre', {})
+    if pre.get('run') and opt_type in pre.get('opt_types', ['unitcell', 'strain']):
+        from cte2bench.calculator.loader import load_pre_calc
+        arr_args['pre_calc'] = load_pre_calc(config)
+        arr_args['pre_fmax'] = pre.get('fmax', 1e-2)
+        arr_args['pre_steps'] = pre.get('steps')
 
     if arr_args.get('optimizer', None) is not None:
         arr_args['optimizer'] = opt
@@ -118,6 +156,21 @@ def get_relaxer(config, calc, opt_type='unitcell', logfile='ase_relax.log'):
 
     return AseAtomRelax(**arr_args)
 
+def log_step(f, optimizer, cell_filter):
+    """one subsampled optimizer log line: step, energy, fmax"""
+    fmax = np.sqrt((cell_filter.get_forces()**2).sum(axis=1).max())
+    f.write(f'{optimizer.nsteps:6d} {datetime.now().strftime("%H:%M:%S")} '
+            f'{cell_filter.get_potential_energy():15.6f} {fmax:12.6f}\n')
+    f.flush()
+
+def step_summary(atoms_list):
+    """pre-relaxer and production optimizer steps summed over relaxations; None without a pre stage"""
+    pre = [atoms.info['steps.pre'] for atoms in atoms_list if 'steps.pre' in atoms.info]
+    if not pre:
+        return None
+    final = [atoms.info['steps.final'] for atoms in atoms_list if 'steps.final' in atoms.info]
+    return {'pre': int(sum(pre)), 'final': int(sum(final)), 'n': len(pre)}
+
 def check_atoms_conv(forces: np.ndarray) -> bool:
     conv = True
     for i in range(forces.shape[-1]):
@@ -0,0 +1,81 @@
+"""
+Append-only results store.
+
+Every finished (material, stage) appends one JSON line to
+{calc_tag}_results.jsonl, so a crash loses at most the material in flight and
+each write costs O(1). `compact_results` folds the log into the
+{calc_tag}_results.json layout the stages have always produced:
+
+    {'calc': calc_tag, '<idx>': {...}, ...}
+
+A 'harmonic' record starts a material's entry afresh (it is the stage that
+creates it, and a rerun invalidates the QHA merged into it), keeping only
+KEEP_KEYS; records of other stages are merged into it.
+"""
+
+import os
+import json
+
+from cte2bench.util.io import loadJSON, dumpJSON, clean_for_json
+from cte2bench.util.dedup import load_aliases, fan_out
+
+RESET_STAGES = ('harmonic',)
+# kept across a reset: records of the stages that do not depend on the harmonic one
+# (gates, gruneisen, anisotropic, fc3), whatever order they ran in
+KEEP_KEYS = ('GATES', 'CTE_GRUNEISEN', 'CTE_AXES', 'fc3')
+
+
+def results_log(config):
+    return f'{config["directory"]["cwd"]}/{config["calculator"]["tag"]}_results.jsonl'
+
+
+def results_json(config):
+    return f'{config["directory"]["cwd"]}/{config["calculator"]["tag"]}_results.json'
+
+
+def append_result(config, idx, stage, record):
+    line = json.dumps(clean_for_json({'idx': str(idx), 'stage': stage, 'record': record}), ensure_ascii=False)
+    with open(results_log(config), 'a') as f:
+        f.write(f'{line}\n')
+        f.flush()
+
+
+def _merge(RESULTS, idx, stage, record):
+    if stage in RESET_STAGES or idx not in RESULTS:
+        kept = {k: RESULTS[idx][k] for k in KEEP_KEYS if k in RESULTS.get(idx, {})}
+        RESULTS[idx] = dict(record, **kept)
+    else:
+        RESULTS[idx].update(record)
+
+
+def load_results(config):
+    """current results: the compacted json overlaid with the log"""
+    RESULTS = {'calc': config['calculator']['tag']}
+    if os.path.isfile(results_json(config)):
+        RESULTS.update(loadJSON(results_json(config)))
+
+    if os.path.isfile(results_log(config)):
+        with open(results_log(config), 'r') as f:
+            for line in f:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    # torn last line of a crashed run
+                    continue
+                _merge(RESULTS, entry['idx'], entry['stage'], entry['record'])
+    return RESULTS
+
+
+def compact_results(config):
+    """
+    Write {calc_tag}_results.json from the log and truncate the log; the
+    json is replaced atomically before the log is dropped. Duplicate
+    materials get a copy of their canonical material's entry.
+    """
+    RESULTS = fan_out(load_results(config), load_aliases(config))
+    filename = results_json(config)
+    dumpJSON(clean_for_json(RESULTS), f'{filename}.tmp')
+    os.replace(f'{filename}.tmp', filename)
+    if os.path.isfile(results_log(config)):
+        os.remove(results_log(config))
+    return RESULTS
@@ -8,9 +8,26 @@ from ase import Atoms
 import spglib
 from phonopy.structure.atoms import PhonopyAtoms
 
+from cte2bench.util import log
+
+# torch comes with the MLIP calculators; CPU-only installs (the EMT stand-in) run without it
+def empty_cuda_cache():
+    try:
+        import torch
+    except ImportError:
+        return
+    torch.cuda.empty_cache()
+
+def cuda_synchronize():
+    try:
+        import torch
+    except ImportError:
+        return
+    if torch.cuda.is_available():
+        torch.cuda.synchronize()
+
 def log_stats(config, atoms, task='NaN', stat='oneshot', eps=0, disp='#N/A'):
     atoms.calc = None # Error, property "free_energy" is not available . . .
-    logfile = open(config['directory']['logfile'], 'a')
     lengths = ','.join(str(round(l,5)) for l in atoms.cell.lengths())
     angles = ','.join(str(round(d, 3)) for d in atoms.cell.angles())
     _dct = atoms.info.copy()
@@ -46,19 +63,19 @@ def log_stats(config, atoms, task='NaN', stat='oneshot', eps=0, disp='#N/A'):
                 "beta": atoms.cell.angles()[1],
                 "gamma": atoms.cell.angles()[2],
                 }
-    head = ','.join(k for k in stat_dct.keys())
-    line=','.join(str(v) for v in stat_dct.values())
-    logfile.writelines(f'{line}\n')
-    logfile.close()
-    print('\n')
-    print('----------------------------------------------------------------------------------------------------------------')
-    print(f'[LOG]')
-    print(f'{time_dct["start"].get("date", "date_i")}')
-    print(head)
-    print(line)
-    print(f'{time_dct["end"].get("date", "date_i")}')
-    print('----------------------------------------------------------------------------------------------------------------')
-    print('\n')
+    log.get_sink(config).add(stat_dct)
+    if log.enabled('debug'):
+        head = ','.join(k for k in stat_dct.keys())
+        line = ','.join(str(v) for v in stat_dct.values())
+        print('\n')
+        print('----------------------------------------------------------------------------------------------------------------')
+        print(f'[LOG]')
+        print(f'{time_dct["start"].get("date", "date_i")}')
+        print(head)
+        print(line)
+        print(f'{time_dct["end"].get("date", "date_i")}')
+        print('----------------------------------------------------------------------------------------------------------------')
+        print('\n')
 
 
 def phonoatoms2aseatoms(phonoatoms):
@@ -78,6 +95,36 @@ def aseatoms2phonoatoms(atoms):
     )
     return phonoatoms
 
+def get_mesh_frequencies(unitcell, fc2, supercell_matrix, primitive_matrix='auto', mesh=[8, 8, 8]):
+    """
+    Mesh frequencies (THz) of a PhonopyAtoms unit cell with given force constants.
+
+    Returns
+    -------
+    freqs   : np.ndarray, shape (n_q, n_bands)
+    weights : np.ndarray, shape (n_q,)
+    """
+    from phonopy import Phonopy
+    phonon = Phonopy(unitcell, supercell_matrix=supercell_matrix, primitive_matrix=primitive_matrix)
+    phonon.force_constants = fc2
+    phonon.run_mesh(mesh)
+    mesh_dict = phonon.get_mesh_dict()
+    return mesh_dict['frequencies'], mesh_dict['weights']
+
+def material_eps(config, _dct):
+    """strain grid of one material: its adaptive grid if it has one, else strain.eps"""
+    return list(_dct.get('strain.eps') or config['strain']['eps'])
+
+def minimal_supercell(atoms, min_length):
+    """
+    Smallest diagonal supercell whose perpendicular widths are all at least
+    `min_length` (A), i.e. no periodic image closer than min_length.
+    """
+    cell = np.asarray(atoms.get_cell())
+    volume = abs(np.linalg.det(cell))
+    heights = [volume / np.linalg.norm(np.cross(cell[(i+1)%3], cell[(i+2)%3])) for i in range(3)]
+    return [max(1, int(np.ceil(min_length / h - 1e-8))) for h in heights]
+
 def strain_c_axis(atoms, eps):
     cell = atoms.get_cell()
     cell[2] *= (1+eps)
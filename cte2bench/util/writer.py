@@ -0,0 +1,122 @@
+import atexit
+import queue
+import threading
+
+
+class WriteError(RuntimeError):
+    """a background write failed; raised by the writer, never by a calculation"""
+
+
+class AsyncWriter:
+    """
+    Background writer for file artifacts.
+
+    Stages hand a callable (np.save, ase.io.write, ...) to `submit` and carry on
+    with the next calculation while a single thread drains a bounded queue in
+    FIFO order. The first exception raised by a write is kept and re-raised as
+    WriteError on the next `submit`, `flush` or `close`, so failures are not
+    silently lost; callers that guard a calculation must let WriteError through.
+
+    Parameters
+    ----------
+    maxsize: int
+        queue length; `submit` blocks once this many writes are pending
+    enabled: bool
+        if False, `submit` runs the write synchronously
+    """
+    def __init__(self, maxsize=64, enabled=True):
+        self.enabled = enabled
+        self._error = None
+        self._queue = queue.Queue(maxsize=maxsize)
+        self._thread = None
+        self._closed = False
+        if enabled:
+            self._thread = threading.Thread(target=self._drain, name='cte2bench-writer', daemon=True)
+            self._thread.start()
+
+    def _drain(self):
+        while True:
+            item = self._queue.get()
+            try:
+                if item is None:
+                    return
+                func, args, kwargs = item
+                if self._error is None:
+                    func(*args, **kwargs)
+            except BaseException as exc:
+                self._error = exc
+            finally:
+                self._queue.task_done()
+
+    def _raise(self):
+        if self._error is not None:
+            exc, self._error = self._error, None
+            raise WriteError(f'background write failed: {exc!r}') from exc
+
+    def submit(self, func, *args, **kwargs):
+        self._raise()
+        if not self.enabled or self._closed:
+            func(*args, **kwargs)
+            return
+        self._queue.put((func, args, kwargs))
+
+    def flush(self):
+        if self.enabled and not self._closed:
+            self._queue.join()
+        self._raise()
+
+    def close(self):
+        if self.enabled and not self._closed:
+            self._queue.join()
+            self._queue.put(None)
+            self._thread.join()
+            self._closed = True
+        self._raise()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+_WRITER = None
+
+
+def init_writer(config):
+    """(re-)create the process-wide writer from config['io']"""
+    global _WRITER
+    conf = config.get('io', {})
+    if _WRITER is not None:
+        _WRITER.close()
+    _WRITER = AsyncWriter(maxsize=conf.get('queue_size', 64), enabled=conf.get('async', False))
+    return _WRITER
+
+
+def get_writer():
+    """writer shared by all stages; synchronous unless `init_writer` enabled it"""
+    global _WRITER
+    if _WRITER is None:
+        _WRITER = AsyncWriter(enabled=False)
+    return _WRITER
+
+
+def close_writer():
+    """close and drop the process-wide writer; raises a pending WriteError"""
+    global _WRITER
+    writer, _WRITER = _WRITER, None
+    if writer is not None:
+        writer.close()
+
+
+def _close_at_exit():
+    if _WRITER is not None:
+        _WRITER.close()
+
+
+atexit.register(_close_at_exit)
+
+
+def append_line(filename, line):
+    with open(filename, 'a') as f:
+        f.write(line)
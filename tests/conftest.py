@@ -0,0 +1,78 @@
+"""
+Shared fixtures: the example config pointed at a temporary directory and
+fcc Cu with the EMT stand-in calculator, small enough to run on a CPU.
+"""
+
+import os
+
+import numpy as np
+import pytest
+import yaml
+from ase.build import bulk
+from ase.calculators.emt import EMT
+
+from cte2bench.util.writer import init_writer
+from cte2bench.util import log
+
+EXAMPLE = os.path.join(os.path.dirname(__file__), '..', 'example', 'config.yaml')
+
+
+@pytest.fixture
+def config(tmp_path):
+    with open(EXAMPLE, 'r') as f:
+        config = yaml.load(f, Loader=yaml.FullLoader)
+    config['directory'].update({'cwd': str(tmp_path), 'logfile': str(tmp_path / 'emt_stats.log')})
+    config['calculator'].update({'calc': 'emt', 'tag': 'emt'})
+    config['io'].update({'async': False, 'slim': False})
+    config['logging']['level'] = 'warning'
+    config['memory']['budget'] = None
+    config['harmonic'].update({'run_dos': False, 'run_band': False, 't_max': 805, 't_step': 10})
+    config['qha'].update({'t_max': 805, 'temperatures': [300, 500]})
+    log.init_logging(config)
+    init_writer(config)
+    yield config
+    init_writer({'io': {'async': False}})
+
+
+@pytest.fixture
+def cu():
+    """fcc Cu, relaxed with EMT, with the unit-cell metadata the stages read"""
+    atoms = bulk('Cu', 'fcc', a=3.59)
+    atoms.info.update({'suffix': 'ID-0_mp-30_Cu_225', 'fc3_supercell': [1, 1, 1], 'fc2_supercell': [2, 2, 2],
+                       'primitive_matrix': np.eye(3), 'q_point_mesh': [8, 8, 8], 'symm.no.unit': 225})
+    return atoms
+
+
+def strained_cells(atoms, eps_list):
+    """fcc Cu scaled isotropically; no relaxation needed, every position is fixed by symmetry"""
+    out = []
+    for eps in eps_list:
+        strained = atoms.copy()
+        strained.set_cell(atoms.get_cell() * (1 + eps), scale_atoms=True)
+        strained.info = atoms.info.copy()
+        out.append(strained)
+    return out
+
+
+def phonon_kwargs(atoms):
+    return {'primitive_matrix': atoms.info['primitive_matrix'], 'supercell_matrix': np.diag(atoms.info['fc3_supercell']),
+            'phonon_supercell_matrix': np.diag(atoms.info['fc2_supercell'])}
+
+
+class Killed(Exception):
+    pass
+
+
+class CountingEMT(EMT):
+    """EMT that counts the structures it evaluates and dies after `kill_after` of them"""
+    def __init__(self, kill_after=None):
+        super().__init__()
+        self.kill_after = kill_after
+        self.count = 0
+
+    def calculate(self, atoms=None, properties=['energy'], system_changes=['positions']):
+        if system_changes:
+            if self.count == self.kill_after:
+                raise Killed
+            self.count += 1
+        super().calculate(atoms, properties, system_changes)
@@ -0,0 +1,27 @@
+import numpy as np
+from ase.calculators.emt import EMT
+
+from cte2bench.structure.adaptive import adaptive_material, propose
+
+
+def test_bisects_next_to_the_largest_residual():
+    accepted = [-0.02, -0.01, 0.0, 0.01, 0.03]
+    points = {eps: {'accepted': True} for eps in accepted}
+    volumes = np.array([10.0 * (1 + eps)**3 for eps in accepted])
+    v0 = np.full(5, volumes[2])
+    residual = {-0.02: 1e-5, -0.01: 2e-5, 0.0: 1e-5, 0.01: 5e-3, 0.03: 1e-5}
+    conf = {'step': 0.01, 'residual_tol': 1e-3, 'min_points': 5}
+    # between the worst point and its farther neighbour
+    assert propose(points, v0, residual, volumes, conf) == [(0.02, 'residual')]
+
+    residual[0.01] = 1e-4
+    assert propose(points, v0, residual, volumes, conf) == []
+
+
+def test_grid_stops_at_max_points(config, cu):
+    config['strain']['adaptive'].update({'run': True, 'initial': [-0.02, -0.01, 0.0, 0.02, 0.04], 'mesh': [8, 8, 8],
+                                         'step': 0.002, 'residual_tol': 1e-12, 'tol': 0.0, 'max_points': 7})
+    eps_list, record = adaptive_material(config, EMT(), 0, cu)
+    assert len(eps_list) == record['n_points'] == 7 and not record['converged']
+    assert [len(it['added']) for it in record['iterations']] == [5, 1, 1]
+    assert all(reason == 'residual' for it in record['iterations'][1:] for _, reason in it['added'])
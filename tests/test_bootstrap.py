@@ -0,0 +1,69 @@
+import numpy as np
+import pytest
+from ase import Atoms
+from ase.calculators.emt import EMT
+from phonopy import Phonopy
+from phonopy.api_qha import PhonopyQHA
+
+from cte2bench.phonon.bootstrap import fit_equilibrium_volumes, bootstrap_cte, summarize_cte, EV_TO_KJMOL
+from cte2bench.phonon.thermo import temperature_grid
+from cte2bench.util.utils import aseatoms2phonoatoms
+from conftest import strained_cells
+
+EPS = [-0.02, -0.01, 0.0, 0.01, 0.02, 0.03, 0.04]
+
+
+@pytest.fixture
+def thermal(cu):
+    """volumes, EMT energies and phonopy thermal properties of Cu over EPS"""
+    temperatures = temperature_grid(0, 805, 10)
+    volumes, energies, fe, entropy, cv = [], [], [], [], []
+    for atoms in strained_cells(cu, EPS):
+        atoms.calc = EMT()
+        volumes.append(atoms.get_volume())
+        energies.append(atoms.get_potential_energy())
+        phonon = Phonopy(aseatoms2phonoatoms(atoms), supercell_matrix=np.diag([2, 2, 2]), primitive_matrix=np.eye(3))
+        phonon.generate_displacements(distance=0.03)
+        phonon.forces = [EMT().get_forces(Atoms(sc.symbols, cell=sc.cell, positions=sc.positions, pbc=True))
+                         for sc in phonon.supercells_with_displacements]
+        phonon.produce_force_constants()
+        phonon.run_mesh([8, 8, 8])
+        phonon.run_thermal_properties(t_min=0, t_max=805, t_step=10)
+        props = phonon.get_thermal_properties_dict()
+        fe.append(props['free_energy'])
+        entropy.append(props['entropy'])
+        cv.append(props['heat_capacity'])
+    return (np.array(volumes), np.array(energies), temperatures,
+            np.array(fe).T, np.array(entropy).T, np.array(cv).T)
+
+
+def test_unit_weights_reproduce_phonopy_qha(thermal):
+    volumes, energies, temperatures, fe, entropy, cv = thermal
+    qha = PhonopyQHA(volumes=volumes, electronic_energies=energies, temperatures=temperatures, free_energy=fe,
+                     cv=cv, entropy=entropy, eos='birch_murnaghan', t_max=800)
+    v_ref = np.asarray(qha.volume_temperature)
+    alpha_ref = np.asarray(qha.thermal_expansion)
+
+    free_energies = fe / EV_TO_KJMOL + energies[None, :]
+    v0 = fit_equilibrium_volumes(volumes, free_energies, np.ones((1, len(volumes))))[0]
+    alpha = np.gradient(np.log(v0), temperatures)
+
+    n = len(v_ref)
+    assert np.allclose(v0[:n], v_ref, rtol=1e-6)
+    # phonopy differences V, not log V: equal to O(dT^2) away from the grid ends
+    for t in [300, 500]:
+        i = int(np.flatnonzero(temperatures == t)[0])
+        assert np.isclose(alpha[i], alpha_ref[i], rtol=1e-3)
+
+
+def test_interval_narrows_with_the_noise(thermal):
+    volumes, energies, temperatures, fe, _, _ = thermal
+    conf = {'n_samples': 200, 'mode': 'resample', 'min_points': 5, 'seed': 0}
+    rng = np.random.default_rng(1)
+    widths = []
+    for sigma in [1e-3, 1e-4, 1e-5]:
+        noisy = energies + rng.normal(0.0, sigma, size=len(energies))
+        t, alpha = bootstrap_cte(volumes, noisy, fe, temperatures, conf)
+        summary = summarize_cte(t, alpha, [300])
+        widths.append(summary['HIGH'][300] - summary['LOW'][300])
+    assert widths[0] > widths[1] > widths[2] > 0
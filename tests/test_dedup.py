@@ -0,0 +1,51 @@
+import os
+
+import ase.io
+from ase.build import bulk
+from ase.calculators.emt import EMT
+
+from cte2bench.structure.unitcell import process_unitcell
+from cte2bench.util.dedup import structure_hash, find_aliases, save_aliases, load_aliases
+from cte2bench.util.io import loadMeta, loadJSON
+from cte2bench.util.results import append_result, compact_results, results_json
+
+
+def _settings():
+    """Cu as the primitive cell and as the conventional cubic cell, and Al on the same sites"""
+    primitive = bulk('Cu', 'fcc', a=3.59)
+    conventional = bulk('Cu', 'fcc', a=3.59, cubic=True)
+    conventional.rotate(30, 'z', rotate_cell=True)
+    return [primitive, conventional, bulk('Al', 'fcc', a=4.04)]
+
+
+def test_hash_ignores_the_cell_setting():
+    primitive, conventional, _ = _settings()
+    assert structure_hash(primitive) == structure_hash(conventional)
+    assert find_aliases(_settings(), {'scale': True}) == {1: 0}
+
+
+def test_equivalent_inputs_are_relaxed_once(config, tmp_path):
+    atoms_list = _settings()
+    for atoms, (mp_id, name) in zip(atoms_list, [('mp-30', 'Cu'), ('mp-30', 'Cu'), ('mp-134', 'Al')]):
+        atoms.info.update({'material_id': mp_id, 'name': name, 'symm.no': 225,
+                           'fc2_supercell': [2, 2, 2], 'fc3_supercell': [1, 1, 1], 'q_point_mesh': [8, 8, 8]})
+    config['directory']['input'] = str(tmp_path / 'input.extxyz')
+    ase.io.write(config['directory']['input'], atoms_list, format='extxyz')
+    config['dedup'] = dict(config['dedup'], run=True)
+
+    process_unitcell(config, EMT())
+    assert sorted(loadMeta(f'{tmp_path}/emt-unitcell.pkl')) == [0, 2]
+    assert not os.path.isdir(tmp_path / 'ID-1_mp-30_Cu_225')
+    assert load_aliases(config) == {'1': {'alias_of': 0, 'suffix': 'ID-1_mp-30_Cu_225'}}
+
+
+def test_compaction_copies_results_to_the_alias(config):
+    save_aliases(config, {1: {'alias_of': 0, 'suffix': 'ID-1_mp-30_Cu_225'}})
+    append_result(config, 0, 'harmonic', {'ID': 'ID-0', 'mp-id': 'mp-30', 'name': 'Cu', 'symm.no': '225'})
+    append_result(config, 0, 'qha', {'CTE': {'CALC': {300: 5e-5}}})
+
+    RESULTS = compact_results(config)
+    assert loadJSON(results_json(config)) == RESULTS
+    alias = RESULTS['1']
+    assert alias['ALIAS_OF'] == '0' and alias['ID'] == 'ID-1'
+    assert alias['CTE'] == RESULTS['0']['CTE'] and 'ALIAS_OF' not in RESULTS['0']
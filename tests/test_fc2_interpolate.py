@@ -0,0 +1,33 @@
+import os
+
+from ase.calculators.emt import EMT
+
+from cte2bench.structure.supercell import interpolate_material
+from conftest import strained_cells, phonon_kwargs
+
+EPS = [-0.02, -0.01, 0.0, 0.01, 0.02, 0.03, 0.04]
+
+
+def _interpolate(config, cu, tol):
+    config['supercell']['interpolate'].update({'run': True, 'anchors': [-0.02, 0.01, 0.04], 'holdout': 0.0,
+                                               'order': 2, 'tol': tol})
+    cwd = config['directory']['cwd']
+    strain_opt = strained_cells(cu, EPS)
+    record = interpolate_material(config, EMT(), cwd, strain_opt, EPS, EPS, phonon_kwargs(cu), cu.info['suffix'],
+                                  'systematic', None, {})
+    return cwd, record
+
+
+def test_interpolated_fc2_within_holdout_tolerance(config, cu):
+    cwd, record = _interpolate(config, cu, tol=0.05)
+    assert record['max_freq_diff'] < 0.05
+    assert not record['fallback']
+    assert sorted(record['interpolated']) == [-0.01, 0.02, 0.03]
+    for eps in EPS:
+        assert os.path.isfile(f'{cwd}/FORCE_CONSTANTS_2ND_e{eps}')
+
+
+def test_interpolation_falls_back_above_tolerance(config, cu):
+    cwd, record = _interpolate(config, cu, tol=1e-12)
+    assert record['fallback'] and not record['interpolated']
+    assert not os.path.isfile(f'{cwd}/FORCE_CONSTANTS_2ND_e-0.01')
@@ -0,0 +1,27 @@
+import pytest
+
+pytest.importorskip('symfc')
+
+from ase.calculators.emt import EMT
+
+from cte2bench.structure.supercell import fc2_strain, get_fc2_mode
+from conftest import strained_cells, phonon_kwargs
+
+
+def test_random_fc2_matches_systematic(config, cu):
+    config['supercell'].update({'fc2_mode': 'random', 'n_random': 4, 'fc_calculator': 'symfc',
+                                'check_eps': [0.0], 'check_mesh': [8, 8, 8]})
+    mode, fc_calculator = get_fc2_mode(config)
+    assert (mode, fc_calculator) == ('random', 'symfc')
+
+    check_dct = {}
+    atoms = strained_cells(cu, [0.0])[0]
+    fc2 = fc2_strain(config, EMT(), config['directory']['cwd'], 0.0, atoms, phonon_kwargs(cu), cu.info['suffix'],
+                     mode, fc_calculator, check_dct)
+    assert fc2 is not None
+
+    check = check_dct['e0.0']
+    assert check['n_random'] == 4
+    # fcc Cu needs a single +- pair systematically; random snapshots fit the same FC2
+    assert check['max_freq_diff'] < 0.05
+    assert check['fc2_rel_diff'] < 0.05
@@ -0,0 +1,74 @@
+import os
+
+import numpy as np
+import pytest
+from ase import Atoms
+from ase.calculators.emt import EMT
+
+from cte2bench.structure.supercell import generate_fc2, calculate_fc2
+from cte2bench.util.utils import aseatoms2phonoatoms
+from conftest import CountingEMT, Killed
+
+N_DISP = 6
+
+
+@pytest.fixture
+def cu3au():
+    """L1_2 Cu3Au: two inequivalent sites, six displacements in the conventional cell"""
+    return Atoms('AuCu3', scaled_positions=[(0, 0, 0), (0, .5, .5), (.5, 0, .5), (.5, .5, 0)],
+                 cell=np.eye(3) * 3.75, pbc=True)
+
+
+def _fc2(config, cwd, atoms, calc):
+    kwargs = {'primitive_matrix': np.eye(3), 'supercell_matrix': np.eye(3), 'phonon_supercell_matrix': np.eye(3)}
+    ph3 = generate_fc2(config, aseatoms2phonoatoms(atoms), kwargs)
+    assert len(ph3.phonon_supercells_with_displacements) == N_DISP
+    return calculate_fc2(config, cwd, 0.0, ph3, calc).fc2
+
+
+def _killed_run(config, cwd, atoms, kill_after):
+    with pytest.raises(Killed):
+        _fc2(config, cwd, atoms, CountingEMT(kill_after=kill_after))
+    return sorted(f for f in os.listdir(f'{cwd}/e0.0') if f.endswith('.npy'))
+
+
+def test_resume_computes_only_missing_forces(config, cu3au, tmp_path):
+    config['supercell']['cont'] = True
+    reference = _fc2(config, str(tmp_path / 'reference'), cu3au, EMT())
+
+    cwd = str(tmp_path / 'killed')
+    assert _killed_run(config, cwd, cu3au, kill_after=2) == ['force-00001.npy', 'force-00002.npy']
+
+    calc = CountingEMT()
+    fc2 = _fc2(config, cwd, cu3au, calc)
+    assert calc.count == N_DISP - 2
+    assert np.allclose(fc2, reference, atol=1e-10)
+
+
+def test_changed_displacements_recompute_everything(config, cu3au, tmp_path):
+    config['supercell']['cont'] = True
+    cwd = str(tmp_path / 'killed')
+    _killed_run(config, cwd, cu3au, kill_after=3)
+
+    config['supercell']['distance'] = 0.01
+    calc = CountingEMT()
+    fc2 = _fc2(config, cwd, cu3au, calc)
+    assert calc.count == N_DISP
+    assert np.allclose(fc2, _fc2(config, str(tmp_path / 'reference'), cu3au, EMT()), atol=1e-10)
+
+
+def test_torn_force_files_are_recomputed(config, cu3au, tmp_path):
+    config['supercell']['cont'] = True
+    cwd = str(tmp_path / 'killed')
+    _killed_run(config, cwd, cu3au, kill_after=3)
+
+    # a job killed inside _save_force leaves only the tmp file; a torn .npy must not load either
+    with open(f'{cwd}/e0.0/force-00004.npy.tmp', 'wb') as f:
+        f.write(b'\x93NUMPY')
+    with open(f'{cwd}/e0.0/force-00003.npy', 'r+b') as f:
+        f.truncate(64)
+
+    calc = CountingEMT()
+    fc2 = _fc2(config, cwd, cu3au, calc)
+    assert calc.count == N_DISP - 2
+    assert np.allclose(fc2, _fc2(config, str(tmp_path / 'reference'), cu3au, EMT()), atol=1e-10)
@@ -0,0 +1,85 @@
+import os
+
+import numpy as np
+import pytest
+from ase.calculators.emt import EMT
+from phono3py.file_IO import read_fc3_from_hdf5
+
+from cte2bench.structure.fc3 import fc3_strain
+from conftest import CountingEMT, Killed
+
+# Cu in a 2x2x2 supercell: 15 displacement pairs, 13 within 2.6 A
+N_PAIRS, N_CUT = 15, 13
+
+
+@pytest.fixture
+def fc3_config(config):
+    config['fc3'].update({'cont': True, 'cutoff_pair_distance': 2.6, 'batch_size': 4, 'shard': 0, 'n_shards': 1})
+    return config
+
+
+def _kwargs():
+    return {'primitive_matrix': np.eye(3), 'supercell_matrix': np.diag([2, 2, 2]),
+            'phonon_supercell_matrix': np.diag([2, 2, 2])}
+
+
+def _run(config, cwd, cu, calc):
+    return fc3_strain(config, calc, str(cwd), 0.0, cu, _kwargs(), cu.info['suffix'])
+
+
+def _fc3(cwd):
+    return read_fc3_from_hdf5(filename=f'{cwd}/fc3_e0.0.hdf5')
+
+
+@pytest.fixture
+def reference(fc3_config, cu, tmp_path):
+    cwd = tmp_path / 'reference'
+    record = _run(fc3_config, cwd, cu, EMT())
+    assert record == {'cutoff_pair_distance': 2.6, 'n_pairs': N_PAIRS, 'n_computed': N_CUT,
+                      'n_saved': N_PAIRS - N_CUT, 'n_missing': 0}
+    assert not os.path.isfile(f'{cwd}/fc3_e0.0.hdf5.tmp')
+    return _fc3(cwd)
+
+
+def test_cutoff_prunes_pairs(fc3_config, cu, tmp_path, reference):
+    calc = CountingEMT()
+    _run(fc3_config, tmp_path / 'counted', cu, calc)
+    assert calc.count == N_CUT
+
+
+def test_shards_complete_one_fc3(fc3_config, cu, tmp_path, reference):
+    cwd = tmp_path / 'sharded'
+    fc3_config['fc3']['n_shards'] = 2
+    first = _run(fc3_config, cwd, cu, EMT())
+    assert first['n_missing'] == N_CUT // 2 and not os.path.isfile(f'{cwd}/fc3_e0.0.hdf5')
+
+    fc3_config['fc3']['shard'] = 1
+    calc = CountingEMT()
+    second = _run(fc3_config, cwd, cu, calc)
+    assert calc.count == N_CUT // 2 and second['n_missing'] == 0
+    assert np.allclose(_fc3(cwd), reference, atol=1e-10)
+
+
+def test_killed_shard_resumes(fc3_config, cu, tmp_path, reference):
+    cwd = tmp_path / 'killed'
+    with pytest.raises(Killed):
+        _run(fc3_config, cwd, cu, CountingEMT(kill_after=6))
+
+    calc = CountingEMT()
+    assert _run(fc3_config, cwd, cu, calc)['n_missing'] == 0
+    assert calc.count == N_CUT - 6
+    assert np.allclose(_fc3(cwd), reference, atol=1e-10)
+
+
+def test_torn_fc3_write_is_not_finished(fc3_config, cu, tmp_path, reference):
+    cwd = tmp_path / 'torn'
+    _run(fc3_config, cwd, cu, EMT())
+    # a job killed inside the hdf5 write leaves only the tmp file behind
+    os.replace(f'{cwd}/fc3_e0.0.hdf5', f'{cwd}/fc3_e0.0.hdf5.tmp')
+    with open(f'{cwd}/fc3_e0.0.hdf5.tmp', 'r+b') as f:
+        f.truncate(256)
+
+    calc = CountingEMT()
+    assert _run(fc3_config, cwd, cu, calc)['n_missing'] == 0
+    assert calc.count == 0
+    assert np.allclose(_fc3(cwd), reference, atol=1e-10)
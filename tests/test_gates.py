@@ -0,0 +1,45 @@
+import os
+from collections import Counter
+
+from ase.calculators.emt import EMT
+
+from cte2bench.structure import supercell
+from cte2bench.util.io import dumpAtoms, dumpMeta
+from conftest import strained_cells
+
+EPS = [-0.02, -0.01, 0.0, 0.01, 0.02, 0.03, 0.04]
+
+
+def _strains(config, cu):
+    calc_tag, suffix = config['calculator']['tag'], cu.info['suffix']
+    strain_dir = f'{config["directory"]["cwd"]}/{suffix}/{config["strain"]["save"]}'
+    os.makedirs(strain_dir)
+    strain_opt = strained_cells(cu, EPS)
+    for atoms in strain_opt:
+        atoms.calc = EMT()
+        atoms.info['e_fr_energy'] = atoms.get_potential_energy()
+        atoms.calc = None
+    dumpAtoms(strain_opt, f'{strain_dir}/{calc_tag}-strain_relax-{suffix}.extxyz')
+    dumpMeta({f'e{eps}': {'eps': eps} for eps in EPS}, f'{strain_dir}/{calc_tag}-strain_dct-{suffix}.pkl')
+
+
+def test_gated_fc2_reused(config, cu, monkeypatch):
+    config['strain']['eps'] = EPS
+    config['supercell'].update({'cont': False})
+    config['supercell']['gates'].update({'run': True, 'eos': False})
+    config['supercell']['interpolate'].update({'run': True, 'anchors': [-0.02, 0.01, 0.04], 'holdout': 0.0,
+                                               'order': 2, 'tol': 0.05})
+    _strains(config, cu)
+
+    calls = Counter()
+    calculate_fc2 = supercell.calculate_fc2
+
+    def _counted(config, cwd, eps, *args, **kwargs):
+        calls[eps] += 1
+        return calculate_fc2(config, cwd, eps, *args, **kwargs)
+
+    monkeypatch.setattr(supercell, 'calculate_fc2', _counted)
+    gates = supercell.supercell_material(config, EMT(), 0, cu.info)
+    assert gates['passed']
+    # e0.0 is the gate's FC2 and the hold-out; the rest is interpolated
+    assert calls == {-0.02: 1, 0.0: 1, 0.01: 1, 0.04: 1}
@@ -0,0 +1,120 @@
+"""
+Graph reuse against full rebuilds, with sevenn's graph builder faked by a
+module whose `_graph_build_f` is the same ase neighbour list, and against the
+real builder when sevenn is installed.
+"""
+
+import sys
+import types
+
+import numpy as np
+import pytest
+from ase.build import bulk
+from ase.calculators.calculator import Calculator, all_changes
+
+from cte2bench.calculator.graph import GraphReuseCalculator, NeighborCache, build_graph, graph_reuse, same_graph
+
+CUTOFF = 5.0
+
+
+class GraphCalculator(Calculator):
+    """stands in for SevenNet: builds its graph through sevenn.train.dataload"""
+    implemented_properties = ['energy']
+
+    def calculate(self, atoms=None, properties=None, system_changes=all_changes):
+        super().calculate(atoms, properties, system_changes)
+        import sevenn.train.dataload as dataload
+        self.graph = dataload._graph_build_f(CUTOFF, self.atoms.pbc, np.array(self.atoms.cell), self.atoms.positions)
+        self.results = {'energy': float(np.exp(-np.linalg.norm(self.graph[2], axis=1)).sum())}
+
+
+def _fake_sevenn(monkeypatch, builder=build_graph, version='0.13.0'):
+    dataload = types.ModuleType('sevenn.train.dataload')
+    if builder is not None:
+        dataload._graph_build_f = builder
+    train = types.ModuleType('sevenn.train')
+    train.dataload = dataload
+    sevenn = types.ModuleType('sevenn')
+    sevenn.__version__ = version
+    monkeypatch.setitem(sys.modules, 'sevenn', sevenn)
+    monkeypatch.setitem(sys.modules, 'sevenn.train', train)
+    monkeypatch.setitem(sys.modules, 'sevenn.train.dataload', dataload)
+    return dataload
+
+
+def _displaced(distance=0.02, n=6):
+    reference = bulk('Cu', 'fcc', a=3.59, cubic=True).repeat(2)
+    rng = np.random.default_rng(0)
+    out = []
+    for i in range(n):
+        atoms = reference.copy()
+        atoms.positions[i] += distance * rng.normal(size=3) / np.sqrt(3)
+        out.append(atoms)
+    return out
+
+
+def test_cached_graphs_match_full_rebuilds():
+    cache = NeighborCache(skin=0.1)
+    for atoms in _displaced():
+        args = (CUTOFF, atoms.pbc, np.array(atoms.cell), atoms.positions)
+        assert same_graph(cache(*args), build_graph(*args))
+    assert cache.n_build == 1 and cache.n_reuse == 5
+
+
+def test_displacement_beyond_skin_rebuilds():
+    cache = NeighborCache(skin=0.1)
+    for atoms in _displaced(distance=0.2, n=3):
+        args = (CUTOFF, atoms.pbc, np.array(atoms.cell), atoms.positions)
+        assert same_graph(cache(*args), build_graph(*args))
+    assert cache.n_build == 3
+
+
+def test_wrapper_energies_match_rebuild(monkeypatch):
+    _fake_sevenn(monkeypatch)
+    inner = GraphCalculator()
+    calc = GraphReuseCalculator(inner, skin=0.1, check=6)
+    for atoms in _displaced():
+        with graph_reuse(calc):
+            atoms.calc = calc
+            energy = atoms.get_potential_energy()
+        assert same_graph(inner.graph, build_graph(CUTOFF, atoms.pbc, np.array(atoms.cell), atoms.positions))
+        reference = atoms.copy()
+        reference.calc = GraphCalculator()
+        assert energy == pytest.approx(reference.get_potential_energy(), abs=1e-10)
+    assert not calc.broken and calc.cache.n_reuse == 5
+
+
+def test_mismatch_with_sevenn_builder_disables_reuse(monkeypatch):
+    # a builder with a shorter cutoff (drops the 4.4 A shell): the cached graph no longer matches it
+    _fake_sevenn(monkeypatch, builder=lambda cutoff, pbc, cell, pos: build_graph(cutoff - 1.0, pbc, cell, pos))
+    calc = GraphReuseCalculator(GraphCalculator(), skin=0.1, check=1)
+    atoms = _displaced(n=1)[0]
+    with graph_reuse(calc):
+        atoms.calc = calc
+        atoms.get_potential_energy()
+    assert calc.broken
+
+
+def test_missing_builder_fails_clearly(monkeypatch):
+    _fake_sevenn(monkeypatch, builder=None)
+    with pytest.raises(AssertionError, match='_graph_build_f'):
+        GraphReuseCalculator(GraphCalculator())
+
+
+def test_old_sevenn_fails_clearly(monkeypatch):
+    _fake_sevenn(monkeypatch, version='0.10.1')
+    with pytest.raises(AssertionError, match='sevenn >= 0.10.2'):
+        GraphReuseCalculator(GraphCalculator())
+
+
+def test_cache_matches_the_sevenn_builder():
+    pytest.importorskip('sevenn')
+    from cte2bench.calculator.graph import sevenn_dataload
+    builder = sevenn_dataload()._graph_build_f
+    calc = GraphReuseCalculator(GraphCalculator(), skin=0.1)
+    for atoms in _displaced():
+        args = (CUTOFF, atoms.pbc, np.array(atoms.cell), atoms.positions)
+        reference = builder(CUTOFF, np.array(atoms.pbc), np.array(atoms.cell), atoms.positions.copy())
+        assert same_graph(calc.cache(*args), reference)
+        assert same_graph(build_graph(*args), reference)
+    assert calc.cache.n_reuse == 5
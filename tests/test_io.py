@@ -0,0 +1,86 @@
+import os
+
+import ase.io
+import numpy as np
+from ase.build import bulk
+
+from cte2bench.util.io import dumpAtoms, loadAtoms, dumpMeta, loadMeta, dumpPKL, loadPKL, side_file
+
+
+def _info():
+    return {'e_fr_energy': -0.007, 'eps': 0.01, 'symm.no.strain': 225, 'steps': 12,
+            'force': np.arange(12, dtype=float).reshape(4, 3), 'stress': np.linspace(-1.0, 1.0, 6),
+            'oneshot': {'start': {'wall': 1.5, 'date': '2026-10-19 12:00:00'},
+                        'end': {'wall': 2.5, 'date': '2026-10-19 12:00:01'}}}
+
+
+def _atoms():
+    atoms = bulk('Cu', 'fcc', a=3.59, cubic=True)
+    atoms.info.update(_info())
+    return atoms
+
+
+def _assert_info(info):
+    expected = _info()
+    assert np.array_equal(info['force'], expected['force'])
+    assert np.allclose(info['stress'], expected['stress'])
+    assert info['oneshot'] == expected['oneshot']
+    for key in ['e_fr_energy', 'eps', 'symm.no.strain', 'steps']:
+        assert info[key] == expected[key]
+
+
+def test_slim_atoms_round_trip(tmp_path):
+    filename = str(tmp_path / 'strain_relax.extxyz')
+    dumpAtoms([_atoms(), _atoms()], filename, slim=True)
+
+    # arrays only in the side store, timings flattened in the extxyz header
+    with np.load(side_file(filename)) as arrays:
+        assert sorted(arrays.files) == ['0/force', '0/stress', '1/force', '1/stress']
+    raw = ase.io.read(filename, index=0)
+    assert 'force' not in raw.info and 'oneshot' not in raw.info
+    assert raw.info['oneshot__start__wall'] == 1.5
+
+    loaded = loadAtoms(filename)
+    assert len(loaded) == 2
+    for atoms in loaded:
+        _assert_info(atoms.info)
+    _assert_info(loadAtoms(filename, index=1).info)
+
+
+def test_slim_meta_round_trip(tmp_path):
+    filename = str(tmp_path / 'strain_dct.pkl')
+    dumpMeta({'e0.0': _info(), 'e0.01': _info()}, filename, slim=True)
+
+    raw = loadPKL(filename)
+    assert 'force' not in raw['e0.0'] and raw['e0.0']['oneshot__end__date'] == '2026-10-19 12:00:01'
+    with np.load(side_file(filename)) as arrays:
+        assert sorted(arrays.files) == ['e0.0/force', 'e0.0/stress', 'e0.01/force', 'e0.01/stress']
+
+    loaded = loadMeta(filename)
+    assert sorted(loaded) == ['e0.0', 'e0.01']
+    for info in loaded.values():
+        _assert_info(info)
+
+
+def test_files_written_before_the_slim_schema(tmp_path):
+    # what the stages wrote before: plain extxyz and pickles, no side store
+    extxyz, pkl = str(tmp_path / 'unitcell_relax.extxyz'), str(tmp_path / 'unitcell.pkl')
+    ase.io.write(extxyz, [_atoms()], format='extxyz')
+    dumpPKL({0: _info()}, pkl)
+    assert not os.path.isfile(side_file(extxyz)) and not os.path.isfile(side_file(pkl))
+
+    atoms = loadAtoms(extxyz)[0]
+    # ase reads a 'stress' info key back as a calculator result, as it always did
+    atoms.info['stress'] = atoms.calc.results['stress']
+    _assert_info(atoms.info)
+    _assert_info(loadMeta(pkl)[0])
+
+
+def test_plain_dump_drops_a_stale_side_store(tmp_path):
+    filename = str(tmp_path / 'strain_relax.extxyz')
+    dumpAtoms([_atoms()], filename, slim=True)
+    atoms = _atoms()
+    atoms.info['force'] = -atoms.info['force']
+    dumpAtoms([atoms], filename)
+    assert not os.path.isfile(side_file(filename))
+    assert np.array_equal(loadAtoms(filename)[0].info['force'], -_info()['force'])
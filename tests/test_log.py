@@ -0,0 +1,34 @@
+import csv
+
+from cte2bench.calculator.pool import CalcPool
+from cte2bench.util import log
+
+
+def _add_row(calc, config, i):
+    log.get_sink(config).add({'ID': f'ID-{i}', 'task': 'test'})
+    return i
+
+
+def _rows(config):
+    with open(config['directory']['logfile'], 'r') as f:
+        return list(csv.reader(f))
+
+
+def test_header_written_once(config):
+    log.init_logging(config)
+    log.init_logging(config)
+    assert _rows(config) == [log.STATS_HEADER.split(',')]
+
+
+def test_worker_stats_reach_the_log_once(config):
+    config['calculator']['pool'] = {'workers': 2, 'threads': 1, 'affinity': False}
+    pool = CalcPool(config)
+    try:
+        # fewer rows than logging.stats_batch: all of them wait for the workers' exit flush
+        assert pool.map(_add_row, [(config, i) for i in range(6)]) == list(range(6))
+    finally:
+        pool.close()
+    log.flush_stats()
+    rows = _rows(config)
+    assert rows[0] == log.STATS_HEADER.split(',')
+    assert sorted(row[0] for row in rows[1:]) == [f'ID-{i}' for i in range(6)]
@@ -0,0 +1,61 @@
+import numpy as np
+
+from cte2bench.util.memory import estimate_memory, fit_budget, MemoryScheduler, GB
+
+
+def _dct(cu):
+    # a dense mesh makes the eigenvectors dominate the post-processing estimate
+    return dict(cu.info, q_point_mesh=[40, 40, 40])
+
+
+def test_lean_mesh_when_the_full_mesh_is_over_budget(config, cu):
+    full = estimate_memory(config, _dct(cu), cu)
+    lean = estimate_memory(config, _dct(cu), cu, lean=True)
+    assert lean['post'] < full['post'] and lean['calc'] == full['calc']
+    budget = max(lean['post'], full['calc']) * 1.1
+    assert budget < full['post']
+
+    config['memory']['budget'] = budget / GB
+    _dct_cu = _dct(cu)
+    est, alone = fit_budget(config, _dct_cu, cu)
+    assert _dct_cu['lean_mesh'] and est['lean'] and est['post'] == lean['post']
+    assert not alone
+
+
+def test_oversized_material_runs_alone(config, cu):
+    full = estimate_memory(config, _dct(cu), cu)
+    config['memory']['budget'] = full['calc'] / 2 / GB
+    _dct_cu = _dct(cu)
+    _, alone = fit_budget(config, _dct_cu, cu)
+    assert alone and _dct_cu['lean_mesh']
+
+    config['memory']['budget'] = None
+    assert fit_budget(config, _dct(cu), cu) == (full, False)
+
+
+def test_scheduler_never_overcommits():
+    budget = 10 * GB
+    scheduler = MemoryScheduler(budget)
+    rng = np.random.default_rng(0)
+    inflight, n_alone, peak = [], 0, 0
+    for i, size in enumerate(rng.uniform(0.5, 14, size=200) * GB):
+        alone = size > budget
+        # the admission loop of the pipeline: retire the oldest until the new work fits
+        while inflight and (alone or not scheduler.fits(size)):
+            scheduler.release(inflight.pop(0))
+        scheduler.reserve(i, budget if alone else size)
+        inflight.append(i)
+        if alone:
+            assert inflight == [i]
+        assert scheduler.used <= budget
+        n_alone += alone
+        peak = max(peak, len(inflight))
+    assert n_alone > 0 and peak > 1
+
+    # oversized work is admitted on an empty scheduler and blocks the rest until released
+    scheduler = MemoryScheduler(budget)
+    assert scheduler.fits(2 * budget)
+    scheduler.reserve('big', budget)
+    assert not scheduler.fits(1)
+    scheduler.release('big')
+    assert scheduler.fits(budget) and MemoryScheduler(None).fits(100 * GB)
@@ -0,0 +1,54 @@
+"""
+Pipeline against the sequential stages on EMT Cu and Al, both through
+`run` so the stages configured after the pipeline are exercised too.
+"""
+
+import os
+
+import ase.io
+import numpy as np
+import yaml
+from ase.build import bulk
+
+from cte2bench.scripts.main import run
+from cte2bench.util.io import loadJSON
+
+
+def _inputs(filename):
+    atoms_list = []
+    for element, a, mp_id in [('Cu', 3.59, 'mp-30'), ('Al', 4.04, 'mp-134')]:
+        atoms = bulk(element, 'fcc', a=a)
+        atoms.info.update({'material_id': mp_id, 'name': element, 'symm.no': 225,
+                           'fc2_supercell': [2, 2, 2], 'fc3_supercell': [1, 1, 1], 'q_point_mesh': [8, 8, 8]})
+        atoms_list.append(atoms)
+    ase.io.write(filename, atoms_list, format='extxyz')
+
+
+def _run(config, directory, monkeypatch, pipeline):
+    os.makedirs(directory)
+    monkeypatch.chdir(directory)
+    config = dict(config, pipeline=dict(config['pipeline'], run=pipeline, workers=2))
+    config['directory'] = dict(config['directory'], input=str(directory / 'input.extxyz'))
+    config['gruneisen'] = dict(config['gruneisen'], run=True, mesh=[8, 8, 8])
+    config['supercell'] = dict(config['supercell'], gates=dict(config['supercell']['gates'], run=True, eos=False))
+    _inputs(config['directory']['input'])
+    with open(directory / 'config.yaml', 'w') as f:
+        yaml.dump(config, f)
+    run(['--config', str(directory / 'config.yaml'), '--calc', 'emt'])
+    tag = 'EMT_omni_omat24'
+    return loadJSON(f'{directory}/emt/omni/omat24/{tag}_results.json')
+
+
+def test_pipeline_matches_sequential(config, tmp_path, monkeypatch):
+    config['strain']['eps'] = config['qha']['eps'] = [-0.02, -0.01, 0.0, 0.01, 0.02, 0.03]
+    sequential = _run(config, tmp_path / 'sequential', monkeypatch, pipeline=False)
+    pipelined = _run(config, tmp_path / 'pipeline', monkeypatch, pipeline=True)
+
+    for idx in ['0', '1']:
+        for key in ['CALC', 'V', 'B']:
+            for t, value in sequential[idx]['CTE'][key].items():
+                assert value is not None
+                assert np.isclose(pipelined[idx]['CTE'][key][t], value, rtol=1e-6)
+        # stages after the pipeline still run
+        assert 'CTE_GRUNEISEN' in pipelined[idx]
+        assert pipelined[idx]['GATES'] == sequential[idx]['GATES']
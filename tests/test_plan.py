@@ -0,0 +1,30 @@
+from cte2bench.util.plan import material_units, plan_notes
+
+
+def test_fc2_units_follow_the_fc2_modes(config, cu):
+    config['strain']['eps'] = [-0.02, -0.01, 0.0, 0.01, 0.02, 0.03, 0.04]
+    systematic = material_units(config, cu, cu.info)['fc2']
+    n_disp = systematic['supercells'] // 7
+    assert systematic['explicit'] == 7 and n_disp > 0
+
+    config['supercell'].update({'fc2_mode': 'random', 'n_random': 3, 'check_eps': [0.0]})
+    random = material_units(config, cu, cu.info)['fc2']
+    assert random['supercells'] == 3 * 7 + n_disp
+
+    config['supercell']['interpolate'].update({'run': True, 'anchors': [-0.02, 0.01, 0.04], 'holdout': 0.0})
+    interpolated = material_units(config, cu, cu.info)['fc2']
+    assert interpolated['explicit'] == 4 and interpolated['supercells'] == 3 * 4 + n_disp
+
+
+def test_adaptive_grid_counted_at_initial_points(config, cu):
+    config['strain']['adaptive'].update({'run': True, 'initial': [-0.01, 0.0, 0.01], 'max_points': 7})
+    units = material_units(config, cu, cu.info)
+    assert units['relax']['strain'] == 3 and units['fc2']['explicit'] == 3
+    assert any('strain.adaptive' in note for note in plan_notes(config))
+
+
+def test_uncounted_displacements_use_the_upper_bound(config, cu):
+    config['memory']['count_displacements'] = False
+    units = material_units(config, cu, cu.info)
+    # +- x, y, z for every atom of the unit cell, per strain
+    assert units['fc2']['supercells'] == 6 * len(cu) * len(config['strain']['eps'])
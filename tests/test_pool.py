@@ -0,0 +1,43 @@
+"""
+Stages that relax their own strains, run with a calculator pool: the
+relaxations must go through map_calc, not call the pool as a calculator.
+"""
+
+import numpy as np
+from ase.calculators.emt import EMT
+
+from cte2bench.calculator.pool import CalcPool
+from cte2bench.phonon.gruneisen import gruneisen_material, GRUNEISEN_KEY
+from cte2bench.structure.anisotropic import anisotropic_material
+
+
+def test_gruneisen_with_pool(config, cu, tmp_path):
+    config['gruneisen'].update({'mesh': [8, 8, 8]})
+    config['calculator']['pool'] = {'workers': 2, 'threads': 1, 'affinity': False}
+    serial = gruneisen_material(config, EMT(), 0, cu)[GRUNEISEN_KEY]
+
+    config['directory']['cwd'] = str(tmp_path / 'pool')
+    pool = CalcPool(config)
+    try:
+        pooled = gruneisen_material(config, pool, 0, cu)[GRUNEISEN_KEY]
+    finally:
+        pool.close()
+    for key in ['CALC', 'V', 'B']:
+        for t, value in serial[key].items():
+            assert np.isclose(pooled[key][t], value, rtol=1e-6)
+
+
+def test_anisotropic_with_pool(config, cu, tmp_path):
+    config['anisotropic'].update({'mesh': [8, 8, 8]})
+    config['calculator']['pool'] = {'workers': 2, 'threads': 1, 'affinity': False}
+    serial = anisotropic_material(config, EMT(), 0, cu)['CTE_AXES']
+
+    config['directory']['cwd'] = str(tmp_path / 'pool')
+    pool = CalcPool(config)
+    try:
+        pooled = anisotropic_material(config, pool, 0, cu)['CTE_AXES']
+    finally:
+        pool.close()
+    for t, value in serial['VOLUMETRIC'].items():
+        assert value is not None
+        assert np.isclose(pooled['VOLUMETRIC'][t], value, rtol=1e-6)
@@ -0,0 +1,54 @@
+import pytest
+from ase.build import bulk
+from ase.calculators.emt import EMT
+
+from cte2bench.calculator import loader
+from cte2bench.calculator.loader import load_pre_calc
+from cte2bench.util.relax import get_relaxer, step_summary
+from conftest import CountingEMT
+
+PRE_KEY = ('emt', None, None, None)
+
+
+@pytest.fixture
+def pre_config(config, monkeypatch):
+    monkeypatch.setattr(loader, '_PRE_CALC', {})
+    config['calculator']['pre'] = {'run': True, 'calc': 'emt', 'fmax': 5e-2, 'opt_types': ['unitcell']}
+    return config
+
+
+def _relax(config, calc, a, tmp_path):
+    relaxer = get_relaxer(config, calc, opt_type='unitcell', logfile=str(tmp_path / f'relax_{a}.log'))
+    return relaxer.relax_atoms(bulk('Cu', 'fcc', a=a)), relaxer
+
+
+def test_pre_calc_is_loaded_once(pre_config):
+    pre = load_pre_calc(pre_config)
+    assert isinstance(pre, EMT) and load_pre_calc(pre_config) is pre
+    assert get_relaxer(pre_config, EMT(), opt_type='unitcell').pre_calc is pre
+    # strain relaxations are not in opt_types
+    assert get_relaxer(pre_config, EMT(), opt_type='strain').pre_calc is None
+
+    pre_config['calculator']['pre']['run'] = False
+    assert load_pre_calc(pre_config) is None
+
+
+def test_pre_relax_hands_off_to_the_final_calculator(pre_config, tmp_path):
+    direct, _ = _relax(dict(pre_config, calculator=dict(pre_config['calculator'], pre={})), EMT(), 3.50, tmp_path)
+    assert 'steps.pre' not in direct.info and step_summary([direct]) is None
+
+    cheap = loader._PRE_CALC[PRE_KEY] = CountingEMT()
+    final = CountingEMT()
+    relaxed, relaxer = _relax(pre_config, final, 3.50, tmp_path)
+    assert relaxer.pre_calc is cheap and relaxed.calc is final
+    assert relaxed.info['steps.pre'] > 0 and relaxed.info['steps.final'] == relaxed.info['steps']
+    # the final calculator starts from the pre-relaxed cell and only polishes it
+    assert relaxed.info['steps.final'] < direct.info['steps']
+    assert cheap.count >= relaxed.info['steps.pre'] and final.count >= relaxed.info['steps.final']
+    assert relaxed.get_volume() == pytest.approx(direct.get_volume(), rel=1e-4)
+    assert relaxed.info['force_conv']
+
+    other, _ = _relax(pre_config, CountingEMT(), 3.65, tmp_path)
+    assert step_summary([relaxed, other]) == {
+        'pre': relaxed.info['steps.pre'] + other.info['steps.pre'],
+        'final': relaxed.info['steps.final'] + other.info['steps.final'], 'n': 2}
@@ -0,0 +1,19 @@
+from cte2bench.util.results import append_result, compact_results, load_results
+
+
+def test_harmonic_rerun_keeps_independent_stages(config):
+    append_result(config, 0, 'harmonic', {'ID': 'ID-0', 'harmonic': {'e0.0': {'QHA': True}}})
+    append_result(config, 0, 'qha', {'CTE': {'CALC': {300: 5e-5}}})
+    append_result(config, 0, 'gates', {'GATES': {'passed': True}})
+    append_result(config, 0, 'gruneisen', {'CTE_GRUNEISEN': {'APPROXIMATE': True}})
+    append_result(config, 0, 'anisotropic', {'CTE_AXES': {'N_POINTS': 5}})
+    append_result(config, 0, 'fc3', {'fc3': {'e0.0': 'done'}})
+    compact_results(config)
+
+    # a harmonic rerun invalidates the QHA built on it, nothing else
+    append_result(config, 0, 'harmonic', {'ID': 'ID-0', 'harmonic': {'e0.0': {'QHA': False}}})
+    record = load_results(config)['0']
+    assert 'CTE' not in record
+    assert record['harmonic']['e0.0']['QHA'] is False
+    for key in ['GATES', 'CTE_GRUNEISEN', 'CTE_AXES', 'fc3']:
+        assert key in record
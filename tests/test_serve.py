@@ -0,0 +1,31 @@
+import pytest
+
+from cte2bench.scripts import serve
+from cte2bench.util import writer as writer_module
+from cte2bench.util.writer import AsyncWriter, WriteError, close_writer, get_writer
+
+
+def test_calculator_cache_keyed_by_settings(config, monkeypatch):
+    loaded = []
+    monkeypatch.setattr('cte2bench.calculator.loader.load_calc', lambda config: loaded.append(1) or object())
+    monkeypatch.setattr(serve, 'CALCS', {})
+
+    first = serve.get_calc(config)
+    assert serve.get_calc(config) is first
+    for key, value in [('path', '/other/checkpoint'), ('pool', {'workers': 4}), ('graph_reuse', {'run': True})]:
+        changed = dict(config, calculator=dict(config['calculator'], **{key: value}))
+        assert serve.get_calc(changed) is not first
+    assert len(loaded) == 4
+
+
+def test_write_error_stays_with_its_request(monkeypatch):
+    def _fail():
+        raise OSError('disk full')
+
+    writer = AsyncWriter(enabled=True)
+    monkeypatch.setattr(writer_module, '_WRITER', writer)
+    writer.submit(_fail)
+    with pytest.raises(WriteError):
+        close_writer()
+    # the next request starts with a clean writer
+    get_writer().submit(print, 'next request')
@@ -0,0 +1,38 @@
+import numpy as np
+from ase.calculators.emt import EMT
+from phonopy import Phonopy
+
+from cte2bench.phonon.thermo import thermal_properties, temperature_grid, compare_phonopy
+from cte2bench.util.utils import aseatoms2phonoatoms
+from conftest import strained_cells
+
+
+def _phonon(atoms):
+    phonon = Phonopy(aseatoms2phonoatoms(atoms), supercell_matrix=np.diag(atoms.info['fc2_supercell']),
+                     primitive_matrix='auto')
+    phonon.generate_displacements(distance=0.02, is_plusminus=True)
+    forces = []
+    for sc in phonon.supercells_with_displacements:
+        sc_atoms = atoms.__class__(sc.symbols, cell=sc.cell, positions=sc.positions, pbc=True, calculator=EMT())
+        forces.append(sc_atoms.get_forces())
+    phonon.forces = np.array(forces)
+    phonon.produce_force_constants()
+    phonon.run_mesh([8, 8, 8])
+    return phonon
+
+
+def test_numpy_engine_agrees_with_phonopy(cu):
+    temperatures = temperature_grid(0, 1005, 5)
+    phonons = [_phonon(atoms) for atoms in strained_cells(cu, [-0.02, 0.0, 0.02])]
+    freqs = [p.mesh.frequencies for p in phonons]
+    weights = [p.mesh.weights for p in phonons]
+    # a small chunk to run several temperature blocks
+    fe, entropy, cv = thermal_properties(freqs, weights, temperatures, chunk=20_000)
+
+    for j, phonon in enumerate(phonons):
+        phonon.run_thermal_properties(t_min=0, t_max=1005, t_step=5)
+        ref = phonon.get_thermal_properties_dict()
+        assert np.allclose(ref['temperatures'], temperatures)
+        diff = compare_phonopy(ref, fe[:, j], entropy[:, j], cv[:, j])
+        # harmonic_material warns above this
+        assert max(diff.values()) < 1e-6, diff
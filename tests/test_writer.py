@@ -0,0 +1,33 @@
+import pytest
+
+from cte2bench.util.writer import AsyncWriter, WriteError
+
+
+def _fail():
+    raise OSError('disk full')
+
+
+def test_write_error_raised_on_next_submit():
+    writer = AsyncWriter(enabled=True)
+    writer.submit(_fail)
+    writer._queue.join()
+    with pytest.raises(WriteError):
+        writer.submit(print, 'unrelated')
+    writer.close()
+
+
+def test_write_error_escapes_fc2_guard(config, cu, monkeypatch):
+    import numpy as np
+    from ase.calculators.emt import EMT
+    from cte2bench.structure import supercell
+
+    # a write lost before this strain must not be reported as its FC2 failure
+    writer = AsyncWriter(enabled=True)
+    writer.submit(_fail)
+    writer._queue.join()
+    monkeypatch.setattr(supercell, 'get_writer', lambda: writer)
+
+    kwargs = {'primitive_matrix': np.eye(3), 'supercell_matrix': np.eye(3), 'phonon_supercell_matrix': 2 * np.eye(3)}
+    with pytest.raises(WriteError):
+        supercell.fc2_strain(config, EMT(), config['directory']['cwd'], 0.0, cu, kwargs, cu.info['suffix'])
+    writer.close()